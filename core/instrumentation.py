@@ -0,0 +1,278 @@
+"""
+Instrumentación por request: consultas SQL, tiempo de base de datos,
+consultas duplicadas y tiempo total, agregados por vista.
+
+``InstrumentationMiddleware`` envuelve cada request con
+``connection.execute_wrapper`` y acumula los valores en histogramas en
+memoria del proceso (``registry``), que ``core.views.metrics`` expone en
+formato de texto de Prometheus. Cada worker de gunicorn tiene su propio
+registro. Opcionalmente registra en el log los requests que superan los
+umbrales ``INSTRUMENTATION_*_THRESHOLD``.
+
+El middleware es síncrono y asíncrono: bajo ASGI los wrappers se instalan en
+el hilo de ``sync_to_async`` del request, que es donde corre el ORM. En las
+respuestas en streaming (exportación, SSE) también se cuentan las consultas
+hechas al generar el contenido y el request se registra al cerrarse el
+stream, así que su duración incluye toda la transmisión.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Fingerprints duplicados que se conservan por vista
+MAX_FINGERPRINTS = 5
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL sin literales ni listas IN de largo variable, para agrupar consultas iguales"""
+    sql = _IN_LIST.sub('(...)', sql)
+    sql = _LITERALS.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+class Histogram:
+    """Histograma acumulativo con buckets fijos (semántica de Prometheus)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+    def lines(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket{_labels(labels, le=_number(bound))} {count}'
+        yield f'{name}_bucket{_labels(labels, le="+Inf")} {self.count}'
+        yield f'{name}_sum{_labels(labels)} {_number(self.sum)}'
+        yield f'{name}_count{_labels(labels)} {self.count}'
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.db_time = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.duplicates = 0
+        self.responses = Counter()  # (method, status) -> requests
+        self.fingerprints = Counter()  # fingerprint duplicado -> repeticiones
+
+
+class Registry:
+    """Métricas por vista del proceso actual"""
+
+    def __init__(self):
+        self._views = {}
+        self._lock = threading.Lock()
+
+    def record(self, view, method, status, duration, queries, db_time, duplicated):
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            metrics.duration.observe(duration)
+            metrics.db_time.observe(db_time)
+            metrics.queries.observe(queries)
+            metrics.responses[(method, status)] += 1
+            metrics.duplicates += sum(duplicated.values())
+            metrics.fingerprints.update(duplicated)
+            if len(metrics.fingerprints) > MAX_FINGERPRINTS * 4:
+                metrics.fingerprints = Counter(dict(metrics.fingerprints.most_common(MAX_FINGERPRINTS)))
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+    def render(self):
+        """Exposición en formato de texto de Prometheus (0.0.4)"""
+        with self._lock:
+            views = sorted(self._views.items())
+            lines = [
+                '# HELP http_requests_total Requests atendidos por vista, método y status.',
+                '# TYPE http_requests_total counter',
+            ]
+            for view, metrics in views:
+                for (method, status), count in sorted(metrics.responses.items()):
+                    lines.append(f'http_requests_total{_labels({"view": view, "method": method, "status": status})} {count}')
+
+            for name, attribute, help_text in (
+                ('http_request_duration_seconds', 'duration', 'Tiempo total del request.'),
+                ('db_query_duration_seconds', 'db_time', 'Tiempo en SQL por request.'),
+                ('db_queries_per_request', 'queries', 'Consultas SQL por request.'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, metrics in views:
+                    lines.extend(getattr(metrics, attribute).lines(name, {'view': view}))
+
+            lines.append('# HELP db_duplicate_queries_total Consultas repetidas con el mismo fingerprint en un request.')
+            lines.append('# TYPE db_duplicate_queries_total counter')
+            for view, metrics in views:
+                lines.append(f'db_duplicate_queries_total{_labels({"view": view})} {metrics.duplicates}')
+
+            lines.append('# HELP db_duplicate_query_fingerprint_total Fingerprints duplicados más frecuentes por vista.')
+            lines.append('# TYPE db_duplicate_query_fingerprint_total counter')
+            for view, metrics in views:
+                for sql, count in metrics.fingerprints.most_common(MAX_FINGERPRINTS):
+                    labels = _labels({'view': view, 'fingerprint': sql[:200]})
+                    lines.append(f'db_duplicate_query_fingerprint_total{labels} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class QueryRecorder:
+    """``execute_wrapper`` que cuenta consultas, tiempo y fingerprints"""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicated(self):
+        """``{fingerprint: repeticiones extra}`` de las consultas ejecutadas más de una vez"""
+        return {sql: count - 1 for sql, count in self.fingerprints.items() if count > 1}
+
+
+def _start_recording(recorder):
+    """Instala ``recorder`` en las conexiones del hilo actual; cerrar el stack lo quita"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(recorder))
+    return stack
+
+
+class InstrumentationMiddleware:
+    """Mide consultas, tiempo SQL y tiempo total de cada request por vista"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'INSTRUMENTATION_ENABLED', True)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with _start_recording(recorder):
+            response = self.get_response(request)
+        return self._finish(request, response, recorder, start)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        stack = await sync_to_async(_start_recording)(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._finish(request, response, recorder, start)
+
+    def _finish(self, request, response, recorder, start):
+        if not response.streaming:
+            self._record(request, response, recorder, start)
+        elif response.is_async:
+            response.streaming_content = self._astream(response.streaming_content, request, response, recorder, start)
+        else:
+            response.streaming_content = self._stream(response.streaming_content, request, response, recorder, start)
+        return response
+
+    def _stream(self, content, request, response, recorder, start):
+        try:
+            with _start_recording(recorder):
+                yield from content
+        finally:
+            self._record(request, response, recorder, start)
+
+    async def _astream(self, content, request, response, recorder, start):
+        stack = await sync_to_async(_start_recording)(recorder)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            # Se registra antes de volver a esperar: el stream puede estar cancelado
+            self._record(request, response, recorder, start)
+            await sync_to_async(stack.close)()
+
+    def _record(self, request, response, recorder, start):
+        duration = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.route) if match else '<unresolved>'
+        duplicated = recorder.duplicated()
+        registry.record(view, request.method, response.status_code, duration,
+                        recorder.count, recorder.time, duplicated)
+        self._check_thresholds(request, view, duration, recorder, duplicated)
+
+    def _check_thresholds(self, request, view, duration, recorder, duplicated):
+        reasons = []
+        query_limit = getattr(settings, 'INSTRUMENTATION_QUERY_THRESHOLD', None)
+        duration_limit = getattr(settings, 'INSTRUMENTATION_DURATION_THRESHOLD_MS', None)
+        duplicate_limit = getattr(settings, 'INSTRUMENTATION_DUPLICATE_THRESHOLD', None)
+        if query_limit and recorder.count > query_limit:
+            reasons.append(f'{recorder.count} consultas')
+        if duration_limit and duration * 1000 > duration_limit:
+            reasons.append(f'{duration * 1000:.0f} ms')
+        repeated = sum(duplicated.values())
+        if duplicate_limit and repeated > duplicate_limit:
+            top_sql, top_count = max(duplicated.items(), key=lambda item: item[1])
+            reasons.append(f'{repeated} consultas duplicadas (x{top_count + 1}: {top_sql[:200]})')
+        if reasons:
+            logger.warning(
+                f"{request.method} {request.path} [{view}] excede umbrales: {', '.join(reasons)} "
+                f"(SQL {recorder.time * 1000:.0f} ms)"
+            )
@@ -115,6 +115,7 @@ SIMPLE_JWT = {
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.instrumentation.InstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -261,6 +262,94 @@ RENDER_BUILD_HOOK_URL = os.environ.get('RENDER_BUILD_HOOK_URL')
 
 FRONTEND_URL = os.environ.get('FRONTEND_URL')
 
+# --- CACHE ---
+# LocMem (por proceso) por defecto; CACHE_BACKEND=file la comparte entre workers vía disco
+if os.environ.get('CACHE_BACKEND') == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'enlacepro',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Segundos que se guardan los resultados de AnalyticsService (se invalidan al ingerir eventos).
+# Las invalidaciones hechas fuera del worker (p. ej. backfill_event_geolocation) solo
+# llegan a los workers con una cache compartida; con LocMem esperan a que venza este TTL
+LINKS_ANALYTICS_CACHE_TTL = int(os.environ.get('LINKS_ANALYTICS_CACHE_TTL', 300))
+
+# --- INGESTA DE ANALYTICS (links) ---
+# Backend de la cola de eventos: 'memory', 'sqlite' (spool local) o 'sync'
+LINKS_TRACKING_BACKEND = os.environ.get('LINKS_TRACKING_BACKEND', 'memory')
+LINKS_TRACKING_QUEUE_SIZE = int(os.environ.get('LINKS_TRACKING_QUEUE_SIZE', 10000))
+LINKS_TRACKING_BATCH_SIZE = int(os.environ.get('LINKS_TRACKING_BATCH_SIZE', 500))
+LINKS_TRACKING_FLUSH_INTERVAL = float(os.environ.get('LINKS_TRACKING_FLUSH_INTERVAL', 2.0))
+LINKS_TRACKING_SPOOL_PATH = os.environ.get('LINKS_TRACKING_SPOOL_PATH', str(BASE_DIR / 'tracking_spool.sqlite3'))
+# Cola llena y BD caída: 'drop' descarta el evento, 'keep' lo encola por encima del límite
+LINKS_TRACKING_OVERFLOW = os.environ.get('LINKS_TRACKING_OVERFLOW', 'drop')
+
+# Geolocalización: base local de rangos de IP (CSV o .mmdb) y fallback HTTP en segundo plano
+LINKS_GEOIP_DATABASE = os.environ.get('LINKS_GEOIP_DATABASE')
+LINKS_GEOIP_HTTP_FALLBACK = os.environ.get('LINKS_GEOIP_HTTP_FALLBACK', 'True') == 'True'
+LINKS_GEOIP_CACHE_SIZE = int(os.environ.get('LINKS_GEOIP_CACHE_SIZE', 50000))
+LINKS_GEOIP_CACHE_TTL = int(os.environ.get('LINKS_GEOIP_CACHE_TTL', 86400))
+
+# Métricas en tiempo real desde ventanas en memoria (resembradas desde la BD)
+LINKS_REALTIME_WINDOW = os.environ.get('LINKS_REALTIME_WINDOW', 'True') == 'True'
+LINKS_REALTIME_RESEED_SECONDS = int(os.environ.get('LINKS_REALTIME_RESEED_SECONDS', 60))
+
+# Stream SSE de analytics (solo con ASGI): cola por cliente y keepalive
+LINKS_STREAM_QUEUE_SIZE = int(os.environ.get('LINKS_STREAM_QUEUE_SIZE', 100))
+LINKS_STREAM_KEEPALIVE_SECONDS = int(os.environ.get('LINKS_STREAM_KEEPALIVE_SECONDS', 15))
+
+# User agents distintos memoizados por la detección de bots/dispositivos
+LINKS_UA_CACHE_SIZE = int(os.environ.get('LINKS_UA_CACHE_SIZE', 4096))
+
+# Perfil público precalculado: vida en cache del documento (se valida contra
+# Profile.public_revision en cada request) y max-age para navegadores/CDN
+LINKS_PUBLIC_PROFILE_CACHE_TTL = int(os.environ.get('LINKS_PUBLIC_PROFILE_CACHE_TTL', 300))
+LINKS_PUBLIC_PROFILE_MAX_AGE = int(os.environ.get('LINKS_PUBLIC_PROFILE_MAX_AGE', 60))
+
+# Contadores del top-K (Space-Saving) de referrers por perfil y día
+LINKS_REFERRER_TOP_K = int(os.environ.get('LINKS_REFERRER_TOP_K', 50))
+
+# Clicks repetidos de la misma IP/user agent dentro de la ventana (segundos, 0 = desactivado)
+# se cuentan una sola vez; SHARED comparte la deduplicación entre workers vía la cache
+LINKS_CLICK_DEDUP_WINDOW = int(os.environ.get('LINKS_CLICK_DEDUP_WINDOW', 10))
+# Clicks distintos por franja del filtro de Bloom (~180 KB por franja con 100000 y 0.1% de falsos positivos)
+LINKS_CLICK_DEDUP_CAPACITY = int(os.environ.get('LINKS_CLICK_DEDUP_CAPACITY', 100000))
+LINKS_CLICK_DEDUP_SHARED = os.environ.get('LINKS_CLICK_DEDUP_SHARED', 'False') == 'True'
+
+# Días de eventos crudos que conserva compact_analytics_events (lo anterior queda solo en rollups;
+# mínimo 365, el rango más largo del dashboard)
+LINKS_RETENTION_DAYS = int(os.environ.get('LINKS_RETENTION_DAYS', 365))
+# -------------------------------------
+
+# --- TIMEHUB ---
+# Segundos que se guardan las series de horas de ProjectViewSet.metrics (se invalidan al aprobar horas)
+TIMEHUB_METRICS_CACHE_TTL = int(os.environ.get('TIMEHUB_METRICS_CACHE_TTL', 3600))
+
+# Cada cuántos segundos un proceso revisa si cambiaron feriados o países (calendario laboral)
+TIMEHUB_CALENDAR_CHECK_SECONDS = int(os.environ.get('TIMEHUB_CALENDAR_CHECK_SECONDS', 30))
+# -------------------------------------
+
+# --- INSTRUMENTACIÓN DE REQUESTS (core.instrumentation) ---
+INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', 'True') == 'True'
+# Token Bearer para que Prometheus lea /metrics/ (los usuarios staff no lo necesitan)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Umbrales para registrar en el log un request costoso (0 = desactivado)
+INSTRUMENTATION_QUERY_THRESHOLD = int(os.environ.get('INSTRUMENTATION_QUERY_THRESHOLD', 0))
+INSTRUMENTATION_DURATION_THRESHOLD_MS = int(os.environ.get('INSTRUMENTATION_DURATION_THRESHOLD_MS', 0))
+INSTRUMENTATION_DUPLICATE_THRESHOLD = int(os.environ.get('INSTRUMENTATION_DUPLICATE_THRESHOLD', 0))
+# -------------------------------------
+
 # --- LOGGING CONFIGURATION ---
 LOGGING = {
     'version': 1,
@@ -287,6 +376,16 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        'links': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'core': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         'django': {
             'handlers': ['console'],
             'level': 'INFO',
@@ -9,6 +9,7 @@ from . import views  # <-- 1. Importa el archivo de vistas del core
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('health/', views.health_check, name='health_check'),
+    path('metrics/', views.metrics, name='metrics'),
     path('api/', include('api.urls')), # Incluimos las URLs de nuestra app
     path('psychology/api/', include('psychology_api.urls')),
     path('api/servicios/', include('servicios_web.urls')),
@@ -1,11 +1,16 @@
 # core/views.py
 
-from django.http import JsonResponse
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
+
+from .instrumentation import registry
 
 def health_check(request):
     """
@@ -32,3 +37,32 @@ def register_user(request):
 
     user = User.objects.create_user(username=username, email=email, password=password)
     return Response({'detail': 'User registered successfully.'}, status=status.HTTP_201_CREATED)
+
+
+def _has_metrics_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not token or not header.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(header[len('Bearer '):], token)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def _admin_metrics(request):
+    return _metrics_response()
+
+
+def _metrics_response():
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def metrics(request):
+    """
+    Métricas de requests y base de datos de este proceso en formato Prometheus.
+    Acceso con ``Authorization: Bearer <METRICS_TOKEN>`` (scraping) o como staff.
+    """
+    # El token se valida antes de DRF: JWTAuthentication rechazaría el Bearer
+    if request.method == 'GET' and _has_metrics_token(request):
+        return _metrics_response()
+    return _admin_metrics(request)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Profile, Link, SocialIcon, ProfileView, LinkClick, SocialIconClick, AnalyticsCache
+from .models import Profile, Link, SocialIcon, ProfileView, LinkClick, SocialIconClick, AnalyticsCache, DailyRollup
 
 # ===== MODELOS PRINCIPALES =====
 
@@ -93,6 +93,20 @@ class AnalyticsCacheAdmin(admin.ModelAdmin):
     is_expired.boolean = True
     is_expired.short_description = 'Expired'
 
+@admin.register(DailyRollup)
+class DailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('profile', 'day', 'metric', 'dimension', 'key', 'label', 'count')
+    list_filter = ('metric', 'dimension', 'day')
+    search_fields = ('profile__name', 'key', 'label')
+    ordering = ('-day',)
+    date_hierarchy = 'day'
+    
+    def has_add_permission(self, request):
+        return False  # Se generan con build_analytics_rollups
+    
+    def has_change_permission(self, request, obj=None):
+        return False  # Solo lectura
+
 
 # ===== CONFIGURACIÓN DEL ADMIN SITE =====
 
@@ -0,0 +1,114 @@
+"""
+Cache generacional para los resultados de AnalyticsService.
+
+Cada perfil tiene un número de versión en la cache de Django. Las claves
+de resultados incluyen esa versión, así que invalidar todo lo calculado para
+un perfil es un solo ``incr``. La ingestión sube la versión de los perfiles
+con eventos nuevos y los cambios de enlaces/iconos también la suben.
+
+La versión vive en la cache, así que solo invalida en otros procesos si la
+cache es compartida (``CACHE_BACKEND=file``); con LocMem un ``bump_version``
+hecho desde un comando de management no llega a los workers web.
+"""
+import functools
+import inspect
+import threading
+from collections import Counter
+
+from django.conf import settings
+
+# Importar cache opcional para evitar errores si no está configurado
+try:
+    from django.core.cache import cache, caches
+    CACHE_AVAILABLE = True
+except Exception:
+    CACHE_AVAILABLE = False
+
+_MISSING = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _version_key(profile_id):
+    return f'analytics_version_{profile_id}'
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def is_process_local_cache():
+    """True si la cache por defecto vive en memoria del proceso (LocMem/Dummy)"""
+    if not CACHE_AVAILABLE:
+        return True
+    return type(caches['default']).__name__ in ('LocMemCache', 'DummyCache')
+
+
+def get_version(profile_id):
+    version = cache.get(_version_key(profile_id))
+    if version is None:
+        cache.add(_version_key(profile_id), 1, None)
+        version = cache.get(_version_key(profile_id), 1)
+    return version
+
+
+def bump_version(profile_id):
+    """Invalida todos los resultados cacheados de un perfil"""
+    if not CACHE_AVAILABLE:
+        return
+    try:
+        cache.incr(_version_key(profile_id))
+    except ValueError:
+        cache.set(_version_key(profile_id), 1, None)
+    except Exception:
+        pass
+    _count('invalidations')
+
+
+def get_stats():
+    """Contadores del proceso: hits, misses, errors e invalidations"""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats.get('hits', 0) + stats.get('misses', 0)
+    stats['hit_ratio'] = round(stats.get('hits', 0) / lookups, 3) if lookups else 0
+    return stats
+
+
+def cached_analytics(method):
+    """
+    Cachea el resultado de un método de AnalyticsService por perfil, versión
+    y argumentos (normalizados con sus valores por defecto).
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not CACHE_AVAILABLE:
+            return method(self, *args, **kwargs)
+
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        arguments = ':'.join(f'{name}={value}' for name, value in list(bound.arguments.items())[1:])
+
+        try:
+            version = get_version(self.profile.id)
+            key = f'analytics:{self.profile.id}:v{version}:{method.__name__}:{arguments}'
+            value = cache.get(key, _MISSING)
+        except Exception:
+            _count('errors')
+            return method(self, *args, **kwargs)
+
+        if value is not _MISSING:
+            _count('hits')
+            return value
+
+        _count('misses')
+        value = method(self, *args, **kwargs)
+        try:
+            cache.set(key, value, getattr(settings, 'LINKS_ANALYTICS_CACHE_TTL', 300))
+        except Exception:
+            _count('errors')
+        return value
+
+    return wrapper
@@ -1,13 +1,12 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
+from django.conf import settings
 from django.utils import timezone
 from django.db.models import Count, Q, Sum, Max
 from .models import Profile, ProfileView, LinkClick, Link, SocialIconClick, AnalyticsCache
-# Importar cache opcional para evitar errores si no está configurado
-try:
-    from django.core.cache import cache
-    CACHE_AVAILABLE = True
-except Exception:
-    CACHE_AVAILABLE = False
+from .rollups import ALL_TIME, RollupQuery, day_start
+from . import realtime, referrers, visitors
+from .analytics_cache import cached_analytics
+from .hll import HyperLogLog
 
 
 class AnalyticsService:
@@ -15,6 +14,24 @@ class AnalyticsService:
     
     def __init__(self, profile):
         self.profile = profile
+        self._rollup_query = None
+    
+    def _rollups(self, start_date):
+        """Consulta sobre rollups diarios + eventos crudos, compartida por rango"""
+        if self._rollup_query is None or self._rollup_query.start != start_date:
+            self._rollup_query = RollupQuery(self.profile, start_date)
+        return self._rollup_query
+    
+    def _link_clicks(self, rollups, links):
+        """
+        ``{link_id: clicks}`` de los enlaces que siguen existiendo. Los rollups
+        sobreviven al enlace (sus clicks crudos se borran en cascada), así que
+        los totales de clicks se suman desde aquí y no desde la dimensión total
+        """
+        link_ids = {str(link.id) for link in links}
+        return {
+            key: count for key, (_, count) in rollups.counts('click', 'link').items() if key in link_ids
+        }
     
     def get_time_range_filter(self, time_range):
         """Convierte string de time_range a filtro de fecha"""
@@ -26,23 +43,29 @@ class AnalyticsService:
             return now - timedelta(days=30)
         elif time_range == '90d':
             return now - timedelta(days=90)
+        elif time_range == '1y':
+            return now - timedelta(days=365)
         else:
             return now - timedelta(days=7)  # Default
     
+    @cached_analytics
     def get_basic_analytics(self):
         """Analytics básicos para el endpoint existente"""
-        total_views = ProfileView.objects.filter(profile=self.profile).count()
-        total_clicks = LinkClick.objects.filter(profile=self.profile).count()
-        
-        # Links data con clicks
+        # Totales históricos desde rollups + eventos crudos: no bajan al compactar
+        rollups = self._rollups(ALL_TIME)
+        total_views = rollups.total('view')
+        
+        # Links data con clicks (un solo GROUP BY para todos los enlaces)
+        links = list(self.profile.links.all())
+        link_counts = self._link_clicks(rollups, links)
+        total_clicks = sum(link_counts.values())
         links_data = []
-        for link in self.profile.links.all():
-            link_clicks = LinkClick.objects.filter(link=link).count()
+        for link in links:
             links_data.append({
                 'id': link.id,
                 'title': link.title,
                 'url': link.url,
-                'clicks': link_clicks
+                'clicks': link_counts.get(str(link.id), 0)
             })
         
         return {
@@ -51,57 +74,41 @@ class AnalyticsService:
             'links_data': links_data
         }
     
+    @cached_analytics
     def get_detailed_analytics(self, time_range='7d'):
         """Analytics detallados para LinkAnalytics.tsx"""
         
-        # Verificar cache primero (solo si está disponible)
-        cached_data = None
-        cache_key = f"detailed_analytics_{self.profile.id}_{time_range}"
-        if CACHE_AVAILABLE:
-            try:
-                cached_data = cache.get(cache_key)
-                if cached_data:
-                    return cached_data
-            except Exception:
-                pass
-        
         start_date = self.get_time_range_filter(time_range)
         
-        # Métricas básicas
-        total_views = ProfileView.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).count()
+        rollups = self._rollups(start_date)
         
-        total_clicks = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).count()
+        # Métricas básicas (clicks solo de enlaces que siguen existiendo)
+        total_views = rollups.total('view')
+        links = list(self.profile.links.all())
+        link_clicks = self._link_clicks(rollups, links)
+        total_clicks = sum(link_clicks.values())
         
         click_through_rate = (total_clicks / total_views * 100) if total_views > 0 else 0
         
         # Top performing link
-        top_link_data = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).values('link__id', 'link__title', 'link__url').annotate(
-            click_count=Count('id')
-        ).order_by('-click_count').first()
+        links_by_id = {str(link.id): link for link in links}
+        link_counts = [(links_by_id[key], count) for key, count in link_clicks.items()]
         
         top_performing_link = None
-        if top_link_data:
+        if link_counts:
+            top_link, top_clicks = max(link_counts, key=lambda item: item[1])
             top_performing_link = {
-                'id': top_link_data['link__id'],
-                'title': top_link_data['link__title'],
-                'url': top_link_data['link__url'],
-                'clicks': top_link_data['click_count']
+                'id': top_link.id,
+                'title': top_link.title,
+                'url': top_link.url,
+                'clicks': top_clicks
             }
         
-        # Recent clicks (últimos 20)
-        recent_clicks = LinkClick.objects.filter(
+        # Recent clicks (últimos 20), evaluados para poder cachear el resultado
+        recent_clicks = list(LinkClick.objects.filter(
             profile=self.profile,
             timestamp__gte=start_date
-        ).select_related('link').order_by('-timestamp')[:20]
+        ).select_related('link').order_by('-timestamp')[:20])
         
         # Clicks por día
         clicks_by_day = self._get_clicks_by_day(start_date)
@@ -127,75 +134,40 @@ class AnalyticsService:
             'clicks_by_category': clicks_by_category
         }
         
-        # Cachear por 5 minutos (solo si está disponible)
-        if CACHE_AVAILABLE:
-            try:
-                cache.set(cache_key, result, 300)
-            except Exception:
-                pass
-        
         return result
     
     def _get_clicks_by_day(self, start_date):
         """Obtiene clicks agrupados por día"""
-        from django.db.models.functions import TruncDate
-        from datetime import datetime
-        
-        # Debug: log para ver qué está pasando
-        total_clicks_in_range = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).count()
-        print(f"[DEBUG] Total clicks en rango para perfil {self.profile.id}: {total_clicks_in_range}")
-        
-        clicks_by_day = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).extra(
-            select={'day': 'DATE(timestamp)'}
-        ).values('day').annotate(
-            clicks=Count('id')
-        ).order_by('day')
-        
-        # Debug: log de datos raw
-        clicks_list = list(clicks_by_day)
-        print(f"[DEBUG] Clicks by day raw: {clicks_list}")
+        # Por enlace para descartar los clicks consolidados de enlaces eliminados
+        link_ids = {str(link.id) for link in self.profile.links.all()}
+        clicks_dict = {}
+        for (day, key), count in self._rollups(start_date).daily_counts('click', 'link').items():
+            if key in link_ids:
+                clicks_dict[day] = clicks_dict.get(day, 0) + count
         
         # Llenar días faltantes
         result = []
-        current_date = start_date.date()
-        end_date = timezone.now().date()
-        
-        # Crear diccionario para búsqueda rápida - FIX: convertir string a date
-        clicks_dict = {}
-        for item in clicks_list:
-            if item['day']:
-                # Convertir string YYYY-MM-DD a date object
-                day_date = datetime.strptime(str(item['day']), '%Y-%m-%d').date()
-                clicks_dict[day_date] = item['clicks']
-                print(f"[DEBUG] Agregado al dict: {day_date} -> {item['clicks']}")
+        current_date = timezone.localtime(start_date).date()
+        end_date = timezone.localdate()
         
         while current_date <= end_date:
-            clicks_for_day = clicks_dict.get(current_date, 0)
             result.append({
                 'date': current_date.strftime('%a %d'),
-                'clicks': clicks_for_day
+                'clicks': clicks_dict.get(current_date, 0)
             })
-            print(f"[DEBUG] Día {current_date}: {clicks_for_day} clicks")
             current_date += timedelta(days=1)
         
-        final_result = result[-7:]  # Solo últimos 7 días
-        print(f"[DEBUG] Resultado final: {final_result}")
-        return final_result
+        return result[-7:]  # Solo últimos 7 días
     
     def _get_clicks_by_device(self, start_date):
         """Obtiene clicks agrupados por dispositivo"""
-        device_stats = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).values('device_type').annotate(
-            clicks=Count('id')
-        ).order_by('-clicks')
+        device_stats = sorted(
+            (
+                {'device_type': key, 'clicks': count}
+                for key, (_, count) in self._rollups(start_date).counts('click', 'device').items()
+            ),
+            key=lambda stat: -stat['clicks']
+        )
         
         total_clicks = sum(stat['clicks'] for stat in device_stats)
         
@@ -219,12 +191,13 @@ class AnalyticsService:
     
     def _get_clicks_by_country(self, start_date):
         """Obtiene clicks agrupados por país"""
-        country_stats = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).values('country', 'country_code').annotate(
-            clicks=Count('id')
-        ).order_by('-clicks')[:10]  # Top 10 países
+        country_stats = sorted(
+            (
+                {'country': label, 'country_code': key, 'clicks': count}
+                for key, (label, count) in self._rollups(start_date).counts('click', 'country').items()
+            ),
+            key=lambda stat: -stat['clicks']
+        )[:10]  # Top 10 países
         
         # Mapeo de banderas (emojis de país) - expandido
         flag_mapping = {
@@ -258,12 +231,13 @@ class AnalyticsService:
     
     def _get_clicks_by_category(self, start_date):
         """Obtiene clicks agrupados por categoría de enlace"""
-        category_stats = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=start_date
-        ).values('link__type').annotate(
-            clicks=Count('id')
-        ).order_by('-clicks')
+        category_stats = sorted(
+            (
+                {'link__type': key, 'clicks': count}
+                for key, (_, count) in self._rollups(start_date).counts('click', 'category').items()
+            ),
+            key=lambda stat: -stat['clicks']
+        )
         
         # Mapeo de colores y nombres
         category_mapping = {
@@ -292,85 +266,138 @@ class AnalyticsService:
         
         return result
     
+    @cached_analytics
     def get_device_stats(self, time_range='7d'):
         """Estadísticas específicas de dispositivos"""
         start_date = self.get_time_range_filter(time_range)
         return self._get_clicks_by_device(start_date)
     
+    @cached_analytics
     def get_geography_stats(self, time_range='7d'):
         """Estadísticas específicas geográficas"""
         start_date = self.get_time_range_filter(time_range)
         return self._get_clicks_by_country(start_date)
     
+    @cached_analytics
     def get_daily_clicks(self, time_range='7d'):
         """Clicks diarios específicos"""
         start_date = self.get_time_range_filter(time_range)
         return self._get_clicks_by_day(start_date)
     
+    @cached_analytics
     def get_recent_activity(self, limit=20):
         """Actividad reciente"""
-        return LinkClick.objects.filter(
+        return list(LinkClick.objects.filter(
             profile=self.profile
-        ).select_related('link').order_by('-timestamp')[:limit]
+        ).select_related('link').order_by('-timestamp')[:limit])
     
+    @cached_analytics
+    def get_unique_visitors(self, time_range='30d'):
+        """Visitantes únicos estimados con HyperLogLog (sin recorrer eventos)"""
+        last_day = timezone.localdate()
+        first_day = timezone.localtime(self.get_time_range_filter(time_range)).date() + timedelta(days=1)
+        return {
+            'time_range': time_range,
+            'start_date': first_day,
+            'end_date': last_day,
+            'unique_visitors': visitors.unique_visitors(self.profile, first_day, last_day),
+            'relative_error': round(HyperLogLog.relative_error(), 4),
+        }
+
+    @cached_analytics
+    def get_referrer_stats(self, time_range='30d', metric='view', limit=10):
+        """
+        Referrers y fuentes de tráfico del rango: rollups para los días
+        consolidados y resúmenes top-K (Space-Saving) para el resto
+        """
+        last_day = timezone.localdate()
+        first_day = timezone.localtime(self.get_time_range_filter(time_range)).date() + timedelta(days=1)
+        query = RollupQuery(self.profile, day_start(first_day))
+
+        counts = {}  # host -> [count, error]
+        total = 0
+        for key, (_, count) in query.rollup_counts(metric, 'referrer').items():
+            entry = counts.setdefault(referrers.normalize_host(key), [0, 0])
+            entry[0] += count
+            total += count
+
+        # Días fuera de los rollups: antes y después del rango consolidado
+        if query.rollup_days is None:
+            segments = [(first_day, last_day)]
+        else:
+            rollup_first, rollup_last = query.rollup_days
+            segments = [(first_day, rollup_first - timedelta(days=1)), (rollup_last + timedelta(days=1), last_day)]
+        for segment_first, segment_last in segments:
+            if segment_first > segment_last:
+                continue
+            summary = referrers.summary_for_days(self.profile, metric, segment_first, segment_last)
+            total += summary.total
+            for host, (count, error) in summary.counters.items():
+                entry = counts.setdefault(host, [0, 0])
+                entry[0] += count
+                entry[1] += error
+
+        sources = {}
+        for host, (count, _) in counts.items():
+            source = referrers.classify_source(host)
+            sources[source] = sources.get(source, 0) + count
+        # Lo que no entró en el top-K de algún día cuenta como "other"
+        untracked = total - sum(count for count, _ in counts.values())
+        if untracked > 0:
+            sources[referrers.OTHER] = sources.get(referrers.OTHER, 0) + untracked
+
+        top_hosts = sorted(
+            ((host, entry) for host, entry in counts.items() if host), key=lambda item: item[1][0], reverse=True
+        )[:limit]
+        return {
+            'time_range': time_range,
+            'metric': metric,
+            'total': total,
+            'sources': [
+                {
+                    'source': source,
+                    'count': count,
+                    'percentage': round(count / total * 100, 1) if total else 0,
+                }
+                for source, count in sorted(sources.items(), key=lambda item: item[1], reverse=True)
+            ],
+            'referrers': [
+                {
+                    'host': host,
+                    'source': referrers.classify_source(host),
+                    'count': count,
+                    'max_error': error,
+                    'percentage': round(count / total * 100, 1) if total else 0,
+                }
+                for host, (count, error) in top_hosts
+            ],
+        }
+
     def get_realtime_metrics(self):
-        """Métricas en tiempo real - últimas 24 horas"""
-        from datetime import timedelta
-        
+        """Métricas en tiempo real - última hora comparada con la anterior"""
         now = timezone.now()
-        last_24h = now - timedelta(hours=24)
-        last_hour = now - timedelta(hours=1)
-        
-        # Clicks en la última hora
-        clicks_last_hour = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=last_hour
-        ).count()
-        
-        # Clicks en las últimas 24h para comparación
-        clicks_last_24h = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=last_24h
-        ).count()
         
-        # Vistas en la última hora
-        views_last_hour = ProfileView.objects.filter(
-            profile=self.profile,
-            timestamp__gte=last_hour
-        ).count()
+        if getattr(settings, 'LINKS_REALTIME_WINDOW', True):
+            # Ventana deslizante en memoria alimentada por los trackers
+            counts = realtime.get_counts(self.profile.id)
+        else:
+            counts = self._get_realtime_counts_from_db(now)
         
-        # Vistas en las últimas 24h
-        views_last_24h = ProfileView.objects.filter(
-            profile=self.profile,
-            timestamp__gte=last_24h
-        ).count()
+        return self.build_realtime_metrics(counts, now)
+    
+    @staticmethod
+    def build_realtime_metrics(counts, now):
+        """Formatea los conteos de realtime para el panel (vista y stream SSE)"""
+        clicks_last_hour = counts['clicks_last_hour']
+        views_last_hour = counts['views_last_hour']
+        clicks_hour_before = counts['clicks_hour_before']
+        views_hour_before = counts['views_hour_before']
+        unique_visitors = counts['unique_visitors']
+        active_links = counts['active_links']
         
         # CTR actual
         ctr_current = (clicks_last_hour / views_last_hour * 100) if views_last_hour > 0 else 0
         
-        # Enlaces activos
-        active_links = self.profile.links.filter().count()
-        
-        # Visitantes únicos por IP en la última hora
-        unique_visitors = ProfileView.objects.filter(
-            profile=self.profile,
-            timestamp__gte=last_hour
-        ).values('ip_address').distinct().count()
-        
-        # Calcular tendencias (comparar última hora vs hora anterior)
-        hour_before_last = now - timedelta(hours=2)
-        clicks_hour_before = LinkClick.objects.filter(
-            profile=self.profile,
-            timestamp__gte=hour_before_last,
-            timestamp__lt=last_hour
-        ).count()
-        
-        views_hour_before = ProfileView.objects.filter(
-            profile=self.profile,
-            timestamp__gte=hour_before_last,
-            timestamp__lt=last_hour
-        ).count()
-        
         # Calcular cambios porcentuales
         clicks_change = ((clicks_last_hour - clicks_hour_before) / clicks_hour_before * 100) if clicks_hour_before > 0 else 0
         views_change = ((views_last_hour - views_hour_before) / views_hour_before * 100) if views_hour_before > 0 else 0
@@ -395,53 +422,78 @@ class AnalyticsService:
             'last_updated': now.isoformat()
         }
     
+    def _get_realtime_counts_from_db(self, now):
+        """Conteos de la última hora y la anterior con una consulta por tabla"""
+        last_hour = now - timedelta(hours=1)
+        hour_before_last = now - timedelta(hours=2)
+        current_hour = Q(timestamp__gte=last_hour)
+        previous_hour = Q(timestamp__lt=last_hour)
+        
+        clicks = LinkClick.objects.filter(
+            profile=self.profile,
+            timestamp__gte=hour_before_last
+        ).aggregate(
+            last_hour=Count('id', filter=current_hour),
+            hour_before=Count('id', filter=previous_hour),
+        )
+        
+        views = ProfileView.objects.filter(
+            profile=self.profile,
+            timestamp__gte=hour_before_last
+        ).aggregate(
+            last_hour=Count('id', filter=current_hour),
+            hour_before=Count('id', filter=previous_hour),
+            unique_visitors=Count('ip_address', filter=current_hour, distinct=True),
+        )
+        
+        return {
+            'clicks_last_hour': clicks['last_hour'],
+            'clicks_hour_before': clicks['hour_before'],
+            'views_last_hour': views['last_hour'],
+            'views_hour_before': views['hour_before'],
+            'unique_visitors': views['unique_visitors'],
+            'active_links': self.profile.links.count(),
+        }
+    
+    @cached_analytics
     def get_social_media_stats(self, time_range='7d'):
         """Estadísticas de redes sociales - clicks en iconos sociales"""
+        icons = list(self.profile.social_icons.all())
         try:
             start_date = self.get_time_range_filter(time_range)
             
-            # Clicks por red social
-            social_clicks = SocialIconClick.objects.filter(
-                profile=self.profile,
-                timestamp__gte=start_date
-            ).values('social_icon__social_type').annotate(
-                clicks=Count('id')
-            ).order_by('-clicks')
-            
-            # Total de clicks en redes sociales
-            total_social_clicks = SocialIconClick.objects.filter(
-                profile=self.profile,
-                timestamp__gte=start_date
-            ).count()
-            
-            # Red social más popular
-            most_popular_social = social_clicks.first() if social_clicks else None
+            # Una sola pasada: clicks por (día, icono) desde rollups + eventos crudos;
+            # los totales por icono, por red social y por día salen de ese resultado
+            clicks_by_day_and_icon = self._rollups(start_date).daily_counts('social', 'social_icon')
+            icons_by_key = {str(icon.id): icon for icon in icons}
+            clicks_by_icon = {}
+            clicks_by_type = {}
+            clicks_by_day = {}
+            for (day, key), count in clicks_by_day_and_icon.items():
+                icon = icons_by_key.get(key)
+                if icon is None:
+                    continue  # icono eliminado (sus clicks crudos se borraron con él)
+                clicks_by_icon[icon.id] = clicks_by_icon.get(icon.id, 0) + count
+                clicks_by_type[icon.social_type] = clicks_by_type.get(icon.social_type, 0) + count
+                clicks_by_day[day] = clicks_by_day.get(day, 0) + count
             
-            # Clicks por día en redes sociales
-            social_clicks_by_day = self._get_social_clicks_by_day(start_date)
+            # Clicks por red social
+            social_clicks = [
+                {'social_icon__social_type': social_type, 'clicks': clicks}
+                for social_type, clicks in sorted(clicks_by_type.items(), key=lambda item: -item[1])
+                if clicks
+            ]
             
             # Obtener todos los iconos sociales del perfil con sus clicks
-            social_icons_with_clicks = []
-            for icon in self.profile.social_icons.all():
-                click_count = SocialIconClick.objects.filter(
-                    social_icon=icon,
-                    timestamp__gte=start_date
-                ).count()
-                
-                social_icons_with_clicks.append({
-                    'id': icon.id,
-                    'social_type': icon.social_type,
-                    'social_type_display': icon.get_social_type_display(),
-                    'username': icon.username,
-                    'url': icon.url,
-                    'clicks': click_count
-                })
+            social_icons_with_clicks = [
+                self._social_icon_data(icon, clicks_by_icon.get(icon.id, 0)) for icon in icons
+            ]
             
             return {
-                'total_social_clicks': total_social_clicks,
-                'most_popular_social': most_popular_social,
-                'social_clicks_by_type': list(social_clicks),
-                'social_clicks_by_day': social_clicks_by_day,
+                'total_social_clicks': sum(clicks_by_icon.values()),
+                'most_popular_social': social_clicks[0] if social_clicks else None,
+                'social_clicks_by_type': social_clicks,
+                'social_clicks_by_day': self._get_social_clicks_by_day(start_date, clicks_by_day),
                 'social_icons_with_clicks': social_icons_with_clicks,
                 'time_range': time_range
             }
@@ -452,72 +504,36 @@ class AnalyticsService:
             print("[SocialMediaStats] Devolviendo datos vacíos - ejecutar migraciones")
             
             # Devolver estructura vacía pero válida
-            social_icons_with_clicks = []
-            for icon in self.profile.social_icons.all():
-                social_icons_with_clicks.append({
-                    'id': icon.id,
-                    'social_type': icon.social_type,
-                    'social_type_display': icon.get_social_type_display(),
-                    'username': icon.username,
-                    'url': icon.url,
-                    'clicks': 0  # Sin datos por falta de migraciones
-                })
-            
             return {
                 'total_social_clicks': 0,
                 'most_popular_social': None,
                 'social_clicks_by_type': [],
                 'social_clicks_by_day': [],
-                'social_icons_with_clicks': social_icons_with_clicks,
+                'social_icons_with_clicks': [self._social_icon_data(icon, 0) for icon in icons],
                 'time_range': time_range,
                 'needs_migration': True  # Indicador para el frontend
             }
     
-    def _get_social_clicks_by_day(self, start_date):
-        """Obtiene clicks de redes sociales agrupados por día"""
-        try:
-            from django.db.models.functions import TruncDate
-            
-            clicks_by_day = SocialIconClick.objects.filter(
-                profile=self.profile,
-                timestamp__gte=start_date
-            ).extra(
-                select={'day': 'DATE(timestamp)'}
-            ).values('day').annotate(
-                clicks=Count('id')
-            ).order_by('day')
-            
-            # Llenar días faltantes
-            result = []
-            current_date = start_date.date()
-            end_date = timezone.now().date()
-            
-            # Crear diccionario para búsqueda rápida
-            clicks_dict = {}
-            for item in clicks_by_day:
-                if item['day']:
-                    day_date = datetime.strptime(str(item['day']), '%Y-%m-%d').date()
-                    clicks_dict[day_date] = item['clicks']
-            
-            while current_date <= end_date:
-                clicks_for_day = clicks_dict.get(current_date, 0)
-                result.append({
-                    'date': current_date.strftime('%a %d'),
-                    'clicks': clicks_for_day
-                })
-                current_date += timedelta(days=1)
-            
-            return result[-7:]  # Solo últimos 7 días
-            
-        except Exception as e:
-            print(f"[SocialClicksByDay] Error: {e}")
-            # Devolver 7 días con 0 clicks como fallback
-            result = []
-            current_date = start_date.date()
-            for i in range(7):
-                date = current_date + timedelta(days=i)
-                result.append({
-                    'date': date.strftime('%a %d'),
-                    'clicks': 0
-                })
-            return result
\ No newline at end of file
+    @staticmethod
+    def _social_icon_data(icon, clicks):
+        return {
+            'id': icon.id,
+            'social_type': icon.social_type,
+            'social_type_display': icon.get_social_type_display(),
+            'username': icon.username,
+            'url': icon.url,
+            'clicks': clicks
+        }
+    
+    def _get_social_clicks_by_day(self, start_date, clicks_by_day):
+        """Clicks de redes sociales de los últimos 7 días del rango, con los días sin clicks en 0"""
+        end_date = timezone.localdate()
+        current_date = max(timezone.localtime(start_date).date(), end_date - timedelta(days=6))
+        result = []
+        while current_date <= end_date:
+            result.append({
+                'date': current_date.strftime('%a %d'),
+                'clicks': clicks_by_day.get(current_date, 0)
+            })
+            current_date += timedelta(days=1)
+        return result
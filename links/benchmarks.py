@@ -0,0 +1,238 @@
+"""
+Benchmark de los endpoints de analytics y de los trackers de links.
+
+``seed`` carga perfiles sintéticos (prefijo ``bench-``) con millones de
+eventos usando ``bulk_create`` por lotes; ``run`` mide cada endpoint con el
+cliente de pruebas de Django y devuelve latencias (percentiles en ms) y
+número de consultas por llamada, en frío (cache vacía) y en caliente. El
+reporte es JSON con claves ordenadas para poder compararlo entre commits.
+"""
+import math
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .ingestion import flush
+from .retention import delete_in_chunks
+from .models import Profile, Link, SocialIcon, ProfileView, LinkClick, SocialIconClick, UserAgent
+from .ua import get_user_agent_ids
+
+BENCH_PREFIX = 'bench-'
+
+USER_AGENTS = [
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1',
+    'Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.6422.165 Mobile Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
+    'Mozilla/5.0 (iPad; CPU OS 17_5 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 Mobile/15E148 Safari/604.1',
+]
+DEVICES = ['mobile', 'mobile', 'mobile', 'desktop', 'tablet']
+COUNTRIES = [('PE', 'Peru'), ('MX', 'Mexico'), ('US', 'United States'), ('ES', 'Spain'), ('XX', 'Unknown')]
+REFERRERS = [
+    '', '', 'https://l.instagram.com/', 'https://www.tiktok.com/', 'https://t.co/x',
+    'https://www.google.com/', 'https://m.facebook.com/',
+]
+LINK_TYPES = ['generic', 'instagram', 'youtube', 'tiktok', 'whatsapp']
+SOCIAL_TYPES = ['instagram', 'tiktok', 'youtube', 'twitter', 'facebook']
+
+# (nombre, método, url name, kwargs de la url, parámetros, autenticado)
+ANALYTICS_ENDPOINTS = [
+    ('profile_analytics', 'get', 'profile_analytics', {}, {}, True),
+    ('analytics_detailed', 'get', 'analytics_detailed', {}, {'time_range': None}, True),
+    ('analytics_devices', 'get', 'analytics_devices', {}, {'time_range': None}, True),
+    ('analytics_geography', 'get', 'analytics_geography', {}, {'time_range': None}, True),
+    ('analytics_daily', 'get', 'analytics_daily', {}, {'time_range': None}, True),
+    ('analytics_recent_activity', 'get', 'analytics_recent_activity', {}, {}, True),
+    ('analytics_realtime', 'get', 'analytics_realtime', {}, {}, True),
+    ('analytics_social_media', 'get', 'analytics_social_media', {}, {'time_range': None}, True),
+    ('analytics_unique_visitors', 'get', 'analytics_unique_visitors', {}, {'time_range': None}, True),
+    ('analytics_referrers', 'get', 'analytics_referrers', {}, {'time_range': None}, True),
+    ('analytics_export', 'get', 'analytics_export', {}, {}, True),
+    ('profiles_me', 'get', 'profile-me', {}, {}, True),
+    ('public_profile', 'get', 'public_profile_document', {'slug': None}, {}, False),
+]
+
+TRACKER_ENDPOINTS = [
+    ('profile_view_tracker', 'post', 'profile_view_tracker', {'slug': None}),
+    ('link_click_tracker', 'get', 'link_click_tracker', {'link_id': None}),
+    ('social_icon_click_tracker', 'get', 'social_icon_click_tracker', {'social_icon_id': None}),
+]
+
+
+def bench_profiles():
+    return Profile.objects.filter(slug__startswith=BENCH_PREFIX).order_by('id')
+
+
+def seed(profiles=2, links=10, events=1_000_000, days=90, batch_size=10_000, stdout=None, rng=None):
+    """
+    Crea ``profiles`` perfiles ``bench-N`` con ``links`` enlaces y 5 iconos y
+    reparte ``events`` eventos (50% vistas, 40% clicks, 10% clicks sociales)
+    en los últimos ``days`` días.
+    """
+    rng = rng or random.Random(42)
+    now = timezone.now()
+    agent_ids = list(get_user_agent_ids(USER_AGENTS).values())
+    created = []
+
+    for index in range(profiles):
+        name = f'{BENCH_PREFIX}{index}'
+        user, _ = User.objects.get_or_create(username=name, defaults={'email': f'{name}@example.com'})
+        profile, _ = Profile.objects.get_or_create(user=user, defaults={'name': name, 'bio': '', 'slug': name})
+        if not profile.links.exists():
+            Link.objects.bulk_create([
+                Link(profile=profile, title=f'Link {order}', url=f'https://example.com/{order}',
+                     type=LINK_TYPES[order % len(LINK_TYPES)], order=order)
+                for order in range(links)
+            ])
+            SocialIcon.objects.bulk_create([
+                SocialIcon(profile=profile, social_type=social_type, username=name, url='https://example.com', order=order)
+                for order, social_type in enumerate(SOCIAL_TYPES)
+            ])
+        created.append((profile, list(profile.links.values_list('id', flat=True)),
+                        list(profile.social_icons.values_list('id', flat=True))))
+
+    def fields():
+        country_code, country = rng.choice(COUNTRIES)
+        return {
+            'timestamp': now - timedelta(seconds=rng.randint(0, days * 86400)),
+            'ip_address': f'10.{rng.randint(0, 15)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+            'agent_id': rng.choice(agent_ids),
+            'referrer': rng.choice(REFERRERS),
+            'device_type': rng.choice(DEVICES),
+            'country': country,
+            'country_code': country_code,
+        }
+
+    shares = [(ProfileView, 0.5), (LinkClick, 0.4), (SocialIconClick, 0.1)]
+    for model, share in shares:
+        remaining = int(events * share)
+        while remaining > 0:
+            size = min(batch_size, remaining)
+            rows = []
+            for _ in range(size):
+                profile, link_ids, icon_ids = rng.choice(created)
+                row = model(profile=profile, **fields())
+                if model is LinkClick:
+                    row.link_id = rng.choice(link_ids)
+                elif model is SocialIconClick:
+                    row.social_icon_id = rng.choice(icon_ids)
+                rows.append(row)
+            model.objects.bulk_create(rows, batch_size=batch_size)
+            remaining -= size
+            if stdout is not None:
+                stdout.write(f'{model.__name__}: faltan {remaining}')
+    return [profile for profile, _, _ in created]
+
+
+def cleanup(chunk_size=10_000):
+    """Elimina los perfiles de benchmark, sus usuarios y sus eventos (en lotes)"""
+    profiles = bench_profiles()
+    deleted = 0
+    for model in (ProfileView, LinkClick, SocialIconClick):
+        deleted += delete_in_chunks(model.objects.filter(profile__in=profiles), chunk_size)
+    deleted += User.objects.filter(username__startswith=BENCH_PREFIX).delete()[0]
+    return deleted
+
+
+def summarize(samples):
+    """Percentiles de latencia (ms) y rango de consultas de una serie de llamadas"""
+    latencies = sorted(latency for latency, _ in samples)
+    queries = [count for _, count in samples]
+
+    def percentile(value):
+        index = min(len(latencies) - 1, max(0, math.ceil(value / 100 * len(latencies)) - 1))  # nearest-rank
+        return round(latencies[index], 3)
+
+    return {
+        'calls': len(samples),
+        'p50_ms': percentile(50),
+        'p90_ms': percentile(90),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+        'max_ms': round(latencies[-1], 3),
+        'mean_ms': round(statistics.fmean(latencies), 3),
+        'queries_min': min(queries),
+        'queries_max': max(queries),
+    }
+
+
+def _call(client, method, url, params):
+    with CaptureQueriesContext(connection) as context:
+        start = time.perf_counter()
+        response = getattr(client, method)(url, params, HTTP_USER_AGENT=USER_AGENTS[0], REMOTE_ADDR='10.0.0.1')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code >= 400:
+        raise RuntimeError(f'{url} respondió {response.status_code}')
+    return elapsed, len(context.captured_queries)
+
+
+def run(profile, iterations=20, time_ranges=('7d', '30d', '90d')):
+    """Mide endpoints y trackers para un perfil; devuelve ``{nombre: resumen}``"""
+    api = APIClient()
+    api.force_authenticate(profile.user)
+    anonymous = Client()
+    link = profile.links.order_by('id').first()
+    icon = profile.social_icons.order_by('id').first()
+    url_values = {'slug': profile.slug, 'link_id': link.id if link else None, 'social_icon_id': icon.id if icon else None}
+
+    results = {}
+    for name, method, url_name, url_kwargs, params, authenticated in ANALYTICS_ENDPOINTS:
+        url = reverse(url_name, kwargs={key: url_values[key] for key in url_kwargs})
+        client = api if authenticated else anonymous
+        variants = time_ranges if 'time_range' in params else [None]
+        for time_range in variants:
+            query = {'time_range': time_range} if time_range else {}
+            label = f'{name}[{time_range}]' if time_range else name
+            cold, warm = [], []
+            for _ in range(iterations):
+                cache.clear()
+                cold.append(_call(client, method, url, query))
+                warm.append(_call(client, method, url, query))
+            results[label] = {'cold': summarize(cold), 'warm': summarize(warm)}
+
+    for name, method, url_name, url_kwargs in TRACKER_ENDPOINTS:
+        if any(url_values[key] is None for key in url_kwargs):
+            continue
+        url = reverse(url_name, kwargs={key: url_values[key] for key in url_kwargs})
+        # Sin deduplicación: se mide el camino que encola el evento
+        with override_settings(LINKS_CLICK_DEDUP_WINDOW=0):
+            samples = [_call(anonymous, method, url, {}) for _ in range(iterations)]
+        results[name] = {'warm': summarize(samples)}
+    flush()
+    return results
+
+
+def dataset_stats():
+    profiles = bench_profiles()
+    return {
+        'profiles': profiles.count(),
+        'profile_views': ProfileView.objects.filter(profile__in=profiles).count(),
+        'link_clicks': LinkClick.objects.filter(profile__in=profiles).count(),
+        'social_clicks': SocialIconClick.objects.filter(profile__in=profiles).count(),
+        'user_agents': UserAgent.objects.count(),
+    }
+
+
+def compare(old, new):
+    """Diferencias de p50/p95 y consultas entre dos reportes (``[(endpoint, modo, métrica, antes, después)]``)"""
+    rows = []
+    for endpoint, modes in sorted(new.get('results', {}).items()):
+        for mode, summary in sorted(modes.items()):
+            previous = old.get('results', {}).get(endpoint, {}).get(mode)
+            if previous is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'queries_max'):
+                rows.append((endpoint, mode, metric, previous[metric], summary[metric]))
+    return rows
@@ -0,0 +1,73 @@
+"""
+Contadores legacy (``Profile.views`` y ``Link.clicks``).
+
+Los incrementos se acumulan en memoria por (modelo, pk, campo) y se aplican
+periódicamente con ``UPDATE ... SET campo = campo + delta`` desde el worker
+de ingestión. Nunca se reescribe la fila completa y los incrementos de
+varios workers de gunicorn se suman sin pisarse.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+def apply_increment(model, pk, field, amount=1):
+    """Incremento atómico inmediato en la base de datos"""
+    return model.objects.filter(pk=pk).update(**{field: F(field) + amount})
+
+
+class CounterBuffer:
+    """Acumula deltas en memoria y los vuelca en un solo UPDATE por contador"""
+
+    def __init__(self):
+        self._deltas = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, model, pk, field, amount=1):
+        with self._lock:
+            self._deltas[(model, pk, field)] += amount
+
+    def pending(self, model, pk, field):
+        with self._lock:
+            return self._deltas.get((model, pk, field), 0)
+
+    def flush(self):
+        """Aplica los deltas acumulados. Devuelve cuántos contadores actualizó."""
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(int)
+
+        applied = 0
+        for index, ((model, pk, field), amount) in enumerate(deltas.items()):
+            try:
+                apply_increment(model, pk, field, amount)
+                applied += 1
+            except Exception as e:
+                logger.error(f"Error aplicando contador {model.__name__}.{field}: {e}")
+                # Devolver al buffer lo que no se pudo aplicar para el próximo flush
+                for key, pending in list(deltas.items())[index:]:
+                    self.add(*key, amount=pending)
+                break
+        return applied
+
+
+buffer = CounterBuffer()
+
+
+def increment(model, pk, field, amount=1):
+    """Incrementa un contador legacy sin bloquear el request"""
+    if getattr(settings, 'LINKS_TRACKING_BACKEND', 'memory') == 'sync':
+        apply_increment(model, pk, field, amount)
+        return
+
+    from .ingestion import get_pipeline
+    buffer.add(model, pk, field, amount)
+    get_pipeline().ensure_worker()
+
+
+def flush():
+    return buffer.flush()
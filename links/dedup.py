@@ -0,0 +1,152 @@
+"""
+Deduplicación de clicks repetidos del mismo visitante.
+
+Un click se identifica por (IP, hash del user agent, objeto clickeado). Cada
+proceso guarda las claves vistas en filtros de Bloom por franjas de tiempo:
+la ventana de ``LINKS_CLICK_DEDUP_WINDOW`` segundos se divide en
+``SLICES`` franjas y al rotar se descarta la más vieja, así la memoria queda
+acotada sin recorrer claves. Un click repetido dentro de la ventana no suma
+al contador legacy ni genera evento.
+
+Con ``LINKS_CLICK_DEDUP_SHARED`` la clave además se registra con
+``cache.add`` en la cache de Django para detectar repeticiones que llegan a
+otro worker. El filtro de Bloom puede dar falsos positivos (un click nuevo
+descartado) con probabilidad ``ERROR_RATE`` mientras no se supere la
+capacidad configurada.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .utils import get_client_ip
+
+SLICES = 4
+ERROR_RATE = 0.001
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+class BloomFilter:
+    """Filtro de Bloom sobre un bytearray con doble hashing"""
+
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest):
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:16], 'little') | 1
+        return [(first + index * second) % self.size for index in range(self.hashes)]
+
+    def __contains__(self, digest):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+
+class ClickDeduplicator:
+    """
+    Ventana deslizante de ``window`` segundos hecha de ``slices`` filtros de
+    Bloom; ``seen`` marca la clave y dice si ya estaba en la ventana.
+    """
+
+    def __init__(self, window, capacity, slices=SLICES, clock=time.monotonic):
+        self.window = window
+        self.slices = slices
+        self.width = window / slices
+        # Cada franja admite la capacidad completa: una ráfaga puede caer en una sola
+        self.capacity = capacity
+        self.clock = clock
+        self._filters = deque()  # (franja, BloomFilter), de la más vieja a la actual
+        self._lock = threading.Lock()
+
+    def _rotate(self, current):
+        # Una repetición a menos de ``window`` segundos cae como mucho
+        # ``slices`` franjas después de la original
+        while self._filters and self._filters[0][0] < current - self.slices:
+            self._filters.popleft()
+        if not self._filters or self._filters[-1][0] != current:
+            self._filters.append((current, BloomFilter(self.capacity)))
+
+    def seen(self, digest):
+        with self._lock:
+            self._rotate(int(self.clock() // self.width))
+            if any(digest in bloom for _, bloom in self._filters):
+                return True
+            self._filters[-1][1].add(digest)
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._filters.clear()
+
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+
+
+def get_deduplicator():
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                _deduplicator = ClickDeduplicator(
+                    getattr(settings, 'LINKS_CLICK_DEDUP_WINDOW', 10),
+                    getattr(settings, 'LINKS_CLICK_DEDUP_CAPACITY', 100_000),
+                )
+    return _deduplicator
+
+
+def click_key(request, kind, object_id):
+    """Digest de (IP, hash del user agent, tipo y id del objeto)"""
+    user_agent = request.META.get('HTTP_USER_AGENT', '')
+    agent_hash = hashlib.sha1(user_agent.encode('utf-8', 'replace')).hexdigest()
+    value = f'{get_client_ip(request)}|{agent_hash}|{kind}:{object_id}'
+    return hashlib.blake2b(value.encode('utf-8', 'replace'), digest_size=16).digest()
+
+
+def is_duplicate_click(request, kind, object_id):
+    """True si el mismo visitante ya hizo este click dentro de la ventana"""
+    if getattr(settings, 'LINKS_CLICK_DEDUP_WINDOW', 10) <= 0:
+        return False
+
+    digest = click_key(request, kind, object_id)
+    duplicate = get_deduplicator().seen(digest)
+    if not duplicate and getattr(settings, 'LINKS_CLICK_DEDUP_SHARED', False):
+        try:
+            duplicate = not cache.add(f'click_dedup:{digest.hex()}', 1, getattr(settings, 'LINKS_CLICK_DEDUP_WINDOW', 10))
+        except Exception:
+            _count('cache_errors')
+    _count('duplicates' if duplicate else 'accepted')
+    return duplicate
+
+
+def get_stats():
+    """Contadores del proceso: accepted, duplicates y cache_errors"""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset():
+    global _deduplicator
+    with _deduplicator_lock:
+        _deduplicator = None
+    with _stats_lock:
+        _stats.clear()
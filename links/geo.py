@@ -0,0 +1,361 @@
+"""
+Geolocalización de IPs para analytics.
+
+La resolución se hace con una cadena de resolvers:
+
+1. ``GeoCache``: LRU con TTL por IP y por prefijo /24 (IPv4).
+2. ``RangeTableResolver``: tabla local de rangos de IP (CSV o MMDB) con
+   búsqueda binaria, sin red (``LINKS_GEOIP_DATABASE``).
+3. ``HTTPResolver``: ipapi.co / ip-api.com, solo desde el worker de fondo
+   (``LINKS_GEOIP_HTTP_FALLBACK``).
+
+En el request solo se consultan la cache y la tabla local. Si la IP no se
+resuelve ahí, el evento se guarda con país vacío y ``GeoEnricher`` lo
+completa después en segundo plano.
+"""
+import bisect
+import csv
+import ipaddress
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = ('Unknown', 'XX')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def parse_ip(ip_address):
+    """Devuelve el objeto ipaddress o None si la IP no es válida"""
+    if not ip_address:
+        return None
+    try:
+        return ipaddress.ip_address(ip_address.strip())
+    except ValueError:
+        return None
+
+
+def is_public_ip(ip_address):
+    ip = parse_ip(ip_address)
+    return ip is not None and ip.is_global
+
+
+class GeoCache:
+    """Cache LRU con expiración, indexada por IP y por prefijo /24"""
+
+    def __init__(self, maxsize=50000, ttl=86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix_key(ip_address):
+        ip = parse_ip(ip_address)
+        if ip is None or ip.version != 4:
+            return None
+        return 'net:' + str(ipaddress.ip_network(f'{ip}/24', strict=False).network_address)
+
+    def get(self, ip_address):
+        now = time.monotonic()
+        with self._lock:
+            for key in (ip_address, self._prefix_key(ip_address)):
+                if key is None or key not in self._data:
+                    continue
+                value, expires_at = self._data[key]
+                if expires_at < now:
+                    del self._data[key]
+                    continue
+                self._data.move_to_end(key)
+                return value
+        return None
+
+    def set(self, ip_address, value):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key in (ip_address, self._prefix_key(ip_address)):
+                if key is None:
+                    continue
+                self._data[key] = (value, expires_at)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RangeTableResolver:
+    """
+    Resolver offline sobre una tabla ordenada de rangos de IP.
+
+    Formato CSV: ``inicio,fin,country_code,country_name`` donde inicio y fin
+    pueden ser IPs o enteros. Los archivos ``.mmdb`` se leen con ``maxminddb``
+    si está instalado.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._reader = None
+        self._starts = {4: [], 6: []}
+        self._rows = {4: [], 6: []}
+        if self.path.endswith('.mmdb'):
+            if maxminddb is None:
+                raise RuntimeError('maxminddb no está instalado; no se puede leer ' + self.path)
+            self._reader = maxminddb.open_database(self.path)
+        else:
+            self._load_csv()
+
+    @staticmethod
+    def _to_int(value):
+        value = value.strip()
+        if value.isdigit():
+            number = int(value)
+            return number, 4 if number <= 0xFFFFFFFF else 6
+        ip = ipaddress.ip_address(value)
+        return int(ip), ip.version
+
+    def _load_csv(self):
+        ranges = {4: [], 6: []}
+        with open(self.path, newline='', encoding='utf-8') as f:
+            for row in csv.reader(f):
+                if len(row) < 3:
+                    continue
+                try:
+                    start, version = self._to_int(row[0])
+                    end, _ = self._to_int(row[1])
+                except ValueError:
+                    continue  # cabecera o fila corrupta
+                code = row[2].strip().upper() or 'XX'
+                name = row[3].strip() if len(row) > 3 and row[3].strip() else code
+                ranges[version].append((start, end, name, code))
+
+        for version, rows in ranges.items():
+            rows.sort()
+            self._starts[version] = [row[0] for row in rows]
+            self._rows[version] = rows
+
+    def __len__(self):
+        return len(self._rows[4]) + len(self._rows[6])
+
+    def resolve(self, ip_address):
+        ip = parse_ip(ip_address)
+        if ip is None:
+            return None
+
+        if self._reader is not None:
+            record = self._reader.get(str(ip)) or {}
+            country = record.get('country') or record.get('registered_country') or {}
+            code = country.get('iso_code')
+            if not code:
+                return None
+            return country.get('names', {}).get('en', code), code
+
+        value = int(ip)
+        index = bisect.bisect_right(self._starts[ip.version], value) - 1
+        if index < 0:
+            return None
+        start, end, name, code = self._rows[ip.version][index]
+        if start <= value <= end:
+            return name, code
+        return None
+
+
+class HTTPResolver:
+    """Servicios externos de geolocalización (bloqueantes, solo en segundo plano)"""
+
+    timeout = 2
+
+    def resolve(self, ip_address):
+        try:
+            # ipapi.co (gratuito, 1000 requests/día)
+            response = requests.get(f'https://ipapi.co/{ip_address}/json/', timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                country = data.get('country_name')
+                if country and country != 'Undefined':
+                    return country, data.get('country_code', 'XX')
+        except Exception as e:
+            logger.debug(f"Error con ipapi.co para {ip_address}: {e}")
+
+        try:
+            response = requests.get(f'http://ip-api.com/json/{ip_address}', timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('status') == 'success':
+                    return data.get('country', 'Unknown'), data.get('countryCode', 'XX')
+        except Exception as e:
+            logger.debug(f"Error con ip-api.com para {ip_address}: {e}")
+
+        return None
+
+
+class ResolverChain:
+    """Consulta la cache y luego cada resolver en orden, cacheando el resultado"""
+
+    def __init__(self, cache, local_resolvers, remote_resolvers=()):
+        self.cache = cache
+        self.local_resolvers = list(local_resolvers)
+        self.remote_resolvers = list(remote_resolvers)
+
+    def resolve(self, ip_address, allow_remote=True):
+        """
+        Devuelve ``(country, country_code)`` o None si no se pudo resolver.
+        Con ``allow_remote=False`` nunca hace llamadas de red.
+        """
+        if not is_public_ip(ip_address):
+            return UNKNOWN
+
+        cached = self.cache.get(ip_address)
+        if cached is not None:
+            return cached
+
+        resolvers = self.local_resolvers + (self.remote_resolvers if allow_remote else [])
+        for resolver in resolvers:
+            result = resolver.resolve(ip_address)
+            if result:
+                self.cache.set(ip_address, result)
+                return result
+        return None
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                cache = GeoCache(
+                    maxsize=_setting('LINKS_GEOIP_CACHE_SIZE', 50000),
+                    ttl=_setting('LINKS_GEOIP_CACHE_TTL', 86400),
+                )
+                local = []
+                database = _setting('LINKS_GEOIP_DATABASE', None)
+                if database:
+                    try:
+                        local.append(RangeTableResolver(database))
+                    except (OSError, RuntimeError) as e:
+                        logger.error(f"No se pudo cargar la base de geolocalización {database}: {e}")
+                remote = [HTTPResolver()] if _setting('LINKS_GEOIP_HTTP_FALLBACK', True) else []
+                _resolver = ResolverChain(cache, local, remote)
+    return _resolver
+
+
+@receiver(setting_changed)
+def _reset_resolver(setting, **kwargs):
+    global _resolver
+    if setting.startswith('LINKS_GEOIP_'):
+        _resolver = None
+
+
+class GeoEnricher:
+    """Completa en segundo plano el país de eventos guardados sin geolocalización"""
+
+    def __init__(self, maxsize=10000, batch_size=200):
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, model, pk, ip_address, background=True):
+        try:
+            self._queue.put_nowait((model, pk, ip_address))
+        except queue.Full:
+            logger.warning("Cola de geolocalización llena; el evento queda sin país")
+            return
+        if background:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='links-geo-enricher', daemon=True)
+                self._worker.start()
+
+    def _next_batch(self, block=True):
+        batch = []
+        try:
+            batch.append(self._queue.get(block=block, timeout=5 if block else None))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def process_pending(self):
+        """Procesa lo encolado en el hilo actual. Devuelve cuántos eventos actualizó."""
+        processed = 0
+        while True:
+            batch = self._next_batch(block=False)
+            if not batch:
+                return processed
+            processed += self._apply(batch)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._apply(batch)
+            except Exception as e:
+                logger.error(f"Error enriqueciendo geolocalización: {e}")
+            finally:
+                close_old_connections()
+
+    def _apply(self, batch):
+        resolver = get_resolver()
+        resolved = {}
+        updates = {}
+        for model, pk, ip_address in batch:
+            if ip_address not in resolved:
+                resolved[ip_address] = resolver.resolve(ip_address) or UNKNOWN
+            updates.setdefault((model, resolved[ip_address]), []).append(pk)
+
+        for (model, (country, country_code)), pks in updates.items():
+            model.objects.filter(pk__in=pks).update(country=country, country_code=country_code)
+        return len(batch)
+
+
+enricher = GeoEnricher()
+
+
+def resolve_country_fast(ip_address):
+    """
+    Resolución sin red para el camino del request.
+    Devuelve ``('', '')`` si la IP debe enriquecerse más tarde.
+    """
+    return get_resolver().resolve(ip_address, allow_remote=False) or ('', '')
+
+
+def enqueue_enrichment(model, instances, background=True):
+    """
+    Encola para geolocalización los eventos guardados con país pendiente.
+    Con ``background=False`` no arranca el worker (ver ``process_pending``).
+    """
+    for instance in instances:
+        if instance.pk and not instance.country and instance.ip_address:
+            enricher.submit(model, instance.pk, instance.ip_address, background=background)
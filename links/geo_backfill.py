@@ -0,0 +1,109 @@
+"""
+Corrección retroactiva del país de eventos guardados sin geolocalización.
+
+``backfill`` recorre cada tabla de eventos por rangos de pk, junta las IPs
+distintas de los eventos con país ``Unknown``/``XX`` (o vacío), las resuelve
+una sola vez con la cadena de ``links.geo`` en un pool de hilos y guarda las
+correcciones con ``bulk_update``. El último pk procesado por métrica se
+reporta después de cada lote para poder retomar una ejecución interrumpida.
+Los rollups de los días corregidos se recalculan al final con
+``refresh_rollups``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .analytics_cache import bump_version
+from .geo import UNKNOWN, get_resolver
+from .rollups import METRIC_MODELS, build_day, get_watermark
+
+MISSING_COUNTRY = Q(country_code__in=['', 'XX']) | Q(country__in=['', 'Unknown'])
+
+# IPs resueltas que se recuerdan entre lotes de una misma ejecución
+MAX_RESOLVED_IPS = 200_000
+
+
+def resolve_ips(ips, pool, allow_remote=False):
+    """``{ip: (country, country_code) | None}`` resolviendo en paralelo"""
+    resolver = get_resolver()
+    ips = list(ips)
+    results = pool.map(lambda ip: resolver.resolve(ip, allow_remote=allow_remote), ips)
+    return dict(zip(ips, results))
+
+
+def backfill(metrics=None, chunk_size=5000, workers=8, allow_remote=False, state=None,
+             affected=None, dry_run=False, progress=None):
+    """
+    Corrige el país de los eventos de ``metrics`` (todas por defecto).
+
+    ``state`` es ``{métrica: último pk procesado}`` y ``affected`` el conjunto
+    de ``(profile_id, día)`` corregidos; ambos se actualizan después de cada
+    lote y ``progress(metric, last_pk, max_pk, totals)`` se llama en ese
+    momento. Devuelve ``(totals, affected)`` con ``{métrica: {'scanned',
+    'updated'}}``.
+    """
+    state = state if state is not None else {}
+    affected = affected if affected is not None else set()
+    totals = {}
+    resolved = {}
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='geo-backfill') as pool:
+        for metric in metrics or METRIC_MODELS:
+            model = METRIC_MODELS[metric]
+            totals[metric] = {'scanned': 0, 'updated': 0}
+            max_pk = model.objects.aggregate(max_pk=Max('pk'))['max_pk'] or 0
+            last_pk = state.get(metric, 0)
+
+            while last_pk < max_pk:
+                chunk_end = min(last_pk + chunk_size, max_pk)
+                rows = list(
+                    model.objects
+                    .filter(MISSING_COUNTRY, pk__gt=last_pk, pk__lte=chunk_end, ip_address__isnull=False)
+                    .values_list('pk', 'ip_address', 'profile_id', 'timestamp')
+                )
+                if len(resolved) > MAX_RESOLVED_IPS:
+                    resolved.clear()
+                pending = {ip for _, ip, _, _ in rows} - resolved.keys()
+                resolved.update(resolve_ips(pending, pool, allow_remote=allow_remote))
+
+                updates = []
+                for pk, ip, profile_id, timestamp in rows:
+                    result = resolved.get(ip)
+                    if not result or result == UNKNOWN:
+                        continue
+                    updates.append(model(pk=pk, country=result[0][:100], country_code=result[1][:2]))
+                    affected.add((profile_id, timezone.localtime(timestamp).date()))
+
+                if updates and not dry_run:
+                    with transaction.atomic():
+                        model.objects.bulk_update(updates, ['country', 'country_code'], batch_size=chunk_size)
+
+                totals[metric]['scanned'] += len(rows)
+                totals[metric]['updated'] += len(updates)
+                last_pk = state[metric] = chunk_end
+                if progress is not None:
+                    progress(metric, last_pk, max_pk, totals[metric])
+    return totals, affected
+
+
+def refresh_rollups(affected):
+    """
+    Recalcula los rollups consolidados de los días corregidos e invalida la
+    cache de analytics de los perfiles afectados. Devuelve los días
+    recalculados (los compactados ya no tienen eventos y se dejan igual).
+    """
+    watermark = get_watermark()
+    days = sorted({day for _, day in affected})
+    rebuilt = []
+    if watermark is not None:
+        for day in days:
+            if watermark.first_day <= day <= watermark.last_day and not (
+                watermark.compacted_through and day <= watermark.compacted_through
+            ):
+                build_day(day)
+                rebuilt.append(day)
+    for profile_id in {profile_id for profile_id, _ in affected}:
+        bump_version(profile_id)
+    return rebuilt
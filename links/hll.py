@@ -0,0 +1,82 @@
+"""
+HyperLogLog para estimar visitantes únicos.
+
+Cada sketch usa ``2 ** PRECISION`` registros de un byte (error estándar de
+~1.04 / sqrt(m), ≈1.6% con la precisión por defecto). Los sketches se
+combinan con un máximo registro a registro, así que el único de varios días
+es la unión de los sketches diarios sin volver a leer eventos. Se guardan
+comprimidos con zlib: un día con pocos visitantes ocupa unas decenas de bytes.
+"""
+import hashlib
+import math
+import zlib
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+_HASH_BITS = 64
+_VALUE_BITS = _HASH_BITS - PRECISION
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_ALPHA = 0.7213 / (1 + 1.079 / REGISTERS)
+_INVERSE_POWERS = [2.0 ** -rank for rank in range(_VALUE_BITS + 2)]
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """Sketch de cardinalidad con registros de un byte"""
+
+    def __init__(self, registers=None):
+        self.registers = bytearray(registers) if registers is not None else bytearray(REGISTERS)
+        if len(self.registers) != REGISTERS:
+            raise ValueError(f'Un sketch debe tener {REGISTERS} registros')
+
+    def add(self, value):
+        hashed = _hash(value)
+        index = hashed >> _VALUE_BITS
+        rank = _VALUE_BITS - (hashed & _VALUE_MASK).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Unión con otro sketch (in place)"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    @classmethod
+    def union(cls, sketches):
+        """Unión de muchos sketches en una sola pasada por los registros"""
+        sketches = list(sketches)
+        if not sketches:
+            return cls()
+        if len(sketches) == 1:
+            return cls(sketches[0].registers)
+        return cls(map(max, *(sketch.registers for sketch in sketches)))
+
+    def count(self):
+        estimate = _ALPHA * REGISTERS * REGISTERS / sum(_INVERSE_POWERS[rank] for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * REGISTERS and zeros:
+            # Cardinalidades pequeñas: linear counting sobre los registros vacíos
+            estimate = REGISTERS * math.log(REGISTERS / zeros)
+        return int(round(estimate))
+
+    def is_empty(self):
+        return not any(self.registers)
+
+    def to_bytes(self):
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(zlib.decompress(bytes(data))) if data else cls()
+
+    @staticmethod
+    def relative_error():
+        return 1.04 / math.sqrt(REGISTERS)
@@ -0,0 +1,365 @@
+"""
+Pipeline de ingesta de eventos de analytics (vistas de perfil y clicks).
+
+Los trackers no escriben en la base de datos: encolan el evento y redirigen
+inmediatamente. Un hilo de fondo por proceso vacía la cola en lotes con
+``bulk_create`` cuando se alcanza ``LINKS_TRACKING_BATCH_SIZE`` o cada
+``LINKS_TRACKING_FLUSH_INTERVAL`` segundos, y en cada ciclo aplica también
+los contadores acumulados en ``links.counters``.
+
+Backends disponibles (``LINKS_TRACKING_BACKEND``):
+
+* ``memory``: cola acotada en memoria del proceso (por defecto).
+* ``sqlite``: spool en un archivo SQLite local; sobrevive reinicios y es
+  compartido por todos los workers de gunicorn de la misma máquina.
+* ``sync``: escribe cada evento en el momento (tests y depuración).
+
+Cada lote se reclama (``claim``), se inserta y solo entonces se confirma
+(``ack``) y se borra de la cola; si la escritura en la BD falla el lote se
+devuelve (``release``) y se reintenta en el siguiente ciclo. En el spool un
+lote reclamado por un proceso que murió vuelve a estar disponible pasados
+``SPOOL_LEASE_SECONDS``.
+
+Cuando la cola está llena el propio request vacía un lote antes de encolar,
+de modo que la memoria queda acotada sin perder eventos. Si además la BD no
+responde, el request no falla: ``LINKS_TRACKING_OVERFLOW`` decide si el evento
+se descarta (``drop``) o se encola por encima del límite (``keep``).
+"""
+import atexit
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import counters, realtime
+from .ua import intern_user_agents
+from .models import ProfileView, LinkClick, SocialIconClick
+
+logger = logging.getLogger(__name__)
+
+EVENT_MODELS = {
+    'profile_view': ProfileView,
+    'link_click': LinkClick,
+    'social_click': SocialIconClick,
+}
+
+# Se envía después de persistir cada lote: sender=modelo, kind=tipo de evento,
+# instances=lista de instancias creadas (con pk cuando la BD lo soporta).
+events_flushed = Signal()
+
+# Segundos tras los que un lote reclamado y no confirmado del spool se reintenta
+SPOOL_LEASE_SECONDS = 300
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class MemoryQueue:
+    """Cola FIFO acotada en memoria del proceso"""
+
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize=maxsize)
+        # Lotes devueltos tras un fallo: se reintentan antes que la cola
+        self._retry = deque()
+        self._retry_lock = threading.Lock()
+
+    def put(self, event, force=False):
+        if force:
+            with self._retry_lock:
+                self._retry.append(event)
+            return True
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            return False
+
+    def claim(self, max_items):
+        """``(token, eventos)``: el token es el propio lote"""
+        events = []
+        with self._retry_lock:
+            while self._retry and len(events) < max_items:
+                events.append(self._retry.popleft())
+        while len(events) < max_items:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events, events
+
+    def ack(self, token):
+        pass
+
+    def release(self, token):
+        with self._retry_lock:
+            self._retry.extendleft(reversed(token))
+
+    def size(self):
+        return self._queue.qsize() + len(self._retry)
+
+
+class SQLiteSpool:
+    """Cola persistente en un archivo SQLite local (sin broker externo)"""
+
+    def __init__(self, path, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), timeout=10, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL, payload TEXT NOT NULL, '
+            'claim TEXT, claimed_at REAL)'
+        )
+        # Spools creados antes de que existieran los reclamos
+        columns = {row[1] for row in self._conn.execute('PRAGMA table_info(events)')}
+        for column, kind in (('claim', 'TEXT'), ('claimed_at', 'REAL')):
+            if column not in columns:
+                self._conn.execute(f'ALTER TABLE events ADD COLUMN {column} {kind}')
+
+    def put(self, event, force=False):
+        kind, fields = event
+        payload = json.dumps({
+            key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in fields.items()
+        })
+        with self._lock:
+            if not force and self._size() >= self.maxsize:
+                return False
+            self._conn.execute('INSERT INTO events (kind, payload) VALUES (?, ?)', (kind, payload))
+        return True
+
+    def claim(self, max_items):
+        """
+        ``(token, eventos)``: marca el lote como reclamado sin borrarlo; se borra
+        con ``ack`` cuando está en la BD o se libera con ``release``
+        """
+        token = uuid.uuid4().hex
+        now = time.time()
+        available = 'claim IS NULL OR claimed_at < ?'
+        with self._lock:
+            # BEGIN IMMEDIATE evita que dos workers reclamen el mismo lote
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    f'SELECT id, kind, payload FROM events WHERE {available} ORDER BY id LIMIT ?',
+                    (now - SPOOL_LEASE_SECONDS, max_items),
+                ).fetchall()
+                if rows:
+                    self._conn.execute(
+                        f'UPDATE events SET claim = ?, claimed_at = ? WHERE id BETWEEN ? AND ? AND ({available})',
+                        (token, now, rows[0][0], rows[-1][0], now - SPOOL_LEASE_SECONDS),
+                    )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+        events = []
+        for _, kind, payload in rows:
+            fields = json.loads(payload)
+            if fields.get('timestamp'):
+                fields['timestamp'] = datetime.fromisoformat(fields['timestamp'])
+            events.append((kind, fields))
+        return token, events
+
+    def ack(self, token):
+        with self._lock:
+            self._conn.execute('DELETE FROM events WHERE claim = ?', (token,))
+
+    def release(self, token):
+        with self._lock:
+            self._conn.execute('UPDATE events SET claim = NULL, claimed_at = NULL WHERE claim = ?', (token,))
+
+    def size(self):
+        with self._lock:
+            return self._size()
+
+    def _size(self):
+        return self._conn.execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+
+class IngestionPipeline:
+    """Encola eventos y los persiste en lotes desde un hilo de fondo"""
+
+    def __init__(self, backend, batch_size, flush_interval):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def submit(self, kind, fields):
+        event = (kind, fields)
+        if not self.backend.put(event):
+            # Cola llena: el request vacía un lote (backpressure) y reintenta
+            try:
+                self.flush(max_batches=1)
+                if not self.backend.put(event):
+                    persist_events([event])
+                    return
+            except Exception as e:
+                self._overflow(event, e)
+                return
+        self.ensure_worker()
+        if self.backend.size() >= self.batch_size:
+            self._wakeup.set()
+
+    def _overflow(self, event, error):
+        """Cola llena y BD caída: conservar o descartar el evento según LINKS_TRACKING_OVERFLOW"""
+        if _setting('LINKS_TRACKING_OVERFLOW', 'drop') == 'keep':
+            self.backend.put(event, force=True)
+            self.ensure_worker()
+            logger.error(f"Cola de analytics llena y BD no disponible, evento {event[0]} encolado igual: {error}")
+        else:
+            logger.error(f"Cola de analytics llena y BD no disponible, evento {event[0]} descartado: {error}")
+
+    def flush(self, max_batches=None):
+        """Persiste los eventos pendientes. Devuelve cuántos se escribieron."""
+        written = 0
+        batches = 0
+        with self._flush_lock:
+            while max_batches is None or batches < max_batches:
+                token, events = self.backend.claim(self.batch_size)
+                if not events:
+                    break
+                try:
+                    results = insert_events(events)
+                except Exception:
+                    # El lote vuelve a la cola y se reintenta en el próximo ciclo
+                    self.backend.release(token)
+                    raise
+                self.backend.ack(token)
+                written += send_flushed(results)
+                batches += 1
+            if max_batches is None:
+                counters.flush()
+        return written
+
+    def ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='links-ingestion', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error persistiendo eventos de analytics: {e}")
+            finally:
+                close_old_connections()
+
+
+def insert_events(events):
+    """
+    Agrupa los eventos por tipo y los inserta con bulk_create, todos en una
+    transacción (un lote reintentado no queda escrito a medias).
+    Devuelve ``[(modelo, tipo, instancias)]``.
+    """
+    grouped = {}
+    for kind, fields in events:
+        grouped.setdefault(kind, []).append(fields)
+
+    batch_size = _setting('LINKS_TRACKING_BATCH_SIZE', 500)
+    results = []
+    with transaction.atomic():
+        for kind, rows in grouped.items():
+            model = EVENT_MODELS[kind]
+            intern_user_agents(rows)
+            objs = [model(**fields) for fields in rows]
+            try:
+                with transaction.atomic():
+                    instances = model.objects.bulk_create(objs, batch_size=batch_size)
+            except IntegrityError:
+                # Algún enlace/perfil se eliminó entre el click y el flush:
+                # insertar uno a uno descartando solo las filas huérfanas
+                instances = []
+                for obj in objs:
+                    try:
+                        with transaction.atomic():
+                            obj.save(force_insert=True)
+                        instances.append(obj)
+                    except IntegrityError:
+                        logger.warning(f"Evento {kind} descartado: referencia inexistente")
+            results.append((model, kind, instances))
+    return results
+
+
+def send_flushed(results):
+    """Envía ``events_flushed`` por cada tipo insertado. Devuelve cuántos eventos se escribieron."""
+    written = 0
+    for model, kind, instances in results:
+        written += len(instances)
+        events_flushed.send(sender=model, kind=kind, instances=instances)
+    return written
+
+
+def persist_events(events):
+    """Inserta los eventos y avisa a los receptores de ``events_flushed``"""
+    return send_flushed(insert_events(events))
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                maxsize = _setting('LINKS_TRACKING_QUEUE_SIZE', 10000)
+                if _setting('LINKS_TRACKING_BACKEND', 'memory') == 'sqlite':
+                    backend = SQLiteSpool(_setting('LINKS_TRACKING_SPOOL_PATH', 'tracking_spool.sqlite3'), maxsize)
+                else:
+                    backend = MemoryQueue(maxsize)
+                _pipeline = IngestionPipeline(
+                    backend,
+                    batch_size=_setting('LINKS_TRACKING_BATCH_SIZE', 500),
+                    flush_interval=_setting('LINKS_TRACKING_FLUSH_INTERVAL', 2.0),
+                )
+                atexit.register(_pipeline.flush)
+    return _pipeline
+
+
+def track_event(kind, **fields):
+    """
+    Registra un evento de analytics sin bloquear el request.
+    ``fields`` son los campos del modelo (p. ej. ``profile_id``, ``link_id``).
+    """
+    if kind not in EVENT_MODELS:
+        raise ValueError(f"Tipo de evento desconocido: {kind}")
+    fields.setdefault('timestamp', timezone.now())
+    realtime.record_event(kind, fields.get('profile_id'), fields['timestamp'], fields.get('ip_address'))
+
+    if _setting('LINKS_TRACKING_BACKEND', 'memory') == 'sync':
+        persist_events([(kind, fields)])
+        return
+    get_pipeline().submit(kind, fields)
+
+
+def flush():
+    """Vacía la cola y los contadores del proceso actual de forma síncrona"""
+    if _pipeline is None:
+        counters.flush()
+        return 0
+    return _pipeline.flush()
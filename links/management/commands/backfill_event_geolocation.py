@@ -0,0 +1,106 @@
+import json
+import os
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from links.analytics_cache import is_process_local_cache
+from links.geo_backfill import backfill, refresh_rollups
+from links.rollups import METRIC_MODELS
+
+
+class Command(BaseCommand):
+    help = (
+        'Corrige el país de los eventos de analytics guardados como Unknown/XX. '
+        'Requiere una cache compartida para invalidar al instante la cache de analytics de los workers'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metric', action='append', choices=sorted(METRIC_MODELS),
+                            help='Métrica a corregir (repetible; por defecto todas)')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rango de pks por lote')
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Hilos que resuelven IPs en paralelo')
+        parser.add_argument('--allow-remote', action='store_true',
+                            help='Usar también los servicios HTTP de geolocalización (lento, con límites de uso)')
+        parser.add_argument('--state-file', default=str(settings.BASE_DIR / 'geo_backfill_state.json'),
+                            help='Archivo con el último pk procesado para retomar la ejecución')
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignorar el estado guardado y empezar desde el principio')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo contar los eventos que se corregirían')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size debe ser al menos 1')
+        state_file = options['state_file']
+        state, affected = ({}, set()) if options['restart'] else self._load_state(state_file)
+        if state:
+            resumed = ', '.join(f'{metric} > {pk}' for metric, pk in sorted(state.items()))
+            self.stdout.write(self.style.WARNING(f'Retomando desde pk {resumed}'))
+
+        def progress(metric, last_pk, max_pk, totals):
+            if not options['dry_run']:
+                self._save_state(state_file, state, affected)
+            percent = last_pk * 100 // max_pk if max_pk else 100
+            self.stdout.write(
+                f"{metric}: pk {last_pk}/{max_pk} ({percent}%) - "
+                f"{totals['scanned']} revisados, {totals['updated']} corregidos"
+            )
+
+        totals, affected = backfill(
+            metrics=options['metric'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+            allow_remote=options['allow_remote'],
+            state=state,
+            affected=affected,
+            dry_run=options['dry_run'],
+            progress=progress,
+        )
+
+        verb = 'a corregir' if options['dry_run'] else 'corregidos'
+        for metric, counts in totals.items():
+            self.stdout.write(f"{metric}: {counts['updated']} de {counts['scanned']} eventos {verb}")
+        if options['dry_run']:
+            return
+
+        rebuilt = refresh_rollups(affected)
+        if rebuilt:
+            self.stdout.write(f'Rollups recalculados para {len(rebuilt)} días ({rebuilt[0]} a {rebuilt[-1]})')
+        if rebuilt and is_process_local_cache():
+            # bump_version solo invalida la cache de este proceso
+            ttl = getattr(settings, 'LINKS_ANALYTICS_CACHE_TTL', 300)
+            self.stdout.write(self.style.WARNING(
+                'La cache es local del proceso: los workers web verán los países corregidos '
+                f'cuando venza LINKS_ANALYTICS_CACHE_TTL ({ttl}s). '
+                'Use una cache compartida (CACHE_BACKEND=file) para invalidarlos al instante'
+            ))
+        if os.path.exists(state_file):
+            os.remove(state_file)
+        self.stdout.write(self.style.SUCCESS('Geolocalización de eventos completada'))
+
+    def _load_state(self, path):
+        """Último pk por métrica y (perfil, día) ya corregidos de una ejecución interrumpida"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            state = {metric: int(pk) for metric, pk in data['last_pk'].items() if metric in METRIC_MODELS}
+            affected = {(profile_id, date.fromisoformat(day)) for profile_id, day in data['affected']}
+        except FileNotFoundError:
+            return {}, set()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise CommandError(f'No se pudo leer {path}: {e}; use --restart')
+        return state, affected
+
+    def _save_state(self, path, state, affected):
+        data = {
+            'last_pk': state,
+            'affected': sorted([profile_id, day.isoformat()] for profile_id, day in affected),
+        }
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temporary, path)
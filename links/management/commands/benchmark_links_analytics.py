@@ -0,0 +1,93 @@
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from links import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Carga perfiles sintéticos con millones de eventos y mide latencia (percentiles) y consultas '
+            'de los endpoints de analytics y los trackers; escribe un reporte JSON comparable entre commits')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', type=int, default=2, help='Perfiles sintéticos a crear')
+        parser.add_argument('--links', type=int, default=10, help='Enlaces por perfil')
+        parser.add_argument('--events', type=int, default=1_000_000, help='Eventos totales a cargar')
+        parser.add_argument('--days', type=int, default=90, help='Días sobre los que se reparten los eventos')
+        parser.add_argument('--iterations', type=int, default=20, help='Llamadas medidas por endpoint')
+        parser.add_argument('--time-ranges', default='7d,30d,90d', help='Rangos para los endpoints con time_range')
+        parser.add_argument('--skip-seed', action='store_true', help='Reusar los perfiles bench- existentes')
+        parser.add_argument('--skip-rollups', action='store_true',
+                            help='No consolidar rollups/sketches tras la carga (mide el camino crudo)')
+        parser.add_argument('--cleanup', action='store_true', help='Borrar los datos de benchmark al terminar')
+        parser.add_argument('--output', help='Archivo del reporte JSON (por defecto stdout)')
+        parser.add_argument('--compare', help='Reporte JSON anterior contra el que mostrar diferencias')
+        parser.add_argument('--force', action='store_true', help='Permitir la ejecución con DEBUG=False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('El benchmark carga millones de filas: úselo en una base de desarrollo o pase --force')
+
+        if not options['skip_seed'] and not benchmarks.bench_profiles().exists():
+            self.stderr.write(f"Cargando {options['events']} eventos sintéticos...")
+            benchmarks.seed(profiles=options['profiles'], links=options['links'], events=options['events'],
+                            days=options['days'], stdout=self.stderr)
+            if not options['skip_rollups']:
+                call_command('build_analytics_rollups', full=True, stdout=self.stderr)
+                call_command('build_analytics_sketches', stdout=self.stderr)
+
+        profile = benchmarks.bench_profiles().first()
+        if profile is None:
+            raise CommandError('No hay perfiles de benchmark: ejecute sin --skip-seed')
+
+        time_ranges = [value.strip() for value in options['time_ranges'].split(',') if value.strip()]
+        setup_test_environment()
+        try:
+            results = benchmarks.run(profile, iterations=max(options['iterations'], 1), time_ranges=time_ranges)
+        finally:
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'commit': self._git_commit(),
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'tracking_backend': getattr(settings, 'LINKS_TRACKING_BACKEND', 'memory'),
+                'iterations': options['iterations'],
+                'dataset': benchmarks.dataset_stats(),
+            },
+            'results': results,
+        }
+        body = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(body + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Reporte escrito en {options['output']}"))
+        else:
+            self.stdout.write(body)
+
+        if options['compare']:
+            try:
+                with open(options['compare']) as previous:
+                    old = json.load(previous)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'No se pudo leer el reporte anterior: {e}')
+            for endpoint, mode, metric, before, after in benchmarks.compare(old, report):
+                change = f'{(after - before) / before * 100:+.1f}%' if before else 'n/a'
+                self.stderr.write(f'{endpoint:<40} {mode:<5} {metric:<12} {before:>10} -> {after:<10} {change}')
+
+        if options['cleanup']:
+            self.stderr.write(f'{benchmarks.cleanup()} filas de benchmark eliminadas')
+
+    def _git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=settings.BASE_DIR, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
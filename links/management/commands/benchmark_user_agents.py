@@ -0,0 +1,75 @@
+import re
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from user_agents import parse
+
+from links import ua
+
+DEFAULT_CORPUS = Path(__file__).resolve().parents[2] / 'data' / 'user_agents.txt'
+
+
+def legacy_classify(user_agent_string):
+    """Implementación anterior: un re.search por patrón y parse en cada request"""
+    is_bot = False
+    if user_agent_string:
+        lowered = user_agent_string.lower()
+        is_bot = any(re.search(pattern, lowered) for pattern in ua.BOT_PATTERNS)
+    if not user_agent_string:
+        return is_bot, 'desktop'
+    parsed = parse(user_agent_string)
+    if parsed.is_mobile:
+        return is_bot, 'mobile'
+    elif parsed.is_tablet:
+        return is_bot, 'tablet'
+    return is_bot, 'desktop'
+
+
+class Command(BaseCommand):
+    help = 'Compara la clasificación de user agents anterior con la precompilada y memoizada'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', default=str(DEFAULT_CORPUS),
+                            help='Archivo con un user agent por línea')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Pasadas sobre el corpus por implementación')
+
+    def handle(self, *args, **options):
+        try:
+            lines = Path(options['corpus']).read_text(encoding='utf-8').splitlines()
+        except OSError as exc:
+            raise CommandError(f'No se pudo leer el corpus: {exc}')
+        corpus = [line.strip() for line in lines if line.strip() and not line.startswith('#')]
+        if not corpus:
+            raise CommandError('El corpus está vacío')
+
+        mismatches = [agent for agent in corpus if legacy_classify(agent) != ua.classify(agent)]
+        if mismatches:
+            raise CommandError(f'{len(mismatches)} user agents clasificados distinto, p. ej.: {mismatches[0]}')
+
+        iterations = max(options['iterations'], 1)
+        calls = len(corpus) * iterations
+        ua._classify_cached.cache_clear()
+
+        results = [
+            ('anterior', self._measure(legacy_classify, corpus, iterations)),
+            ('precompilado sin cache', self._measure(ua._classify, corpus, iterations)),
+            ('precompilado + LRU', self._measure(ua.classify, corpus, iterations)),
+        ]
+
+        self.stdout.write(f'{len(corpus)} user agents x {iterations} pasadas = {calls} llamadas')
+        baseline = results[0][1]
+        for name, elapsed in results:
+            self.stdout.write(
+                f'{name:<24} {elapsed * 1e6 / calls:9.2f} µs/llamada  x{baseline / elapsed:6.1f}'
+            )
+        info = ua.cache_info()
+        self.stdout.write(self.style.SUCCESS(f'LRU: {info.hits} hits, {info.misses} misses, {info.currsize} entradas'))
+
+    def _measure(self, classify, corpus, iterations):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for agent in corpus:
+                classify(agent)
+        return time.perf_counter() - start
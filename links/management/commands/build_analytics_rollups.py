@@ -0,0 +1,78 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from links.models import RollupWatermark
+from links.rollups import METRIC_MODELS, build_day, get_watermark
+
+
+class Command(BaseCommand):
+    help = 'Consolida los eventos de analytics de links en rollups diarios (días cerrados)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2,
+                            help='Días cerrados recientes a recalcular aunque ya estén consolidados')
+        parser.add_argument('--from', dest='from_date',
+                            help='Recalcular desde esta fecha (YYYY-MM-DD)')
+        parser.add_argument('--full', action='store_true',
+                            help='Recalcular desde el primer evento registrado')
+
+    def handle(self, *args, **options):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        watermark = get_watermark()
+
+        if options['from_date']:
+            try:
+                start = date.fromisoformat(options['from_date'])
+            except ValueError:
+                raise CommandError('--from debe tener el formato YYYY-MM-DD')
+        elif options['full'] or watermark is None:
+            start = self._first_event_day() or yesterday
+        else:
+            start = min(watermark.last_day + timedelta(days=1),
+                        yesterday - timedelta(days=max(options['days'], 1) - 1))
+
+        # Los días compactados ya no tienen eventos crudos: sus rollups son definitivos
+        if watermark is not None and watermark.compacted_through and start <= watermark.compacted_through:
+            start = watermark.compacted_through + timedelta(days=1)
+            self.stdout.write(self.style.WARNING(
+                f'Días hasta el {watermark.compacted_through} compactados: se recalcula desde el {start}'
+            ))
+
+        if start > yesterday:
+            self.stdout.write(self.style.SUCCESS('No hay días cerrados pendientes de consolidar'))
+            return
+
+        day = start
+        total_rows = 0
+        while day <= yesterday:
+            rows = build_day(day)
+            total_rows += rows
+            self.stdout.write(f'{day}: {rows} filas')
+            day += timedelta(days=1)
+
+        # El watermark solo cubre un rango continuo de días consolidados
+        if watermark is None:
+            watermark = RollupWatermark(first_day=start, last_day=yesterday)
+        elif start <= watermark.last_day + timedelta(days=1):
+            watermark.first_day = min(watermark.first_day, start)
+            watermark.last_day = max(watermark.last_day, yesterday)
+        else:
+            watermark.first_day, watermark.last_day = start, yesterday
+        watermark.save()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rollups consolidados del {watermark.first_day} al {watermark.last_day} ({total_rows} filas recalculadas)'
+        ))
+
+    def _first_event_day(self):
+        firsts = [
+            model.objects.aggregate(first=Min('timestamp'))['first']
+            for model in METRIC_MODELS.values()
+        ]
+        firsts = [value for value in firsts if value is not None]
+        if not firsts:
+            return None
+        return timezone.localtime(min(firsts)).date()
@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from links.retention import MIN_RETENTION_DAYS, compact_events, normalize_user_agents
+from links.rollups import get_watermark
+
+
+class Command(BaseCommand):
+    help = 'Consolida en rollups y borra los eventos de analytics más antiguos que la retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=getattr(settings, 'LINKS_RETENTION_DAYS', 365),
+                            help=f'Días de eventos crudos a conservar (por defecto LINKS_RETENTION_DAYS, mínimo {MIN_RETENTION_DAYS})')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Filas por lote de borrado/actualización')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo contar los eventos que se borrarían')
+        parser.add_argument('--skip-user-agents', action='store_true',
+                            help='No migrar los user agents en texto de eventos legados')
+
+    def handle(self, *args, **options):
+        if options['days'] < MIN_RETENTION_DAYS:
+            raise CommandError(
+                f'--days debe ser al menos {MIN_RETENTION_DAYS} (el rango más largo del dashboard)'
+            )
+        chunk_size = max(options['chunk_size'], 1)
+        cutoff_day = timezone.localdate() - timedelta(days=options['days'])
+
+        # Consolidar primero todo lo pendiente para no perder datos al borrar
+        watermark = get_watermark()
+        if watermark is None or watermark.last_day < cutoff_day - timedelta(days=1):
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING('Hay días sin consolidar: se ejecutaría build_analytics_rollups'))
+            else:
+                call_command('build_analytics_rollups', full=watermark is None, stdout=self.stdout)
+
+        try:
+            result = compact_events(cutoff_day, chunk_size=chunk_size, dry_run=options['dry_run'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        verb = 'a borrar' if options['dry_run'] else 'borrados'
+        for metric, count in result.items():
+            self.stdout.write(f'{metric}: {count} eventos {verb} anteriores al {cutoff_day}')
+
+        if not options['skip_user_agents'] and not options['dry_run']:
+            for metric, count in normalize_user_agents(chunk_size=chunk_size).items():
+                if count:
+                    self.stdout.write(f'{metric}: {count} user agents normalizados')
+
+        self.stdout.write(self.style.SUCCESS('Retención de analytics aplicada'))
@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from links import export
+from links.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Exporta en streaming los eventos crudos de analytics de un perfil (CSV o NDJSON)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help='Slug del perfil')
+        parser.add_argument('--from', dest='start', help='Fecha inicial (YYYY-MM-DD, por defecto hace 30 días)')
+        parser.add_argument('--to', dest='end', help='Fecha final inclusive (YYYY-MM-DD, por defecto hoy)')
+        parser.add_argument('--output-format', choices=list(export.FORMATS), default='csv')
+        parser.add_argument('--events', help='Tipos separados por coma: profile_view, link_click, social_click')
+        parser.add_argument('--gzip', action='store_true', help='Comprimir la salida con gzip')
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE,
+                            help='Filas por lote leído de la base de datos')
+        parser.add_argument('-o', '--output', help='Archivo de salida (por defecto stdout)')
+
+    def handle(self, *args, **options):
+        profile = Profile.objects.filter(slug=options['slug']).only('id', 'slug').first()
+        if profile is None:
+            raise CommandError(f"No existe el perfil {options['slug']}")
+        try:
+            since, until = export.parse_date_range(options['start'], options['end'])
+            kinds = export.parse_kinds(options['events'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        chunks = export.export_stream(
+            profile, since, until, fmt=options['output_format'], kinds=kinds,
+            compress=options['gzip'], chunk_size=max(options['chunk_size'], 1),
+        )
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                written = sum(output.write(chunk) for chunk in chunks)
+            self.stderr.write(self.style.SUCCESS(f"{written} bytes escritos en {options['output']}"))
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
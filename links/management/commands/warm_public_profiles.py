@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from links.analytics_cache import is_process_local_cache
+from links.models import Profile
+from links.public_profile import public_queryset, store_document
+
+
+class Command(BaseCommand):
+    help = 'Precalcula y cachea el documento público de los perfiles (los slugs de /profiles/slugs/)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Slugs a precalcular (por defecto todos)')
+        parser.add_argument('--chunk-size', type=int, default=200,
+                            help='Perfiles cargados por consulta')
+
+    def handle(self, *args, **options):
+        if is_process_local_cache():
+            # La cache de este proceso desaparece al terminar el comando
+            raise CommandError(
+                'La cache por defecto es local al proceso (LocMem); precalentar no tiene efecto '
+                'en los workers. Configure una cache compartida (CACHE_BACKEND=file).'
+            )
+        slugs = options['slugs'] or list(Profile.objects.values_list('slug', flat=True))
+        chunk_size = max(options['chunk_size'], 1)
+
+        warmed = 0
+        for index in range(0, len(slugs), chunk_size):
+            for profile in public_queryset().filter(slug__in=slugs[index:index + chunk_size]):
+                store_document(profile)
+                warmed += 1
+
+        missing = len(slugs) - warmed
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} slugs no encontrados'))
+        self.stdout.write(self.style.SUCCESS(f'{warmed} perfiles públicos cacheados'))
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('links', '0023_rename_links_socia_social__0b7e6c_idx_links_socia_social__d8be08_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='linkclick',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='profileview',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='socialiconclick',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
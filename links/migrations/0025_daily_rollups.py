@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('links', '0024_event_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_day', models.DateField()),
+                ('last_day', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('metric', models.CharField(choices=[('view', 'Vista de perfil'), ('click', 'Click en enlace'), ('social', 'Click en red social')], max_length=10)),
+                ('dimension', models.CharField(help_text='Ej: total, link, device, country, category, referrer', max_length=20)),
+                ('key', models.CharField(blank=True, help_text='Valor de la dimensión, ej: mobile, PE, id del enlace', max_length=255)),
+                ('label', models.CharField(blank=True, help_text='Nombre legible del valor, ej: Peru', max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='links.profile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['profile', 'metric', 'dimension', 'day'], name='links_daily_profile_30d8f6_idx'), models.Index(fields=['day'], name='links_daily_day_0b5743_idx')],
+                'unique_together': {('profile', 'day', 'metric', 'dimension', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+EVENT_TABLES = ['links_profileview', 'links_linkclick', 'links_socialiconclick']
+
+
+def create_brin_indexes(apps, schema_editor):
+    # Solo PostgreSQL: índices BRIN sobre timestamp (tablas append-only ordenadas
+    # por tiempo), muy pequeños y útiles para los borrados por rango de retención
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in EVENT_TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {table}_timestamp_brin ON {table} USING brin (timestamp)'
+        )
+
+
+def drop_brin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in EVENT_TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_timestamp_brin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('links', '0025_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(help_text='SHA-1 del user agent', max_length=40, unique=True)),
+                ('value', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='rollupwatermark',
+            name='compacted_through',
+            field=models.DateField(blank=True, help_text='Último día cuyos eventos crudos se eliminaron: sus rollups no se recalculan', null=True),
+        ),
+        migrations.AlterField(
+            model_name='linkclick',
+            name='user_agent',
+            field=models.TextField(blank=True, help_text='Legado: los eventos nuevos usan agent'),
+        ),
+        migrations.AlterField(
+            model_name='profileview',
+            name='user_agent',
+            field=models.TextField(blank=True, help_text='Legado: los eventos nuevos usan agent'),
+        ),
+        migrations.AlterField(
+            model_name='socialiconclick',
+            name='user_agent',
+            field=models.TextField(blank=True, help_text='Legado: los eventos nuevos usan agent'),
+        ),
+        migrations.AddField(
+            model_name='linkclick',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='links.useragent'),
+        ),
+        migrations.AddField(
+            model_name='profileview',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='links.useragent'),
+        ),
+        migrations.AddField(
+            model_name='socialiconclick',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='links.useragent'),
+        ),
+        migrations.RunPython(create_brin_indexes, drop_brin_indexes),
+    ]
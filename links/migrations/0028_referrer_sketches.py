@@ -0,0 +1,28 @@
+# Generated by Django 5.2.3 on 2026-10-17 22:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('links', '0027_visitor_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferrerSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('metric', models.CharField(choices=[('view', 'Vista de perfil'), ('click', 'Click en enlace'), ('social', 'Click en red social')], max_length=10)),
+                ('data', models.JSONField(default=dict, help_text="{'k', 'total', 'counters': {host: [count, error]}}")),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='referrer_sketches', to='links.profile')),
+            ],
+            options={
+                'unique_together': {('profile', 'day', 'metric')},
+            },
+        ),
+    ]
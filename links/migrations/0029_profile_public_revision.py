@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-17 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('links', '0028_referrer_sketches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='public_revision',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Último cambio del documento público (ver links.public_profile)', null=True),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 from django.db.models.signals import pre_save
+from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
@@ -50,6 +51,9 @@ class Profile(models.Model):
     custom_css = models.TextField(blank=True, default='', help_text="CSS personalizado para el perfil")
     animations = models.JSONField(default=list, blank=True, help_text="Configuración de animaciones del perfil")
 
+    # --- Documento público ---
+    public_revision = models.DateTimeField(null=True, blank=True, editable=False, help_text="Último cambio del documento público (ver links.public_profile)")
+
     # --- Campos de Enlaces ---
     
 
@@ -135,12 +139,23 @@ class SocialIcon(models.Model):
 
 # ===== MODELOS DE ANALYTICS =====
 
+class UserAgent(models.Model):
+    """User agent distinto, referenciado por los eventos en lugar de repetir el texto"""
+    hash = models.CharField(max_length=40, unique=True, help_text="SHA-1 del user agent")
+    value = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.value[:80]
+
+
 class ProfileView(models.Model):
     """Registra cada vista a un perfil"""
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='profile_views')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
+    user_agent = models.TextField(blank=True, help_text="Legado: los eventos nuevos usan agent")
+    agent = models.ForeignKey(UserAgent, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     referrer = models.URLField(blank=True, null=True)
     
     # Información del dispositivo
@@ -169,9 +184,10 @@ class LinkClick(models.Model):
     """Registra cada click en un enlace específico"""
     link = models.ForeignKey(Link, on_delete=models.CASCADE, related_name='link_clicks')
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='all_link_clicks')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
+    user_agent = models.TextField(blank=True, help_text="Legado: los eventos nuevos usan agent")
+    agent = models.ForeignKey(UserAgent, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     referrer = models.URLField(blank=True, null=True)
     
     # Información del dispositivo
@@ -201,9 +217,10 @@ class SocialIconClick(models.Model):
     """Registra cada click en un icono de red social específico"""
     social_icon = models.ForeignKey(SocialIcon, on_delete=models.CASCADE, related_name='social_clicks')
     profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='all_social_clicks')
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
+    user_agent = models.TextField(blank=True, help_text="Legado: los eventos nuevos usan agent")
+    agent = models.ForeignKey(UserAgent, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
     referrer = models.URLField(blank=True, null=True)
     
     # Información del dispositivo
@@ -252,3 +269,75 @@ class AnalyticsCache(models.Model):
     def is_expired(self):
         from django.utils import timezone
         return timezone.now() > self.expires_at
+
+
+# ===== ROLLUPS DIARIOS DE ANALYTICS =====
+
+class DailyRollup(models.Model):
+    """Conteos diarios pre-agregados por perfil, métrica y dimensión"""
+    METRIC_CHOICES = [
+        ('view', 'Vista de perfil'),
+        ('click', 'Click en enlace'),
+        ('social', 'Click en red social'),
+    ]
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    metric = models.CharField(max_length=10, choices=METRIC_CHOICES)
+    dimension = models.CharField(max_length=20, help_text="Ej: total, link, device, country, category, referrer")
+    key = models.CharField(max_length=255, blank=True, help_text="Valor de la dimensión, ej: mobile, PE, id del enlace")
+    label = models.CharField(max_length=255, blank=True, help_text="Nombre legible del valor, ej: Peru")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['profile', 'day', 'metric', 'dimension', 'key']
+        indexes = [
+            models.Index(fields=['profile', 'metric', 'dimension', 'day']),
+            models.Index(fields=['day']),
+        ]
+
+    def __str__(self):
+        return f"{self.profile_id} {self.day} {self.metric}/{self.dimension}={self.key}: {self.count}"
+
+
+class RollupWatermark(models.Model):
+    """Rango continuo de días cerrados ya consolidados en DailyRollup (fila única)"""
+    first_day = models.DateField()
+    last_day = models.DateField()
+    compacted_through = models.DateField(
+        null=True, blank=True,
+        help_text="Último día cuyos eventos crudos se eliminaron: sus rollups no se recalculan",
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Rollups del {self.first_day} al {self.last_day}"
+
+
+class VisitorSketch(models.Model):
+    """HyperLogLog de los visitantes (IPs) de un perfil en un día (ver links.hll)"""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='visitor_sketches')
+    day = models.DateField()
+    registers = models.BinaryField(help_text="Registros del sketch comprimidos con zlib")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['profile', 'day']
+
+    def __str__(self):
+        return f"Visitantes de {self.profile_id} el {self.day}"
+
+
+class ReferrerSketch(models.Model):
+    """Top-K (Space-Saving) de referrers de un perfil en un día (ver links.referrers)"""
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='referrer_sketches')
+    day = models.DateField()
+    metric = models.CharField(max_length=10, choices=DailyRollup.METRIC_CHOICES)
+    data = models.JSONField(default=dict, help_text="{'k', 'total', 'counters': {host: [count, error]}}")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['profile', 'day', 'metric']
+
+    def __str__(self):
+        return f"Referrers de {self.profile_id} el {self.day} ({self.metric})"
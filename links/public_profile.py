@@ -0,0 +1,124 @@
+"""
+Documento JSON precalculado de la página pública de cada perfil.
+
+El documento se serializa una vez (al guardar el perfil, sus enlaces o sus
+iconos, o con ``warm_public_profiles``) y se guarda en la cache junto con su
+ETag fuerte y la revisión del perfil (``Profile.public_revision``), que cada
+cambio renueva en la misma transacción. ``public_profile`` lee solo la
+revisión de la BD: si coincide con la cacheada responde desde la cache (un
+``If-None-Match`` que coincide se contesta con 304); si no, reconstruye. Así
+los workers con cache propia (LocMem) nunca sirven un documento viejo.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Profile
+from .serializers import PublicProfileSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def _document_key(slug):
+    return f'public_profile:{slug}'
+
+
+def _slug_key(profile_id):
+    return f'public_profile_slug_{profile_id}'
+
+
+def public_queryset():
+    return Profile.objects.select_related('user').prefetch_related('links', 'social_icons')
+
+
+def render_document(profile):
+    """``(etag, body)`` del documento público de un perfil"""
+    data = PublicProfileSerializer(profile).data
+    body = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+    return etag, body
+
+
+def store_document(profile):
+    """Serializa y cachea el documento de un perfil ya cargado (con prefetch)"""
+    etag, body = render_document(profile)
+    timeout = getattr(settings, 'LINKS_PUBLIC_PROFILE_CACHE_TTL', 300)
+    try:
+        # Si el slug cambió, el documento viejo no debe seguir sirviéndose
+        old_slug = cache.get(_slug_key(profile.id))
+        if old_slug and old_slug != profile.slug:
+            cache.delete(_document_key(old_slug))
+        cache.set_many({
+            _document_key(profile.slug): (profile.public_revision, etag, body),
+            _slug_key(profile.id): profile.slug,
+        }, timeout)
+    except Exception as e:
+        logger.warning(f"No se pudo cachear el perfil público {profile.slug}: {e}")
+    return etag, body
+
+
+def get_cached_document(slug):
+    try:
+        return cache.get(_document_key(slug))
+    except Exception:
+        return None
+
+
+def get_document(slug):
+    """
+    ``(etag, body)`` desde la cache si sigue en la revisión actual del perfil,
+    o reconstruido desde la BD; None si no existe
+    """
+    revision = Profile.objects.filter(slug=slug).values_list('public_revision', flat=True)[:1]
+    if not revision:
+        return None
+    document = get_cached_document(slug)
+    if document is not None and len(document) == 3 and document[0] == revision[0]:
+        return document[1:]
+    profile = public_queryset().filter(slug=slug).first()
+    if profile is None:
+        return None
+    return store_document(profile)
+
+
+def rebuild(profile_id):
+    """Reconstruye el documento de un perfil, o lo elimina si el perfil ya no existe"""
+    profile = public_queryset().filter(pk=profile_id).first()
+    if profile is None:
+        discard(profile_id)
+        return None
+    return store_document(profile)
+
+
+def schedule_rebuild(profile_id):
+    """
+    Renueva la revisión del perfil (invalida el documento en todos los workers)
+    y lo reconstruye cuando se confirme la transacción actual
+    """
+    Profile.objects.filter(pk=profile_id).update(public_revision=timezone.now())
+    transaction.on_commit(lambda: rebuild(profile_id))
+
+
+def discard(profile_id):
+    try:
+        slug = cache.get(_slug_key(profile_id))
+        if slug:
+            cache.delete_many([_document_key(slug), _slug_key(profile_id)])
+    except Exception:
+        pass
+
+
+def etag_matches(if_none_match, etag):
+    """Comparación débil de If-None-Match (RFC 9110) contra un ETag fuerte"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return any(value.removeprefix('W/') == etag for value in candidates)
@@ -0,0 +1,45 @@
+"""
+Consultas agregadas reutilizables para evitar N+1 en vistas y serializers.
+
+Los conteos por enlace se resuelven en bloque (una consulta agrupada por
+perfil, o rollups + eventos crudos del día) y se pasan a los serializers por
+``context`` en lugar de contar los clicks enlace por enlace.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .rollups import RollupQuery
+
+
+def annotate_link_clicks(queryset, since=None):
+    """Anota ``click_count`` en un queryset de Link con un solo GROUP BY"""
+    click_filter = Q(link_clicks__timestamp__gte=since) if since else None
+    return queryset.annotate(click_count=Count('link_clicks', filter=click_filter))
+
+
+class LinkClickCounts:
+    """
+    Clicks por enlace desde ``since``, cargados una vez por perfil.
+
+    Se usa en el context de LinkSerializer (clave ``link_click_counts``): el
+    primer enlace de cada perfil dispara la consulta y el resto lee del dict.
+    """
+
+    def __init__(self, since):
+        self.since = since
+        self._by_profile = {}
+
+    @classmethod
+    def last_days(cls, days=30):
+        return cls(timezone.now() - timedelta(days=days))
+
+    def for_profile(self, profile_id):
+        if profile_id not in self._by_profile:
+            counts = RollupQuery(profile_id, self.since).counts('click', 'link')
+            self._by_profile[profile_id] = {int(key): count for key, (_, count) in counts.items() if key}
+        return self._by_profile[profile_id]
+
+    def get(self, link):
+        return self.for_profile(link.profile_id).get(link.id, 0)
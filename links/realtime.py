@@ -0,0 +1,182 @@
+"""
+Ventanas deslizantes en memoria para las métricas en tiempo real.
+
+Cada perfil tiene un ring buffer de ``WINDOW_MINUTES`` buckets de un minuto
+con clicks, vistas e IPs de visitantes. Los trackers lo alimentan al encolar
+cada evento, así ``RealTimeMetricsView`` puede consultarse cada pocos
+segundos sin tocar la base de datos.
+
+Como cada worker de gunicorn solo ve sus propios eventos, la ventana se
+resiembra desde la base de datos (una consulta agrupada por minuto por
+tabla) cuando tiene más de ``LINKS_REALTIME_RESEED_SECONDS`` de antigüedad.
+Las ventanas sin eventos ni consultas durante más de ``WINDOW_MINUTES`` se
+descartan (se resembrarían igual al volver a consultarse).
+"""
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
+from django.utils import timezone
+
+from .models import Link, ProfileView, LinkClick
+
+WINDOW_MINUTES = 120
+
+# Cada cuántos segundos se buscan ventanas inactivas para descartarlas
+PRUNE_INTERVAL = 60
+
+
+def _minute(timestamp):
+    return int(timestamp.timestamp() // 60)
+
+
+class MinuteRing:
+    """Ring buffer de contadores por minuto"""
+
+    def __init__(self, size=WINDOW_MINUTES):
+        self.size = size
+        self._minutes = [-1] * size
+        self._values = [None] * size
+
+    def _slot(self, minute, factory):
+        index = minute % self.size
+        if self._minutes[index] != minute:
+            self._minutes[index] = minute
+            self._values[index] = factory()
+        return index
+
+    def add(self, minute, amount=1):
+        index = self._slot(minute, int)
+        self._values[index] += amount
+
+    def add_member(self, minute, member):
+        index = self._slot(minute, set)
+        self._values[index].add(member)
+
+    def values(self, start_minute, end_minute):
+        """Valores de los minutos en [start_minute, end_minute)"""
+        for index, minute in enumerate(self._minutes):
+            if start_minute <= minute < end_minute:
+                yield self._values[index]
+
+
+class ProfileWindow:
+    """Clicks, vistas y visitantes de un perfil en las últimas dos horas"""
+
+    def __init__(self):
+        self.clicks = MinuteRing()
+        self.views = MinuteRing()
+        self.visitors = MinuteRing()
+        self.active_links = 0
+        self.seeded_at = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, kind, timestamp, ip_address=None):
+        minute = _minute(timestamp)
+        self.last_used = time.monotonic()
+        with self.lock:
+            if kind == 'link_click':
+                self.clicks.add(minute)
+            elif kind == 'profile_view':
+                self.views.add(minute)
+                self.visitors.add_member(minute, ip_address)
+
+    def seed(self, profile_id, now):
+        """Reconstruye la ventana desde la base de datos"""
+        since = now - timedelta(minutes=WINDOW_MINUTES)
+        tz = timezone.get_current_timezone()
+        clicks, views, visitors = MinuteRing(), MinuteRing(), MinuteRing()
+
+        click_rows = LinkClick.objects.filter(profile_id=profile_id, timestamp__gte=since).annotate(
+            minute=TruncMinute('timestamp', tzinfo=tz)
+        ).order_by().values('minute').annotate(total=Count('id'))
+        for row in click_rows:
+            clicks.add(_minute(row['minute']), row['total'])
+
+        view_rows = ProfileView.objects.filter(profile_id=profile_id, timestamp__gte=since).annotate(
+            minute=TruncMinute('timestamp', tzinfo=tz)
+        ).order_by().values('minute', 'ip_address').annotate(total=Count('id'))
+        for row in view_rows:
+            minute = _minute(row['minute'])
+            views.add(minute, row['total'])
+            visitors.add_member(minute, row['ip_address'])
+
+        active_links = Link.objects.filter(profile_id=profile_id).count()
+
+        with self.lock:
+            self.clicks, self.views, self.visitors = clicks, views, visitors
+            self.active_links = active_links
+            self.seeded_at = time.monotonic()
+
+    def is_stale(self):
+        max_age = getattr(settings, 'LINKS_REALTIME_RESEED_SECONDS', 60)
+        return self.seeded_at is None or time.monotonic() - self.seeded_at > max_age
+
+    def snapshot(self, now):
+        """Conteos de la última hora, de la hora anterior y visitantes únicos"""
+        current = _minute(now) + 1
+        last_hour = current - 60
+        hour_before = current - 120
+        with self.lock:
+            visitors = set()
+            for members in self.visitors.values(last_hour, current):
+                visitors.update(members)
+            return {
+                'clicks_last_hour': sum(self.clicks.values(last_hour, current)),
+                'clicks_hour_before': sum(self.clicks.values(hour_before, last_hour)),
+                'views_last_hour': sum(self.views.values(last_hour, current)),
+                'views_hour_before': sum(self.views.values(hour_before, last_hour)),
+                'unique_visitors': len(visitors),
+                'active_links': self.active_links,
+            }
+
+
+_windows = {}
+_windows_lock = threading.Lock()
+_pruned_at = time.monotonic()
+
+
+def prune(now=None):
+    """Descarta las ventanas sin eventos ni consultas durante más de WINDOW_MINUTES"""
+    now = time.monotonic() if now is None else now
+    idle = [
+        profile_id for profile_id, window in list(_windows.items())
+        if now - window.last_used > WINDOW_MINUTES * 60
+    ]
+    for profile_id in idle:
+        _windows.pop(profile_id, None)
+    return len(idle)
+
+
+def get_window(profile_id):
+    global _pruned_at
+    now = time.monotonic()
+    with _windows_lock:
+        if now - _pruned_at > PRUNE_INTERVAL:
+            prune(now)
+            _pruned_at = now
+        window = _windows.get(profile_id)
+        if window is None:
+            window = _windows[profile_id] = ProfileWindow()
+        window.last_used = now
+        return window
+
+
+def record_event(kind, profile_id, timestamp, ip_address=None):
+    """Alimenta la ventana con un evento recién trackeado"""
+    window = _windows.get(profile_id)
+    if window is not None:  # solo perfiles cuyo panel se está consultando
+        window.record(kind, timestamp, ip_address)
+
+
+def get_counts(profile_id):
+    """Conteos en tiempo real de un perfil, resembrando si la ventana es vieja"""
+    window = get_window(profile_id)
+    now = timezone.now()
+    if window.is_stale():
+        window.seed(profile_id, now)
+    return window.snapshot(now)
@@ -0,0 +1,249 @@
+"""
+Normalización y clasificación de referrers y top-K por perfil.
+
+``normalize_host`` reduce la URL (o el host) del referrer a un dominio
+comparable (sin ``www.``/``m.``/``l.``, con los acortadores de cada red
+resueltos a su dominio) y ``classify_source`` lo asigna a una fuente como
+instagram, tiktok, search o direct.
+
+Los referrers de los días no consolidados se mantienen con ``SpaceSaving``
+(Metwally et al.): un resumen de como máximo ``k`` contadores por perfil,
+día y métrica, actualizado en la ingestión y combinable entre días. Los días
+cerrados se leen de la dimensión ``referrer`` de ``DailyRollup`` y los días
+sin resumen, de los eventos crudos.
+"""
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ReferrerSketch
+
+# Prefijos de subdominio que no distinguen la fuente (m.facebook.com, l.instagram.com, ...)
+_IGNORED_PREFIXES = ('www.', 'm.', 'mobile.', 'l.', 'lm.', 'web.')
+
+# Acortadores y dominios alternativos de cada red
+_HOST_ALIASES = {
+    't.co': 'twitter.com',
+    'x.com': 'twitter.com',
+    'youtu.be': 'youtube.com',
+    'fb.me': 'facebook.com',
+    'fb.com': 'facebook.com',
+    'lnkd.in': 'linkedin.com',
+    'wa.me': 'whatsapp.com',
+    't.me': 'telegram.org',
+    'vm.tiktok.com': 'tiktok.com',
+    'pin.it': 'pinterest.com',
+}
+
+# Fuente por dominio (se compara el dominio y sus sufijos)
+SOURCES = {
+    'instagram.com': 'instagram',
+    'tiktok.com': 'tiktok',
+    'facebook.com': 'facebook',
+    'messenger.com': 'facebook',
+    'twitter.com': 'twitter',
+    'youtube.com': 'youtube',
+    'linkedin.com': 'linkedin',
+    'whatsapp.com': 'whatsapp',
+    'telegram.org': 'telegram',
+    'pinterest.com': 'pinterest',
+    'reddit.com': 'reddit',
+    'snapchat.com': 'snapchat',
+    'twitch.tv': 'twitch',
+    'discord.com': 'discord',
+    'google.com': 'search',
+    'bing.com': 'search',
+    'duckduckgo.com': 'search',
+    'yahoo.com': 'search',
+}
+
+DIRECT = 'direct'
+OTHER = 'other'
+
+
+def normalize_host(referrer):
+    """Dominio normalizado de una URL o host de referrer ('' para tráfico directo)"""
+    if not referrer:
+        return ''
+    referrer = referrer.strip().lower()
+    host = urlparse(referrer).netloc if '//' in referrer else referrer.split('/')[0]
+    host = host.rsplit('@', 1)[-1].split(':')[0].rstrip('.')
+    while host.startswith(_IGNORED_PREFIXES) and host.count('.') > 1:
+        host = host.split('.', 1)[1]
+    return _HOST_ALIASES.get(host, host)
+
+
+def classify_source(host):
+    """Fuente de tráfico de un host normalizado"""
+    if not host:
+        return DIRECT
+    parts = host.split('.')
+    for index in range(len(parts) - 1):
+        source = SOURCES.get('.'.join(parts[index:]))
+        if source:
+            return source
+    # google.com.pe, google.es, ...
+    if parts[0] == 'google':
+        return 'search'
+    return OTHER
+
+
+class SpaceSaving:
+    """Top-K aproximado con como máximo ``k`` contadores (sobreestima, nunca subestima)"""
+
+    def __init__(self, k, counters=None, total=0):
+        self.k = k
+        self.counters = counters or {}  # item -> [count, error]
+        self.total = total
+
+    def add(self, item, count=1):
+        self.total += count
+        entry = self.counters.get(item)
+        if entry is not None:
+            entry[0] += count
+        elif len(self.counters) < self.k:
+            self.counters[item] = [count, 0]
+        else:
+            # Reemplaza el contador mínimo: el nuevo hereda su valor como error
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def minimum(self):
+        """Cota del conteo de cualquier ítem no monitoreado"""
+        if len(self.counters) < self.k:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other):
+        """Combina otro resumen y conserva los ``k`` mayores (Cafaro et al.)"""
+        own_min, other_min = self.minimum(), other.minimum()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            count, error = self.counters.get(item, [own_min, own_min])
+            other_count, other_error = other.counters.get(item, [other_min, other_min])
+            merged[item] = [count + other_count, error + other_error]
+        top = sorted(merged.items(), key=lambda pair: pair[1][0], reverse=True)[:self.k]
+        self.counters = dict(top)
+        self.total += other.total
+        return self
+
+    def top(self, n=None):
+        items = sorted(self.counters.items(), key=lambda pair: pair[1][0], reverse=True)
+        return items[:n] if n else items
+
+    def to_dict(self):
+        return {'k': self.k, 'total': self.total, 'counters': self.counters}
+
+    @classmethod
+    def from_dict(cls, data, k=None):
+        data = data or {}
+        return cls(k or data.get('k') or top_k(), {key: list(value) for key, value in data.get('counters', {}).items()},
+                   data.get('total', 0))
+
+
+def top_k():
+    return getattr(settings, 'LINKS_REFERRER_TOP_K', 50)
+
+
+def record_referrers(metric, instances):
+    """Agrega los referrers de un lote de eventos a los resúmenes diarios"""
+    summaries = {}
+    for instance in instances:
+        key = (instance.profile_id, timezone.localtime(instance.timestamp).date())
+        summaries.setdefault(key, SpaceSaving(top_k())).add(normalize_host(instance.referrer))
+    if not summaries:
+        return
+
+    with transaction.atomic():
+        ReferrerSketch.objects.bulk_create([
+            ReferrerSketch(profile_id=profile_id, day=day, metric=metric, data={})
+            for profile_id, day in summaries
+        ], ignore_conflicts=True)
+        keys = Q()
+        for profile_id, day in summaries:
+            keys |= Q(profile_id=profile_id, day=day)
+        rows = list(ReferrerSketch.objects.select_for_update().filter(keys, metric=metric))
+        for row in rows:
+            summary = SpaceSaving.from_dict(row.data, k=top_k()).merge(summaries[(row.profile_id, row.day)])
+            row.data = summary.to_dict()
+            row.updated_at = timezone.now()
+        ReferrerSketch.objects.bulk_update(rows, ['data', 'updated_at'])
+
+
+def build_day(day):
+    """Recalcula desde los eventos crudos los resúmenes de un día cerrado (reemplazándolos)"""
+    from .rollups import METRIC_MODELS, day_start  # rollups importa este módulo
+
+    # Hoy la ingestión sigue combinando en estos resúmenes (ver visitors.build_day)
+    if day >= timezone.localdate():
+        raise ValueError(f'Solo se pueden recalcular días anteriores a hoy ({day})')
+
+    sketches = []
+    for metric, model in METRIC_MODELS.items():
+        rows = model.objects.filter(
+            timestamp__gte=day_start(day), timestamp__lt=day_start(day + timedelta(days=1))
+        ).order_by().values_list('profile_id', 'referrer').annotate(total=Count('id'))
+        summaries = {}
+        for profile_id, referrer, total in rows.iterator(chunk_size=5000):
+            summaries.setdefault(profile_id, SpaceSaving(top_k())).add(normalize_host(referrer), total)
+        sketches.extend(
+            ReferrerSketch(profile_id=profile_id, day=day, metric=metric, data=summary.to_dict())
+            for profile_id, summary in summaries.items()
+        )
+
+    with transaction.atomic():
+        ReferrerSketch.objects.filter(day=day).delete()
+        ReferrerSketch.objects.bulk_create(sketches, batch_size=500)
+    return len(sketches)
+
+
+def _missing_ranges(days, first_day, last_day):
+    """Tramos ``(inicio, fin)`` de días consecutivos de [first_day, last_day] que no están en ``days``"""
+    ranges = []
+    day = first_day
+    while day <= last_day:
+        if day not in days:
+            if ranges and ranges[-1][1] == day - timedelta(days=1):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+        day += timedelta(days=1)
+    return ranges
+
+
+def summary_for_days(profile, metric, first_day, last_day):
+    """
+    Resumen combinado de los días [first_day, last_day]. Los días sin resumen
+    (eventos cargados sin pasar por la ingestión, o anteriores a los sketches)
+    se agrupan desde los eventos crudos con una consulta
+    """
+    from .rollups import METRIC_MODELS, day_start  # rollups importa este módulo
+
+    summary = SpaceSaving(top_k())
+    rows = ReferrerSketch.objects.filter(
+        profile=profile, metric=metric, day__gte=first_day, day__lte=last_day
+    ).values_list('day', 'data')
+    days = set()
+    for day, data in rows:
+        days.add(day)
+        summary.merge(SpaceSaving.from_dict(data, k=top_k()))
+
+    missing = Q()
+    for start, end in _missing_ranges(days, first_day, last_day):
+        missing |= Q(timestamp__gte=day_start(start), timestamp__lt=day_start(end + timedelta(days=1)))
+    if missing:
+        counts = METRIC_MODELS[metric].objects.filter(missing, profile=profile).order_by().values_list(
+            'referrer').annotate(total=Count('id'))
+        hosts = {}
+        for referrer, total in counts:
+            host = normalize_host(referrer)
+            hosts[host] = hosts.get(host, 0) + total
+        # Conteos exactos: los k mayores como contadores sin error, el resto solo en el total
+        top = sorted(hosts.items(), key=lambda item: item[1], reverse=True)[:top_k()]
+        summary.merge(SpaceSaving(top_k(), {host: [total, 0] for host, total in top}, sum(hosts.values())))
+    return summary
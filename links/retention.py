@@ -0,0 +1,94 @@
+"""
+Retención de los eventos crudos de analytics.
+
+Los eventos de días cerrados anteriores a ``LINKS_RETENTION_DAYS`` ya están
+representados en ``DailyRollup``; ``compact_events`` se asegura de que esos
+días estén consolidados, los marca como compactados en el watermark (para
+que nunca se recalculen desde tablas vacías) y borra los eventos en lotes
+por pk para no bloquear las tablas calientes con un único DELETE gigante.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .rollups import METRIC_MODELS, day_start, get_watermark
+from .ua import get_user_agent_ids
+
+# Rango más largo del dashboard ('1y'): con una retención menor su primer día
+# parcial ya no tendría eventos crudos y los totales cambiarían al compactar
+MIN_RETENTION_DAYS = 365
+
+
+def delete_in_chunks(queryset, chunk_size):
+    """Borra las filas de un queryset en lotes de ``chunk_size`` pks"""
+    deleted = 0
+    while True:
+        pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+
+
+def oldest_event_day(before):
+    """Día local del evento crudo más antiguo anterior a ``before`` (None si no hay)"""
+    oldest = [
+        model.objects.filter(timestamp__lt=before).aggregate(oldest=Min('timestamp'))['oldest']
+        for model in METRIC_MODELS.values()
+    ]
+    oldest = [value for value in oldest if value is not None]
+    return timezone.localtime(min(oldest)).date() if oldest else None
+
+
+def compact_events(cutoff_day, chunk_size=5000, dry_run=False):
+    """
+    Elimina los eventos crudos anteriores a ``cutoff_day`` (fecha local). Los
+    días a borrar, desde el evento más antiguo, deben estar cubiertos por el
+    watermark de rollups (salvo con ``dry_run``, que solo cuenta).
+    Devuelve ``{métrica: filas}`` borradas (o a borrar con ``dry_run``).
+    """
+    watermark = get_watermark()
+    last_day = cutoff_day - timedelta(days=1)
+    if not dry_run and (watermark is None or watermark.last_day < last_day):
+        raise ValueError(f'Los rollups no cubren hasta el {last_day}; ejecute build_analytics_rollups')
+
+    cutoff = day_start(cutoff_day)
+    first_day = oldest_event_day(cutoff)
+    if not dry_run and first_day is not None and first_day < watermark.first_day:
+        # p. ej. tras build_analytics_rollups --from: esos días no tienen rollups
+        raise ValueError(
+            f'Los rollups empiezan el {watermark.first_day} pero hay eventos desde el {first_day}; '
+            f'ejecute build_analytics_rollups --from {first_day}'
+        )
+
+    result = {}
+    for metric, model in METRIC_MODELS.items():
+        queryset = model.objects.filter(timestamp__lt=cutoff)
+        result[metric] = queryset.count() if dry_run else delete_in_chunks(queryset, chunk_size)
+
+    if not dry_run and (watermark.compacted_through is None or watermark.compacted_through < last_day):
+        watermark.compacted_through = last_day
+        watermark.save(update_fields=['compacted_through', 'updated_at'])
+    return result
+
+
+def normalize_user_agents(chunk_size=5000):
+    """Pasa el texto de user agent de los eventos legados a la tabla UserAgent"""
+    updated = {}
+    for metric, model in METRIC_MODELS.items():
+        updated[metric] = 0
+        legacy = model.objects.filter(agent__isnull=True).exclude(Q(user_agent='') | Q(user_agent__isnull=True))
+        while True:
+            rows = list(legacy.order_by('pk').only('pk', 'user_agent')[:chunk_size])
+            if not rows:
+                break
+            ids = get_user_agent_ids(row.user_agent for row in rows)
+            for row in rows:
+                row.agent_id = ids[row.user_agent]
+                row.user_agent = ''
+            with transaction.atomic():
+                model.objects.bulk_update(rows, ['agent', 'user_agent'], batch_size=chunk_size)
+            updated[metric] += len(rows)
+    return updated
@@ -0,0 +1,237 @@
+"""
+Rollups diarios de analytics.
+
+``build_day`` consolida los eventos crudos de un día cerrado en ``DailyRollup``
+(un conteo por perfil, métrica, dimensión y valor). ``RollupQuery`` responde
+consultas sobre un rango de tiempo combinando rollups para los días ya
+consolidados y eventos crudos solo para los tramos que faltan (el día parcial
+del inicio del rango y los días posteriores al watermark, normalmente hoy).
+Si los eventos del día parcial ya se compactaron se usa su rollup completo.
+"""
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ProfileView, LinkClick, SocialIconClick, DailyRollup, RollupWatermark
+from .referrers import normalize_host
+
+# Inicio de las consultas históricas ("desde siempre") de RollupQuery
+ALL_TIME = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+METRIC_MODELS = {
+    'view': ProfileView,
+    'click': LinkClick,
+    'social': SocialIconClick,
+}
+
+# Campo de agrupación de cada dimensión por métrica (None = conteo total)
+DIMENSIONS = {
+    'view': {
+        'total': None,
+        'device': 'device_type',
+        'country': 'country_code',
+        'referrer': 'referrer',
+    },
+    'click': {
+        'total': None,
+        'link': 'link_id',
+        'category': 'link__type',
+        'device': 'device_type',
+        'country': 'country_code',
+        'referrer': 'referrer',
+    },
+    'social': {
+        'total': None,
+        'social_icon': 'social_icon_id',
+        'social_type': 'social_icon__social_type',
+        'device': 'device_type',
+        'country': 'country_code',
+        'referrer': 'referrer',
+    },
+}
+
+
+def referrer_key(referrer):
+    """Host normalizado del referrer ('' para tráfico directo)"""
+    return normalize_host(referrer)
+
+
+def day_start(day):
+    """Inicio del día en la zona horaria del proyecto"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _grouped_counts(queryset, dimension, field, by_profile=False):
+    """
+    Agrupa un queryset de eventos por dimensión en una sola consulta.
+    Devuelve ``{key: [label, count]}`` con las claves normalizadas, o
+    ``{(profile_id, key): [label, count]}`` con ``by_profile=True``.
+    """
+    group_fields = ['profile_id'] if by_profile else []
+    if field is not None:
+        group_fields.append(field)
+    if dimension == 'country':
+        group_fields.append('country')
+
+    if group_fields:
+        rows = queryset.order_by().values(*group_fields).annotate(total=Count('id'))
+    else:
+        rows = [{'total': queryset.count()}]
+
+    result = {}
+    for row in rows:
+        if not row['total']:
+            continue
+        value = row[field] if field is not None else ''
+        if dimension == 'country':
+            key, label = value or 'XX', row['country'] or 'Unknown'
+        elif dimension == 'referrer':
+            key, label = referrer_key(value), ''
+        else:
+            key, label = '' if value is None else str(value), ''
+        if by_profile:
+            key = (row['profile_id'], key)
+        entry = result.setdefault(key, [label, 0])
+        entry[1] += row['total']
+    return result
+
+
+def build_day(day):
+    """Recalcula (idempotente) los rollups de un día para todos los perfiles"""
+    start = day_start(day)
+    end = day_start(day + timedelta(days=1))
+    rows = []
+    for metric, model in METRIC_MODELS.items():
+        events = model.objects.filter(timestamp__gte=start, timestamp__lt=end)
+        for dimension, field in DIMENSIONS[metric].items():
+            counts = _grouped_counts(events, dimension, field, by_profile=True)
+            for (profile_id, key), (label, count) in counts.items():
+                rows.append(DailyRollup(
+                    profile_id=profile_id, day=day, metric=metric, dimension=dimension,
+                    key=key[:255], label=label[:255], count=count,
+                ))
+
+    with transaction.atomic():
+        DailyRollup.objects.filter(day=day).delete()
+        DailyRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def get_watermark():
+    return RollupWatermark.objects.order_by('pk').first()
+
+
+class RollupQuery:
+    """Consultas de un perfil en un rango combinando rollups y eventos crudos"""
+
+    def __init__(self, profile, start, end=None):
+        self.profile = profile
+        self.start = start
+        self.end = end or timezone.now()
+        self.rollup_days = self._rollup_days()
+        self._rollup_cache = {}
+
+    def _rollup_days(self):
+        """Días completos del rango cubiertos por el watermark, o None"""
+        watermark = get_watermark()
+        if watermark is None:
+            return None
+        first = timezone.localtime(self.start).date()
+        compacted = watermark.compacted_through
+        if day_start(first) < self.start and (compacted is None or first > compacted):
+            # El primer día es parcial: va por eventos crudos, salvo que ya se
+            # hayan borrado (entonces se cuenta el día entero desde su rollup)
+            first += timedelta(days=1)
+        last = timezone.localtime(self.end).date() - timedelta(days=1)
+        first = max(first, watermark.first_day)
+        last = min(last, watermark.last_day)
+        if first > last:
+            return None
+        return first, last
+
+    def raw_events(self, metric):
+        """Eventos crudos del rango que no están cubiertos por rollups"""
+        queryset = METRIC_MODELS[metric].objects.filter(profile=self.profile)
+        if self.rollup_days is None:
+            return queryset.filter(timestamp__gte=self.start, timestamp__lte=self.end)
+        first, last = self.rollup_days
+        head = Q(timestamp__gte=self.start, timestamp__lt=day_start(first))
+        tail = Q(timestamp__gte=day_start(last + timedelta(days=1)), timestamp__lte=self.end)
+        return queryset.filter(head | tail)
+
+    def _rollup_counts(self, metric):
+        """Todas las dimensiones de una métrica sumadas en el rango (una consulta)"""
+        if metric not in self._rollup_cache:
+            counts = {}
+            if self.rollup_days is not None:
+                first, last = self.rollup_days
+                rows = DailyRollup.objects.filter(
+                    profile=self.profile, metric=metric, day__gte=first, day__lte=last
+                ).values('dimension', 'key', 'label').annotate(total=Sum('count'))
+                for row in rows:
+                    dimension_counts = counts.setdefault(row['dimension'], {})
+                    entry = dimension_counts.setdefault(row['key'], [row['label'], 0])
+                    entry[1] += row['total']
+            self._rollup_cache[metric] = counts
+        return self._rollup_cache[metric]
+
+    def rollup_counts(self, metric, dimension):
+        """Solo la parte consolidada (``rollup_days``) de ``counts``"""
+        return {key: list(value) for key, value in self._rollup_counts(metric).get(dimension, {}).items()}
+
+    def counts(self, metric, dimension):
+        """``{key: [label, count]}`` para una dimensión en todo el rango"""
+        result = self.rollup_counts(metric, dimension)
+        raw = _grouped_counts(self.raw_events(metric), dimension, DIMENSIONS[metric][dimension])
+        for key, (label, count) in raw.items():
+            entry = result.setdefault(key, [label, 0])
+            entry[0] = entry[0] or label
+            entry[1] += count
+        return result
+
+    def total(self, metric):
+        return sum(count for _, count in self.counts(metric, 'total').values())
+
+    def daily_counts(self, metric, dimension):
+        """
+        ``{(date, key): count}`` por día local y valor de una dimensión de
+        ids o tipos (sin la normalización de country/referrer)
+        """
+        result = {}
+        if self.rollup_days is not None:
+            first, last = self.rollup_days
+            rows = DailyRollup.objects.filter(
+                profile=self.profile, metric=metric, dimension=dimension, day__gte=first, day__lte=last
+            ).values_list('day', 'key', 'count')
+            for day, key, count in rows:
+                result[(day, key)] = result.get((day, key), 0) + count
+
+        field = DIMENSIONS[metric][dimension]
+        rows = self.raw_events(metric).annotate(
+            day=TruncDate('timestamp', tzinfo=timezone.get_current_timezone())
+        ).order_by().values_list('day', field).annotate(total=Count('id'))
+        for day, value, count in rows:
+            key = str(value) if value is not None else ''
+            result[(day, key)] = result.get((day, key), 0) + count
+        return result
+
+    def daily(self, metric):
+        """``{date: count}`` por día local"""
+        result = {}
+        if self.rollup_days is not None:
+            first, last = self.rollup_days
+            rows = DailyRollup.objects.filter(
+                profile=self.profile, metric=metric, dimension='total', day__gte=first, day__lte=last
+            ).values_list('day', 'count')
+            for day, count in rows:
+                result[day] = result.get(day, 0) + count
+
+        rows = self.raw_events(metric).annotate(
+            day=TruncDate('timestamp', tzinfo=timezone.get_current_timezone())
+        ).order_by().values('day').annotate(total=Count('id'))
+        for row in rows:
+            result[row['day']] = result.get(row['day'], 0) + row['total']
+        return result
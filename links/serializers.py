@@ -6,7 +6,10 @@ from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.http import QueryDict
 from rest_framework.parsers import JSONParser
 from io import BytesIO
+from django.db import transaction
 from .models import Profile, Link, SocialIcon, ProfileView, LinkClick, AnalyticsCache
+from .analytics_cache import bump_version
+from .queries import LinkClickCounts
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -75,18 +78,12 @@ class LinkSerializer(serializers.ModelSerializer):
         # El campo 'type' ahora es gestionado por el cliente.
     
     def get_clicks(self, obj):
-        """Obtener clicks reales del sistema de analytics"""
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        # Contar clicks de los últimos 30 días para mantener relevancia
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        real_clicks = LinkClick.objects.filter(
-            link=obj,
-            timestamp__gte=thirty_days_ago
-        ).count()
-        
-        return real_clicks
+        """Obtener clicks reales del sistema de analytics (últimos 30 días)"""
+        # Las vistas pasan los conteos precalculados por perfil para evitar N+1
+        click_counts = self.context.get('link_click_counts')
+        if click_counts is None:
+            click_counts = LinkClickCounts.last_days(30)
+        return click_counts.get(obj)
 
 class SocialIconSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(required=False)  # Allow ID for updates
@@ -118,90 +115,98 @@ class ProfileSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         # Extract links and social_icons data directly from request.data if present
         request_data = self.context['request'].data
-        links_data_raw = request_data.get('links', None)
-        social_icons_data_raw = request_data.get('social_icons', None)
+        links_data = self._parse_nested(request_data.get('links', None), 'links', 'Expected a list of links.')
+        social_icons_data = self._parse_nested(
+            request_data.get('social_icons', None), 'social_icons', 'Expected a list of social icons.'
+        )
 
         # Remove 'links' and 'social_icons' from validated_data to prevent default handling
         validated_data.pop('links', None)
         validated_data.pop('social_icons', None)
 
-        # Update parent instance fields
-        instance = super().update(instance, validated_data)
-
-        # Handle nested links
-        if links_data_raw is not None:
-            # If links_data_raw is a string (from FormData), parse it
-            if isinstance(links_data_raw, str):
-                try:
-                    links_data = json.loads(links_data_raw)
-                except json.JSONDecodeError:
-                    raise serializers.ValidationError({'links': 'Invalid JSON format.'})
-            else:
-                # If it's already parsed (e.g., from JSON request body), use it directly
-                links_data = links_data_raw
-
-            # Ensure links_data is a list
-            if not isinstance(links_data, list):
-                raise serializers.ValidationError({'links': 'Expected a list of links.'})
-
-            # Get existing links for the profile
-            existing_links = {link.id: link for link in instance.links.all()}
-            
-            # Process incoming links
-            for link_data in links_data:
-                link_id = link_data.get('id')
-                if link_id and link_id in existing_links:
-                    # Update existing link
-                    link = existing_links.pop(link_id) # Remove from existing_links to track deletions
-                    for attr, value in link_data.items():
-                        setattr(link, attr, value)
-                    link.save()
-                else:
-                    # Create new link
-                    Link.objects.create(profile=instance, **link_data)
-            
-            # Delete remaining existing links (those not in incoming_link_ids) if any
-            for link_id, link in existing_links.items():
-                link.delete()
-
-        # Handle nested social_icons
-        if social_icons_data_raw is not None:
-            # If social_icons_data_raw is a string (from FormData), parse it
-            if isinstance(social_icons_data_raw, str):
-                try:
-                    social_icons_data = json.loads(social_icons_data_raw)
-                except json.JSONDecodeError:
-                    raise serializers.ValidationError({'social_icons': 'Invalid JSON format.'})
-            else:
-                # If it's already parsed (e.g., from JSON request body), use it directly
-                social_icons_data = social_icons_data_raw
-
-            # Ensure social_icons_data is a list
-            if not isinstance(social_icons_data, list):
-                raise serializers.ValidationError({'social_icons': 'Expected a list of social icons.'})
-
-            # Get existing social icons for the profile
-            existing_social_icons = {icon.id: icon for icon in instance.social_icons.all()}
-            
-            # Process incoming social icons
-            for icon_data in social_icons_data:
-                icon_id = icon_data.get('id')
-                if icon_id and icon_id in existing_social_icons:
-                    # Update existing social icon
-                    icon = existing_social_icons.pop(icon_id) # Remove from existing_social_icons to track deletions
-                    for attr, value in icon_data.items():
-                        setattr(icon, attr, value)
-                    icon.save()
-                else:
-                    # Create new social icon
-                    SocialIcon.objects.create(profile=instance, **icon_data)
-            
-            # Delete remaining existing social icons (those not in incoming_social_icon_ids) if any
-            for icon_id, icon in existing_social_icons.items():
-                icon.delete()
+        # Perfil, enlaces e iconos se guardan juntos o no se guarda nada
+        with transaction.atomic():
+            # Update parent instance fields
+            instance = super().update(instance, validated_data)
+
+            if links_data is not None:
+                sync_related(Link, instance, instance.links.all(), links_data, read_only=('clicks',))
+
+            if social_icons_data is not None:
+                sync_related(SocialIcon, instance, instance.social_icons.all(), social_icons_data)
+
+        if links_data is not None or social_icons_data is not None:
+            # bulk_update/bulk_create no envían post_save: invalidar analytics a mano
+            bump_version(instance.id)
+
+        # La vista precarga links/social_icons: invalidar para serializar el estado nuevo
+        if getattr(instance, '_prefetched_objects_cache', None):
+            instance._prefetched_objects_cache = {}
 
         return instance
 
+    @staticmethod
+    def _parse_nested(raw, field, list_error):
+        if raw is None:
+            return None
+        # If raw is a string (from FormData), parse it
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except json.JSONDecodeError:
+                raise serializers.ValidationError({field: 'Invalid JSON format.'})
+        if not isinstance(raw, list):
+            raise serializers.ValidationError({field: list_error})
+        return raw
+
+
+def sync_related(model, profile, existing, items, read_only=()):
+    """
+    Sincroniza los hijos de un perfil (enlaces o iconos) con la lista recibida
+    calculando en memoria qué borrar, actualizar y crear: un DELETE, un
+    bulk_update solo de las filas que cambiaron y un bulk_create.
+    """
+    existing = {obj.id: obj for obj in existing}
+    writable = {field.name for field in model._meta.concrete_fields if not field.primary_key} - {'profile'}
+    to_update, to_create, changed_fields = [], [], set()
+
+    for item in items:
+        data = {key: value for key, value in item.items() if key not in read_only}
+        obj_id = data.pop('id', None)
+        obj = existing.pop(obj_id, None) if obj_id else None
+        if obj is None:
+            to_create.append(model(profile=profile, **data))
+            continue
+        changed = {attr for attr, value in data.items() if getattr(obj, attr, None) != value}
+        for attr in changed:
+            setattr(obj, attr, data[attr])
+        changed &= writable
+        if changed:
+            changed_fields |= changed
+            to_update.append(obj)
+
+    # Borrar primero para no chocar con unique_together (p. ej. reemplazar un icono del mismo tipo)
+    if existing:
+        model.objects.filter(profile=profile, id__in=list(existing)).delete()
+    if to_update:
+        model.objects.bulk_update(to_update, sorted(changed_fields))
+    if to_create:
+        model.objects.bulk_create(to_create)
+
+
+class PublicLinkSerializer(serializers.ModelSerializer):
+    """Enlace en la página pública (sin métricas)"""
+
+    class Meta:
+        model = Link
+        fields = ('id', 'title', 'url', 'type', 'order')
+
+
+class PublicProfileSerializer(ProfileSerializer):
+    """Documento público precalculado por slug (ver links.public_profile)"""
+    links = PublicLinkSerializer(many=True, read_only=True)
+    social_icons = SocialIconSerializer(many=True, read_only=True)
+
 
 # ===== SERIALIZERS DE ANALYTICS =====
 
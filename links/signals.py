@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from django.utils import timezone
+
+from . import public_profile, realtime, referrers, visitors
+from .analytics_cache import bump_version
+from .analytics_service import AnalyticsService
+from .geo import enqueue_enrichment, enricher
+from .ingestion import events_flushed
+from .models import Profile, Link, SocialIcon
+from .rollups import METRIC_MODELS
+from .streaming import broker, event_message
+
+
+@receiver(events_flushed)
+def enrich_geolocation(sender, instances, **kwargs):
+    """Encola la geolocalización de los eventos guardados sin país"""
+    sync = getattr(settings, 'LINKS_TRACKING_BACKEND', 'memory') == 'sync'
+    enqueue_enrichment(sender, instances, background=not sync)
+    if sync:
+        enricher.process_pending()
+
+
+@receiver(events_flushed)
+def publish_live_events(sender, kind, instances, **kwargs):
+    """Envía los eventos nuevos y las métricas actualizadas a los dashboards conectados"""
+    touched = set()
+    for instance in instances:
+        if broker.has_subscribers(instance.profile_id):
+            broker.publish(instance.profile_id, event_message(kind, instance))
+            touched.add(instance.profile_id)
+
+    for profile_id in touched:
+        metrics = AnalyticsService.build_realtime_metrics(realtime.get_counts(profile_id), timezone.now())
+        broker.publish(profile_id, ('metrics', metrics))
+
+
+@receiver(events_flushed)
+def update_visitor_sketches(sender, kind, instances, **kwargs):
+    """Agrega los visitantes de las vistas nuevas a los HyperLogLog diarios"""
+    if kind == 'profile_view':
+        visitors.record_views(instances)
+
+
+@receiver(events_flushed)
+def update_referrer_sketches(sender, instances, **kwargs):
+    """Agrega los referrers de los eventos nuevos a los top-K diarios"""
+    for metric, model in METRIC_MODELS.items():
+        if model is sender:
+            referrers.record_referrers(metric, instances)
+
+
+@receiver(events_flushed)
+def invalidate_analytics_cache(sender, instances, **kwargs):
+    """Los perfiles con eventos nuevos pasan a una nueva versión de cache"""
+    for profile_id in {instance.profile_id for instance in instances}:
+        bump_version(profile_id)
+
+
+@receiver([post_save, post_delete], sender=Link)
+@receiver([post_save, post_delete], sender=SocialIcon)
+def invalidate_analytics_cache_on_change(sender, instance, **kwargs):
+    """Títulos, URLs e iconos forman parte de los resultados cacheados"""
+    bump_version(instance.profile_id)
+
+
+@receiver(post_save, sender=Profile)
+def rebuild_public_profile(sender, instance, **kwargs):
+    public_profile.schedule_rebuild(instance.pk)
+
+
+@receiver(post_delete, sender=Profile)
+def discard_public_profile(sender, instance, **kwargs):
+    public_profile.discard(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Link)
+@receiver([post_save, post_delete], sender=SocialIcon)
+def rebuild_public_profile_on_change(sender, instance, **kwargs):
+    """Los enlaces e iconos forman parte del documento público del perfil"""
+    public_profile.schedule_rebuild(instance.profile_id)
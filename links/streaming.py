@@ -0,0 +1,92 @@
+"""
+Pub/sub en proceso para el stream en vivo de analytics (Server-Sent Events).
+
+El worker de ingestión publica cada lote persistido en ``broker``. Cada
+dashboard abierto tiene una ``Subscription`` con una cola acotada en el event
+loop de ASGI. Si un cliente lento llena su cola se descartan los mensajes
+más viejos: la ingestión nunca se bloquea por un consumidor.
+"""
+import asyncio
+import json
+import threading
+
+from django.conf import settings
+
+
+class Subscription:
+    """Cola de mensajes de un cliente conectado"""
+
+    def __init__(self, profile_id, maxsize):
+        self.profile_id = profile_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, message):
+        """Encola sin bloquear; con la cola llena descarta el mensaje más viejo"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class Broker:
+    """Fan-out por perfil, seguro para publicar desde cualquier hilo"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, profile_id):
+        subscription = Subscription(profile_id, getattr(settings, 'LINKS_STREAM_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subscribers.setdefault(profile_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.profile_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.profile_id]
+
+    def has_subscribers(self, profile_id):
+        return profile_id in self._subscribers
+
+    def publish(self, profile_id, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(profile_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, message)
+            except RuntimeError:
+                # El event loop del cliente ya se cerró
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
+
+
+def format_sse(event, data):
+    """Serializa un mensaje en formato text/event-stream"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def event_message(kind, instance):
+    """Mensaje público de un evento persistido (sin IP ni user agent)"""
+    data = {
+        'id': instance.pk,
+        'timestamp': instance.timestamp.isoformat(),
+        'device_type': instance.device_type,
+        'country': instance.country,
+        'country_code': instance.country_code,
+    }
+    if kind == 'link_click':
+        data['link_id'] = instance.link_id
+    elif kind == 'social_click':
+        data['social_icon_id'] = instance.social_icon_id
+    return kind, data
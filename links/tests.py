@@ -1,3 +1,1060 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.db.models.query import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from core.instrumentation import registry
+
+from .analytics_service import AnalyticsService
+from . import analytics_cache, counters, geo_backfill, public_profile, realtime, referrers, visitors
+from .dedup import ClickDeduplicator
+from .geo import RangeTableResolver
+from .geo_backfill import backfill
+from .hll import HyperLogLog
+from .referrers import SpaceSaving
+from .streaming import Broker, broker as stream_broker
+from .ingestion import IngestionPipeline, MemoryQueue, SQLiteSpool
+from .models import (
+    Profile, ProfileView, Link, LinkClick, ReferrerSketch, RollupWatermark, SocialIcon, SocialIconClick, VisitorSketch,
+)
+from .retention import MIN_RETENTION_DAYS, compact_events
+from .rollups import ALL_TIME, DIMENSIONS, RollupQuery, build_day, day_start
+
+
+class LinkClickQueryCountTests(TestCase):
+    """Los conteos de clicks por enlace no deben costar una consulta por enlace"""
+
+    def setUp(self):
+        cache.clear()
+
+    def create_profile(self, username, link_count):
+        user = User.objects.create_user(username=username, password='test')
+        profile = Profile.objects.create(user=user, name=username, bio='')
+        for order in range(link_count):
+            link = Link.objects.create(profile=profile, title=f'Link {order}', url='https://example.com', order=order)
+            LinkClick.objects.bulk_create([LinkClick(link=link, profile=profile) for _ in range(order)])
+        return profile
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def get_me(self, profile):
+        client = APIClient()
+        client.force_authenticate(profile.user)
+        response = client.get('/api/linkinbio/profiles/me/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_basic_analytics_counts_clicks_per_link(self):
+        profile = self.create_profile('ana', 3)
+        data = AnalyticsService(profile).get_basic_analytics()
+        self.assertEqual(data['total_clicks'], 3)
+        self.assertEqual([link['clicks'] for link in data['links_data']], [0, 1, 2])
+
+    def test_basic_analytics_query_count_is_constant(self):
+        small = self.create_profile('small', 2)
+        large = self.create_profile('large', 12)
+        self.assertEqual(
+            self.count_queries(lambda: AnalyticsService(small).get_basic_analytics()),
+            self.count_queries(lambda: AnalyticsService(large).get_basic_analytics()),
+        )
+
+    def test_profile_me_query_count_is_constant(self):
+        small = self.create_profile('small', 2)
+        large = self.create_profile('large', 12)
+        self.assertEqual(
+            self.count_queries(lambda: self.get_me(small)),
+            self.count_queries(lambda: self.get_me(large)),
+        )
+        clicks = [link['clicks'] for link in self.get_me(large).data['links']]
+        self.assertEqual(clicks, list(range(12)))
+
+
+class ProfileWriteQueryCountTests(TestCase):
+    """Guardar un perfil o reordenar enlaces no debe costar consultas por enlace"""
+
+    def setUp(self):
+        cache.clear()
+
+    def create_profile(self, username, link_count):
+        user = User.objects.create_user(username=username, password='test')
+        profile = Profile.objects.create(user=user, name=username, bio='')
+        Link.objects.bulk_create([
+            Link(profile=profile, title=f'Link {order}', url='https://example.com', order=order, clicks=5)
+            for order in range(link_count)
+        ])
+        return profile
+
+    def client_for(self, profile):
+        client = APIClient()
+        client.force_authenticate(profile.user)
+        return client
+
+    def patch_links(self, profile):
+        links = [
+            {'id': link.id, 'title': f'{link.title} editado', 'url': link.url, 'type': 'generic',
+             'order': link.order, 'clicks': 0}
+            for link in profile.links.all()[1:]
+        ]
+        links.append({'title': 'Nuevo', 'url': 'https://example.org', 'type': 'generic', 'order': 99})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client_for(profile).patch('/api/linkinbio/profiles/me/', {'links': links}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def reorder(self, profile):
+        data = [{'id': link.id, 'order': 100 - link.order} for link in profile.links.all()]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client_for(profile).patch('/api/linkinbio/links/reorder/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_nested_update_query_count_is_constant(self):
+        small = self.create_profile('small', 3)
+        large = self.create_profile('large', 30)
+        self.assertEqual(self.patch_links(small), self.patch_links(large))
+
+    def test_nested_update_applies_diff(self):
+        profile = self.create_profile('ana', 3)
+        first = profile.links.first()
+        self.patch_links(profile)
+        titles = list(profile.links.values_list('title', flat=True))
+        self.assertEqual(titles, ['Link 1 editado', 'Link 2 editado', 'Nuevo'])
+        self.assertFalse(Link.objects.filter(pk=first.pk).exists())
+        # El contador de clicks no se sobreescribe con lo que envía el cliente
+        self.assertEqual(profile.links.get(title='Link 1 editado').clicks, 5)
+
+    def test_reorder_query_count_is_constant(self):
+        small = self.create_profile('small', 3)
+        large = self.create_profile('large', 30)
+        self.assertEqual(self.reorder(small), self.reorder(large))
+        self.assertEqual(list(large.links.values_list('order', flat=True))[:2], [71, 72])
+
+
+class SocialMediaStatsQueryCountTests(TestCase):
+    """Las estadísticas sociales salen de una sola pasada, sin consultas por icono"""
+
+    def setUp(self):
+        cache.clear()
+
+    def create_profile(self, username, icon_count):
+        user = User.objects.create_user(username=username, password='test')
+        profile = Profile.objects.create(user=user, name=username, bio='')
+        types = [social_type for social_type, _ in SocialIcon.SOCIAL_TYPES]
+        now = timezone.now()
+        for order in range(icon_count):
+            icon = SocialIcon.objects.create(profile=profile, social_type=types[order],
+                                             username=username, url='https://example.com', order=order)
+            SocialIconClick.objects.bulk_create(
+                [SocialIconClick(social_icon=icon, profile=profile, timestamp=now) for _ in range(order + 1)]
+                + [SocialIconClick(social_icon=icon, profile=profile, timestamp=now - timedelta(days=2))]
+            )
+        return profile
+
+    def build_rollups(self):
+        yesterday = timezone.localdate() - timedelta(days=1)
+        for offset in range(3, 0, -1):
+            build_day(timezone.localdate() - timedelta(days=offset))
+        RollupWatermark.objects.create(first_day=yesterday - timedelta(days=2), last_day=yesterday)
+
+    def stats(self, profile):
+        with CaptureQueriesContext(connection) as context:
+            data = AnalyticsService(profile).get_social_media_stats('7d')
+        return data, len(context.captured_queries)
+
+    def test_query_count_is_constant(self):
+        small = self.create_profile('small', 2)
+        large = self.create_profile('large', 12)
+        self.build_rollups()
+        self.assertEqual(self.stats(small)[1], self.stats(large)[1])
+
+    def test_breakdowns_combine_rollups_and_raw_events(self):
+        profile = self.create_profile('ana', 4)
+        self.build_rollups()
+        data, _ = self.stats(profile)
+        self.assertEqual(data['total_social_clicks'], 1 + 2 + 3 + 4 + 4)
+        self.assertEqual([icon['clicks'] for icon in data['social_icons_with_clicks']], [2, 3, 4, 5])
+        self.assertEqual(data['most_popular_social'], {'social_icon__social_type': 'linkedin', 'clicks': 5})
+        self.assertEqual(sum(day['clicks'] for day in data['social_clicks_by_day']), 14)
+        self.assertEqual(data['social_clicks_by_day'][-1]['clicks'], 10)
+
+
+
+class AnalyticsExportTests(TestCase):
+    """Exportación de eventos crudos: formatos, gzip, rango de fechas y errores"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        link = Link.objects.create(profile=self.profile, title='Blog', url='https://example.com', order=0)
+        icon = SocialIcon.objects.create(profile=self.profile, social_type='instagram', username='ana',
+                                         url='https://instagram.com/ana', order=0)
+        self.end = timezone.localdate() - timedelta(days=1)
+        self.start = self.end - timedelta(days=2)
+        last_instant = day_start(self.end + timedelta(days=1)) - timedelta(microseconds=1)
+        ProfileView.objects.create(profile=self.profile, timestamp=day_start(self.start), country_code='PE')
+        LinkClick.objects.create(link=link, profile=self.profile, timestamp=last_instant, device_type='mobile')
+        SocialIconClick.objects.create(social_icon=icon, profile=self.profile,
+                                       timestamp=day_start(self.start) + timedelta(hours=12))
+        # Fuera del rango por un microsegundo a cada lado
+        ProfileView.objects.create(profile=self.profile, timestamp=day_start(self.start) - timedelta(microseconds=1))
+        LinkClick.objects.create(link=link, profile=self.profile, timestamp=last_instant + timedelta(microseconds=1))
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def export(self, **params):
+        params = {'start': self.start.isoformat(), 'end': self.end.isoformat(), **params}
+        return self.client.get('/api/linkinbio/analytics/export/', params)
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], f'attachment; filename="ana-analytics-{self.start}.csv"')
+        rows = list(csv.DictReader(io.StringIO(self.content(response).decode('utf-8'))))
+        self.assertEqual([row['event'] for row in rows], ['profile_view', 'link_click', 'social_click'])
+        self.assertEqual(rows[0]['country_code'], 'PE')
+        self.assertEqual((rows[1]['link_title'], rows[1]['device_type']), ('Blog', 'mobile'))
+        self.assertEqual(rows[2]['social_type'], 'instagram')
+
+    def test_ndjson_with_event_filter(self):
+        response = self.export(output='ndjson', events='link_click')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in self.content(response).decode('utf-8').splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['event'], 'link_click')
+        self.assertEqual(records[0]['link_title'], 'Blog')
+        self.assertIsNone(records[0]['social_icon_id'])
+
+    def test_gzip(self):
+        plain = self.content(self.export(output='ndjson'))
+        response = self.export(output='ndjson', gzip='1')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.ndjson.gz"'))
+        self.assertEqual(gzip.decompress(self.content(response)), plain)
+
+    def test_invalid_parameters(self):
+        for params in ({'start': '2024-13-01'}, {'start': self.end.isoformat(), 'end': self.start.isoformat()},
+                       {'output': 'xml'}, {'events': 'link_click,compra'}):
+            with self.subTest(params), self.assertLogs('django.request', 'WARNING'):
+                self.assertEqual(self.export(**params).status_code, 400)
+
+
+class StreamBrokerTests(SimpleTestCase):
+    """Fan-out por perfil, descarte de los mensajes más viejos y baja de suscriptores"""
+
+    async def test_publish_fans_out_to_every_subscriber_of_the_profile(self):
+        broker = Broker()
+        first, second, other = broker.subscribe(1), broker.subscribe(1), broker.subscribe(2)
+        # Los trackers publican desde el hilo de ingestión
+        thread = threading.Thread(target=broker.publish, args=(1, ('link_click', {'id': 7})))
+        thread.start()
+        thread.join()
+
+        self.assertEqual(await first.get(timeout=1), ('link_click', {'id': 7}))
+        self.assertEqual(await second.get(timeout=1), ('link_click', {'id': 7}))
+        self.assertTrue(other.queue.empty())
+
+    @override_settings(LINKS_STREAM_QUEUE_SIZE=2)
+    async def test_slow_subscriber_drops_the_oldest_messages(self):
+        broker = Broker()
+        subscription = broker.subscribe(1)
+        for index in range(3):
+            broker.publish(1, ('profile_view', {'id': index}))
+        await asyncio.sleep(0)
+
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual(await subscription.get(timeout=1), ('profile_view', {'id': 1}))
+        self.assertEqual(await subscription.get(timeout=1), ('profile_view', {'id': 2}))
+
+    async def test_unsubscribe(self):
+        broker = Broker()
+        subscription = broker.subscribe(1)
+        broker.unsubscribe(subscription)
+        self.assertFalse(broker.has_subscribers(1))
+        broker.publish(1, ('link_click', {'id': 7}))
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.queue.empty())
+
+
+class AnalyticsStreamViewTests(TestCase):
+    """El endpoint SSE emite frames ``data:`` y se da de baja al desconectarse el cliente"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.token = str(RefreshToken.for_user(user).access_token)
+
+    def tearDown(self):
+        realtime._windows.clear()
+
+    async def test_emits_frames_and_unsubscribes_on_disconnect(self):
+        response = await self.async_client.get('/api/linkinbio/analytics/stream/', {'token': self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = response.streaming_content
+
+        first = await anext(content)
+        self.assertTrue(first.startswith(b'event: metrics\ndata: {'))
+        self.assertTrue(stream_broker.has_subscribers(self.profile.id))
+
+        stream_broker.publish(self.profile.id, ('link_click', {'id': 7}))
+        self.assertEqual(await anext(content), b'event: link_click\ndata: {"id": 7}\n\n')
+
+        # Al desconectarse el cliente el servidor ASGI cancela la lectura del stream
+        pending = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertFalse(stream_broker.has_subscribers(self.profile.id))
+
+    async def test_requires_a_valid_token(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            response = await self.async_client.get('/api/linkinbio/analytics/stream/', {'token': 'invalido'})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, METRICS_TOKEN='secreto')
+class InstrumentationMiddlewareTests(TestCase):
+    """Consultas y latencia por vista en /metrics/, incluidas las respuestas en streaming"""
+
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=self.user, name='ana', bio='')
+        link = Link.objects.create(profile=self.profile, title='Blog', url='https://example.com', order=0)
+        LinkClick.objects.create(link=link, profile=self.profile, timestamp=timezone.now() - timedelta(hours=1))
+
+    def tearDown(self):
+        registry.reset()
+        realtime._windows.clear()
+
+    def scrape(self):
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def sample(self, text, name, view):
+        match = re.search(rf'^{name}{{view="{view}"}} (\S+)$', text, re.MULTILINE)
+        self.assertIsNotNone(match, f'{name} de {view} no está en /metrics/')
+        return float(match.group(1))
+
+    def test_streamed_queries_and_latency_are_rendered(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/linkinbio/analytics/export/')
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 2)  # cabecera y el click
+
+        text = self.scrape()
+        self.assertIn('http_requests_total{view="analytics_export",method="GET",status="200"} 1', text)
+        self.assertEqual(self.sample(text, 'db_queries_per_request_count', 'analytics_export'), 1)
+        # El perfil en la vista y una consulta por tipo de evento al generar el stream
+        self.assertEqual(self.sample(text, 'db_queries_per_request_sum', 'analytics_export'), 4)
+        self.assertEqual(self.sample(text, 'http_request_duration_seconds_count', 'analytics_export'), 1)
+        self.assertGreater(self.sample(text, 'http_request_duration_seconds_sum', 'analytics_export'), 0)
+
+    async def test_async_stream_counts_queries_made_while_streaming(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+
+        def seed_queries():
+            with CaptureQueriesContext(connection) as queries:
+                realtime.get_counts(self.profile.id)
+            realtime._windows.clear()
+            return len(queries)
+
+        seeded = await sync_to_async(seed_queries)()
+        self.assertGreater(seeded, 0)
+
+        response = await self.async_client.get('/api/linkinbio/analytics/stream/', {'token': token})
+        content = response.streaming_content
+        await anext(content)
+        pending = asyncio.ensure_future(anext(content))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+        text = await sync_to_async(self.scrape)()
+        # Usuario y perfil del token, más la siembra de la ventana dentro del stream
+        self.assertEqual(self.sample(text, 'db_queries_per_request_sum', 'analytics_stream'), 2 + seeded)
+        self.assertEqual(self.sample(text, 'http_request_duration_seconds_count', 'analytics_stream'), 1)
+
+    def test_requires_token_or_staff(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer otro')
+            self.assertEqual(response.status_code, 401)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='admin', password='test', is_staff=True))
+        self.assertEqual(client.get('/metrics/').status_code, 200)
+
+
+class AnalyticsCacheTests(TestCase):
+    """Los resultados de AnalyticsService se sirven de cache hasta que cambia la generación"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.link = Link.objects.create(profile=self.profile, title='Blog', url='https://example.com', order=0)
+
+    def basic_analytics(self):
+        with CaptureQueriesContext(connection) as context:
+            result = AnalyticsService(self.profile).get_basic_analytics()
+        return result, len(context.captured_queries)
+
+    def test_second_call_is_served_from_cache(self):
+        first, cold = self.basic_analytics()
+        second, warm = self.basic_analytics()
+        self.assertGreater(cold, 0)
+        self.assertEqual(warm, 0)
+        self.assertEqual(first, second)
+
+    def test_ingestion_flush_bumps_the_generation(self):
+        self.basic_analytics()
+        version = analytics_cache.get_version(self.profile.id)
+        pipeline = IngestionPipeline(MemoryQueue(100), batch_size=10, flush_interval=60)
+        pipeline.backend.put(('link_click', {'profile_id': self.profile.id, 'link_id': self.link.id,
+                                             'timestamp': timezone.now()}))
+        pipeline.flush()
+
+        self.assertGreater(analytics_cache.get_version(self.profile.id), version)
+        result, queries = self.basic_analytics()
+        self.assertGreater(queries, 0)
+        self.assertEqual(result['total_clicks'], 1)
+
+    def test_link_edit_bumps_the_generation(self):
+        self.basic_analytics()
+        self.link.title = 'Tienda'
+        self.link.save()
+        result, queries = self.basic_analytics()
+        self.assertGreater(queries, 0)
+        self.assertEqual(result['links_data'][0]['title'], 'Tienda')
+
+
+class CounterBufferTests(TestCase):
+    """Los contadores legacy se agrupan en un UPDATE por contador y no pierden deltas"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.link = Link.objects.create(profile=self.profile, title='Blog', url='https://example.com', order=0)
+
+    def test_increments_are_coalesced_into_one_update(self):
+        buffer = counters.CounterBuffer()
+        for _ in range(5):
+            buffer.add(Link, self.link.pk, 'clicks')
+        buffer.add(Profile, self.profile.pk, 'views', amount=2)
+        self.assertEqual(buffer.pending(Link, self.link.pk, 'clicks'), 5)
+
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(context.captured_queries), 2)
+        self.assertIn('"clicks" + 5', context.captured_queries[0]['sql'])
+        self.link.refresh_from_db()
+        self.profile.refresh_from_db()
+        self.assertEqual((self.link.clicks, self.profile.views), (5, 2))
+        self.assertEqual(buffer.pending(Link, self.link.pk, 'clicks'), 0)
+
+    def test_delta_survives_a_db_error(self):
+        buffer = counters.CounterBuffer()
+        buffer.add(Link, self.link.pk, 'clicks', amount=3)
+        with mock.patch('links.counters.apply_increment', side_effect=OperationalError('db caída')), \
+                self.assertLogs('links.counters', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending(Link, self.link.pk, 'clicks'), 3)
+
+        buffer.add(Link, self.link.pk, 'clicks')
+        self.assertEqual(buffer.flush(), 1)
+        self.link.refresh_from_db()
+        self.assertEqual(self.link.clicks, 4)
+
+    @override_settings(LINKS_TRACKING_BACKEND='sync')
+    def test_sync_backend_applies_immediately(self):
+        counters.increment(Link, self.link.pk, 'clicks')
+        self.link.refresh_from_db()
+        self.assertEqual(self.link.clicks, 1)
+        self.assertEqual(counters.buffer.pending(Link, self.link.pk, 'clicks'), 0)
+
+
+class RollupQueryTests(TestCase):
+    """Rollups más eventos crudos dan lo mismo que solo eventos crudos"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.links = [
+            Link.objects.create(profile=self.profile, title=title, url='https://example.com', order=order, type=kind)
+            for order, (title, kind) in enumerate((('Blog', 'generic'), ('Canal', 'youtube')))
+        ]
+        self.today = timezone.localdate()
+        self.now = timezone.now()
+        # Eventos justo en los bordes de cada día local y a mitad del día
+        for offset in range(4):
+            start = day_start(self.today - timedelta(days=offset))
+            end = day_start(self.today - timedelta(days=offset - 1))
+            for index, timestamp in enumerate((start, start + timedelta(hours=6), end - timedelta(microseconds=1))):
+                if timestamp > self.now:
+                    continue
+                device, country = (('mobile', 'PE'), ('desktop', 'MX'), ('tablet', ''))[index]
+                ProfileView.objects.create(profile=self.profile, timestamp=timestamp, device_type=device,
+                                           country_code=country, referrer='https://t.co/x')
+                LinkClick.objects.create(link=self.links[index % 2], profile=self.profile, timestamp=timestamp,
+                                         device_type=device, country_code=country, referrer='https://google.com')
+
+    def snapshot(self, start):
+        query = RollupQuery(self.profile, start, self.now)
+        result = {'daily': query.daily('click'), 'links_daily': query.daily_counts('click', 'link')}
+        for metric in ('view', 'click'):
+            for dimension in DIMENSIONS[metric]:
+                result[(metric, dimension)] = query.counts(metric, dimension)
+        return query, result
+
+    def test_rollups_plus_raw_tail_match_raw_events(self):
+        starts = {
+            'first day aligned': day_start(self.today - timedelta(days=3)),
+            'partial first day': day_start(self.today - timedelta(days=2)) + timedelta(hours=3),
+            'starts at last microsecond': day_start(self.today - timedelta(days=2)) - timedelta(microseconds=1),
+            'all time': ALL_TIME,
+        }
+        raw_only = {}
+        for name, start in starts.items():
+            query, raw_only[name] = self.snapshot(start)
+            self.assertIsNone(query.rollup_days)
+
+        for offset in range(3, 0, -1):
+            build_day(self.today - timedelta(days=offset))
+        RollupWatermark.objects.create(first_day=self.today - timedelta(days=3),
+                                       last_day=self.today - timedelta(days=1))
+
+        for name, start in starts.items():
+            with self.subTest(name):
+                query, combined = self.snapshot(start)
+                self.assertIsNotNone(query.rollup_days)
+                self.assertEqual(combined, raw_only[name])
+
+    def test_rollups_of_deleted_links_are_not_counted(self):
+        for offset in range(3, 0, -1):
+            build_day(self.today - timedelta(days=offset))
+        RollupWatermark.objects.create(first_day=self.today - timedelta(days=3),
+                                       last_day=self.today - timedelta(days=1))
+        kept = LinkClick.objects.filter(link=self.links[0]).count()
+
+        self.links[1].delete()
+        service = AnalyticsService(self.profile)
+        basic = service.get_basic_analytics()
+        self.assertEqual(basic['total_clicks'], kept)
+        self.assertEqual([link['clicks'] for link in basic['links_data']], [kept])
+        detailed = service.get_detailed_analytics('7d')
+        self.assertEqual(detailed['total_clicks'], kept)
+        self.assertEqual(sum(day['clicks'] for day in detailed['clicks_by_day']), kept)
+
+
+class EventCompactionTests(TestCase):
+    """Compactar eventos crudos no pierde datos ni cambia los totales del dashboard"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.link = Link.objects.create(profile=self.profile, title='Blog', url='https://example.com', order=0)
+        self.today = timezone.localdate()
+        for offset in (10, 5, 0):
+            noon = day_start(self.today - timedelta(days=offset)) + timedelta(hours=12)
+            ProfileView.objects.create(profile=self.profile, timestamp=noon)
+            LinkClick.objects.create(link=self.link, profile=self.profile, timestamp=noon)
+
+    def build_rollups(self, first_offset):
+        for offset in range(first_offset, 0, -1):
+            build_day(self.today - timedelta(days=offset))
+        RollupWatermark.objects.create(first_day=self.today - timedelta(days=first_offset),
+                                       last_day=self.today - timedelta(days=1))
+
+    def test_totals_are_unchanged_after_compaction(self):
+        self.build_rollups(10)
+        before = AnalyticsService(self.profile).get_basic_analytics()
+
+        result = compact_events(self.today - timedelta(days=2))
+        self.assertEqual(result['click'], 2)
+        self.assertEqual(AnalyticsService(self.profile).get_basic_analytics(), before)
+        self.assertEqual((before['total_views'], before['total_clicks']), (3, 3))
+        self.assertEqual(before['links_data'][0]['clicks'], 3)
+
+    def test_range_totals_are_unchanged_when_its_partial_first_day_is_compacted(self):
+        # El rango '30d' empieza a mediodía de hace 30 días: ese día es parcial
+        now = day_start(self.today) + timedelta(hours=12)
+        first_day = self.today - timedelta(days=30)
+        afternoon = day_start(first_day) + timedelta(hours=13)
+        ProfileView.objects.create(profile=self.profile, timestamp=afternoon)
+        LinkClick.objects.create(link=self.link, profile=self.profile, timestamp=afternoon)
+        self.build_rollups(30)
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            before = AnalyticsService(self.profile).get_detailed_analytics('30d')
+            compact_events(self.today - timedelta(days=20))
+            cache.clear()
+            after = AnalyticsService(self.profile).get_detailed_analytics('30d')
+
+        self.assertEqual((before['total_views'], before['total_clicks']), (4, 4))
+        self.assertEqual((after['total_views'], after['total_clicks']), (4, 4))
+        self.assertEqual(after['clicks_by_country'], before['clicks_by_country'])
+
+    def test_command_rejects_retention_shorter_than_the_longest_range(self):
+        self.build_rollups(10)
+        with self.assertRaises(CommandError):
+            call_command('compact_analytics_events', days=MIN_RETENTION_DAYS - 1, stdout=StringIO())
+        self.assertEqual(LinkClick.objects.count(), 3)
+
+    def test_refuses_to_delete_days_without_rollups(self):
+        # build_analytics_rollups --from dejó fuera el día más antiguo con eventos
+        self.build_rollups(5)
+        with self.assertRaises(ValueError):
+            compact_events(self.today - timedelta(days=2))
+        self.assertEqual(LinkClick.objects.count(), 3)
+        self.assertIsNone(RollupWatermark.objects.get().compacted_through)
+
+
+class ClickDeduplicatorTests(TestCase):
+    """Clicks repetidos del mismo visitante dentro de la ventana se cuentan una vez"""
+
+    def test_repeated_click_within_window_is_duplicate(self):
+        now = [1000.0]
+        deduplicator = ClickDeduplicator(window=10, capacity=1000, clock=lambda: now[0])
+        self.assertFalse(deduplicator.seen(b'a' * 16))
+        now[0] += 9.9
+        self.assertTrue(deduplicator.seen(b'a' * 16))
+        self.assertFalse(deduplicator.seen(b'b' * 16))
+
+    def test_click_after_window_is_counted_again(self):
+        now = [1000.0]
+        deduplicator = ClickDeduplicator(window=10, capacity=1000, clock=lambda: now[0])
+        deduplicator.seen(b'a' * 16)
+        now[0] += 13
+        self.assertFalse(deduplicator.seen(b'a' * 16))
+
+
+class PublicProfileDocumentTests(TestCase):
+    """El documento cacheado se valida contra la revisión del perfil en la BD"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.link = Link.objects.create(profile=self.profile, title='Blog', url='https://example.com', order=0)
+
+    def get(self, **headers):
+        return self.client.get(f'/api/linkinbio/public/profiles/{self.profile.slug}/', **headers)
+
+    def test_stale_document_from_another_worker_is_not_served(self):
+        response = self.get()
+        etag = response['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Otro worker guarda el cambio: la reconstrucción on_commit no llega a esta cache
+        self.link.title = 'Tienda'
+        self.link.save()
+        self.assertIsNotNone(cache.get(f'public_profile:{self.profile.slug}'))
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Tienda', response.content)
+        self.assertEqual(public_profile.get_document(self.profile.slug)[0], response['ETag'])
+
+
+class IngestionRetryTests(TestCase):
+    """Un lote que falla al escribirse en la BD vuelve a la cola en vez de perderse"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+
+    def assert_batch_survives_failure(self, backend):
+        pipeline = IngestionPipeline(backend, batch_size=10, flush_interval=60)
+        for _ in range(3):
+            backend.put(('profile_view', {'profile_id': self.profile.id, 'timestamp': timezone.now()}))
+
+        with mock.patch('links.ingestion.insert_events', side_effect=OperationalError('db caída')):
+            with self.assertRaises(OperationalError):
+                pipeline.flush()
+            self.assertEqual(backend.size(), 3)
+            self.assertEqual(ProfileView.objects.count(), 0)
+
+        self.assertEqual(pipeline.flush(), 3)
+        self.assertEqual(backend.size(), 0)
+        self.assertEqual(ProfileView.objects.count(), 3)
+
+    def test_memory_queue(self):
+        self.assert_batch_survives_failure(MemoryQueue(100))
+
+    def test_sqlite_spool(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = SQLiteSpool(os.path.join(directory, 'spool.sqlite3'), 100)
+            self.assert_batch_survives_failure(spool)
+            # Un lote reclamado por un proceso que murió se reintenta al vencer el reclamo
+            spool.put(('profile_view', {'profile_id': self.profile.id, 'timestamp': timezone.now()}))
+            spool.claim(10)
+            self.assertEqual(spool.claim(10)[1], [])
+            with mock.patch('links.ingestion.SPOOL_LEASE_SECONDS', -1):
+                self.assertEqual(len(spool.claim(10)[1]), 1)
+
+    def submit_with_db_down(self):
+        backend = MemoryQueue(1)
+        pipeline = IngestionPipeline(backend, batch_size=10, flush_interval=60)
+        backend.put(('profile_view', {'profile_id': self.profile.id, 'timestamp': timezone.now()}))
+        with mock.patch.object(pipeline, 'ensure_worker'), self.assertLogs('links.ingestion', 'ERROR'), \
+                mock.patch('links.ingestion.insert_events', side_effect=OperationalError('db caída')):
+            # Cola llena: el request intenta vaciar un lote y la BD falla
+            pipeline.submit('profile_view', {'profile_id': self.profile.id, 'timestamp': timezone.now()})
+        return backend
+
+    def test_full_queue_with_db_down_drops_the_event_without_failing(self):
+        with override_settings(LINKS_TRACKING_OVERFLOW='drop'):
+            backend = self.submit_with_db_down()
+        self.assertEqual(backend.size(), 1)
+
+    def test_full_queue_with_db_down_keeps_the_event_when_configured(self):
+        with override_settings(LINKS_TRACKING_OVERFLOW='keep'):
+            backend = self.submit_with_db_down()
+        self.assertEqual(backend.size(), 2)
+
+    def test_spool_size_ignores_gaps_left_by_acked_batches(self):
+        with tempfile.TemporaryDirectory() as directory:
+            spool = SQLiteSpool(os.path.join(directory, 'spool.sqlite3'), 100)
+            for _ in range(3):
+                spool.put(('profile_view', {'profile_id': self.profile.id}))
+            spool.claim(1)
+            token, _ = spool.claim(1)
+            spool.ack(token)
+            self.assertEqual(spool.size(), 2)
+
+
+class RealtimeWindowTests(TestCase):
+    """Las ventanas en memoria de perfiles inactivos no se acumulan en el worker"""
+
+    def tearDown(self):
+        realtime._windows.clear()
+
+    def test_idle_windows_are_pruned(self):
+        idle, active = realtime.get_window(1), realtime.get_window(2)
+        idle.last_used -= realtime.WINDOW_MINUTES * 60 + 1
+        active.last_used -= realtime.WINDOW_MINUTES * 60 + 1
+        # Un evento reciente mantiene viva la ventana
+        realtime.record_event('profile_view', 2, timezone.now(), '1.2.3.4')
+
+        self.assertEqual(realtime.prune(), 1)
+        self.assertEqual(set(realtime._windows), {2})
+
+
+class HyperLogLogTests(SimpleTestCase):
+    """El estimador respeta su error estándar y la unión de registros"""
+
+    def test_estimate_is_within_error_bounds(self):
+        bound = 3 * HyperLogLog.relative_error()
+        for n in (50, 1000, 20000):
+            sketch = HyperLogLog().update(f'10.0.{i // 256}.{i % 256}-{n}' for i in range(n))
+            self.assertLessEqual(abs(sketch.count() - n) / n, bound, n)
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_merge_is_register_max_and_estimates_the_union(self):
+        first = HyperLogLog().update(f'ip-{i}' for i in range(6000))
+        second = HyperLogLog().update(f'ip-{i}' for i in range(4000, 10000))
+        expected = bytearray(map(max, first.registers, second.registers))
+
+        union = HyperLogLog.union([first, second])
+        merged = HyperLogLog(first.registers).merge(second)
+        self.assertEqual(merged.registers, expected)
+        self.assertEqual(union.registers, expected)
+        self.assertLessEqual(abs(merged.count() - 10000) / 10000, 3 * HyperLogLog.relative_error())
+
+        # Idempotente y sin pérdida al serializar
+        self.assertEqual(HyperLogLog(merged.registers).merge(merged).registers, expected)
+        self.assertEqual(HyperLogLog.from_bytes(merged.to_bytes()).registers, expected)
+
+
+class SpaceSavingTests(SimpleTestCase):
+    """El top-K encuentra los ítems frecuentes y acota el error de cada conteo"""
+
+    def stream(self, seed):
+        # Tres ítems dominantes y una cola larga de ítems raros, intercalados
+        items = []
+        for i in range(400):
+            items += ['google.com'] * 5 + ['t.co'] * 3 + (['instagram.com'] if i % 2 else [])
+            items.append(f'rare-{seed}-{i % 150}.example')
+        return items
+
+    def assert_guarantees(self, summary, items):
+        true = {}
+        for item in items:
+            true[item] = true.get(item, 0) + 1
+        self.assertEqual(summary.total, len(items))
+        for item, (count, error) in summary.counters.items():
+            # Nunca subestima y el error declarado cubre la sobreestimación
+            self.assertLessEqual(count - error, true[item], item)
+            self.assertGreaterEqual(count, true[item], item)
+        for item, count in true.items():
+            if item not in summary.counters:
+                self.assertLessEqual(count, summary.minimum(), item)
+            if count > summary.total / summary.k:
+                self.assertIn(item, summary.counters)
+
+    def test_top_k_and_error_guarantee(self):
+        items = self.stream('a')
+        summary = SpaceSaving(10)
+        for item in items:
+            summary.add(item)
+        self.assertEqual(len(summary.counters), 10)
+        self.assertEqual([item for item, _ in summary.top(3)], ['google.com', 't.co', 'instagram.com'])
+        self.assert_guarantees(summary, items)
+
+    def test_merge_keeps_guarantees(self):
+        first_items, second_items = self.stream('a'), self.stream('b')
+        first, second = SpaceSaving(10), SpaceSaving(10)
+        for item in first_items:
+            first.add(item)
+        for item in second_items:
+            second.add(item)
+        merged = SpaceSaving.from_dict(first.to_dict()).merge(second)
+        self.assertEqual(len(merged.counters), 10)
+        self.assertEqual(merged.top(1)[0][0], 'google.com')
+        self.assert_guarantees(merged, first_items + second_items)
+
+
+class ReferrerStatsTests(TestCase):
+    """Los días sin resumen top-K se cuentan desde los eventos crudos"""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.link = Link.objects.create(profile=self.profile, title='Blog', url='https://example.com', order=0)
+
+    def click(self, day, referrer):
+        return LinkClick.objects.create(link=self.link, profile=self.profile, referrer=referrer,
+                                        timestamp=day_start(day) + timedelta(hours=12))
+
+    def test_days_without_sketch_fall_back_to_raw_events(self):
+        today = timezone.localdate()
+        # Hoy pasó por la ingestión (tiene resumen); ayer se cargó directo en la BD
+        ingested = [self.click(today, 'https://www.instagram.com/p/1'), self.click(today, '')]
+        referrers.record_referrers('click', ingested)
+        for referrer in ('https://t.co/abc', 'https://x.com/ana', 'https://google.com/search'):
+            self.click(today - timedelta(days=1), referrer)
+
+        stats = AnalyticsService(self.profile).get_referrer_stats('7d', metric='click')
+        self.assertEqual(stats['total'], 5)
+        self.assertEqual({row['host']: row['count'] for row in stats['referrers']},
+                         {'twitter.com': 2, 'instagram.com': 1, 'google.com': 1})
+        self.assertEqual({row['source']: row['count'] for row in stats['sources']},
+                         {'twitter': 2, 'instagram': 1, 'search': 1, 'direct': 1})
+
+
+class SketchRebuildTests(TestCase):
+    """Los sketches de hoy los mantiene la ingestión: solo se recalculan días cerrados"""
+
+    def setUp(self):
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.today = timezone.localdate()
+
+    def view(self, day, ip_address):
+        return ProfileView.objects.create(profile=self.profile, ip_address=ip_address, referrer='https://t.co/x',
+                                          timestamp=day_start(day) + timedelta(hours=12))
+
+    def test_today_is_never_rebuilt(self):
+        views = [self.view(self.today, '1.1.1.1')]
+        visitors.record_views(views)
+        referrers.record_referrers('view', views)
+
+        for module in (visitors, referrers):
+            with self.assertRaises(ValueError):
+                module.build_day(self.today)
+        call_command('build_analytics_sketches', to_date=self.today.isoformat(), stdout=StringIO())
+        self.assertEqual(VisitorSketch.objects.get().day, self.today)
+        self.assertEqual(ReferrerSketch.objects.get().day, self.today)
+
+    def test_closed_days_are_rebuilt(self):
+        yesterday = self.today - timedelta(days=1)
+        self.view(yesterday, '1.1.1.1')
+        self.view(yesterday, '2.2.2.2')
+        self.assertEqual(visitors.build_day(yesterday), 1)
+        self.assertEqual(referrers.build_day(yesterday), 1)
+        self.assertEqual(visitors.unique_visitors(self.profile, yesterday, yesterday), 2)
+
+
+class RangeTableResolverTests(SimpleTestCase):
+    """Búsqueda binaria en la tabla de rangos: bordes, huecos y fuera de la tabla"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.directory.name, 'ranges.csv')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(
+                'start,end,code,name\n'
+                '8.8.8.0,8.8.8.255,us,United States\n'
+                '1.0.0.0,1.0.0.255,AU,Australia\n'
+                '16777472,16778239,CN,\n'  # 1.0.1.0 - 1.0.3.255 como enteros
+                'no-es-ip,1.2.3.4,XX,Roto\n'
+                '2001:db8::,2001:db8::ffff,DE,Germany\n'
+            )
+        cls.resolver = RangeTableResolver(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def test_range_boundaries(self):
+        self.assertEqual(len(self.resolver), 4)
+        self.assertEqual(self.resolver.resolve('1.0.0.0'), ('Australia', 'AU'))
+        self.assertEqual(self.resolver.resolve('1.0.0.255'), ('Australia', 'AU'))
+        # Rangos contiguos: el primer IP del siguiente ya es del otro país
+        self.assertEqual(self.resolver.resolve('1.0.1.0'), ('CN', 'CN'))
+        self.assertEqual(self.resolver.resolve('1.0.3.255'), ('CN', 'CN'))
+        self.assertEqual(self.resolver.resolve('8.8.8.8'), ('United States', 'US'))
+        self.assertEqual(self.resolver.resolve('2001:db8::ffff'), ('Germany', 'DE'))
+
+    def test_misses(self):
+        for ip in ('0.255.255.255', '1.0.4.0', '8.8.7.255', '8.8.9.0', '255.255.255.255',
+                   '2001:db8::1:0', '::1', 'no-es-ip', '', None):
+            self.assertIsNone(self.resolver.resolve(ip), ip)
+
+
+class GeoBackfillTests(TestCase):
+    """Corrección del país por lotes de pk: cada evento se actualiza una sola vez, también al retomar"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        ranges = os.path.join(self.directory, 'ranges.csv')
+        with open(ranges, 'w', encoding='utf-8') as f:
+            f.write('start,end,code,name\n8.8.8.0,8.8.8.255,US,United States\n1.0.0.0,1.0.0.255,AU,Australia\n')
+        overrider = override_settings(LINKS_GEOIP_DATABASE=ranges, LINKS_GEOIP_HTTP_FALLBACK=False)
+        overrider.enable()
+        self.addCleanup(overrider.disable)
+
+        user = User.objects.create_user(username='ana', password='test')
+        self.profile = Profile.objects.create(user=user, name='ana', bio='')
+        self.yesterday = timezone.now() - timedelta(days=1)
+        missing = [('8.8.8.8', 'Unknown', 'XX'), ('1.0.0.1', '', ''), ('8.8.8.9', 'Unknown', ''),
+                   ('1.0.0.1', 'Unknown', 'XX'), ('8.8.8.8', '', 'XX')]
+        views = [
+            ProfileView(profile=self.profile, timestamp=self.yesterday, ip_address=ip, country=country,
+                        country_code=code)
+            for ip, country, code in missing
+        ]
+        # Ya geolocalizado, sin IP y una IP que la tabla no conoce
+        views += [
+            ProfileView(profile=self.profile, ip_address='8.8.8.8', country='Peru', country_code='PE'),
+            ProfileView(profile=self.profile, ip_address=None, country='Unknown', country_code='XX'),
+            ProfileView(profile=self.profile, ip_address='9.9.9.9', country='Unknown', country_code='XX'),
+        ]
+        # pks fijos: los lotes son rangos de pk desde 0
+        for pk, view in enumerate(views, start=1):
+            view.pk = pk
+        ProfileView.objects.bulk_create(views)
+        self.fixable, self.untouched = [1, 2, 3, 4, 5], [6, 7, 8]
+
+    def record_updates(self):
+        """Parchea ``bulk_update`` y devuelve la lista de pks que actualiza"""
+        updated = []
+
+        def bulk_update(queryset, objs, fields, batch_size=None):
+            updated.extend(obj.pk for obj in objs)
+            return original(queryset, objs, fields, batch_size=batch_size)
+
+        original = QuerySet.bulk_update
+        patcher = mock.patch.object(QuerySet, 'bulk_update', autospec=True, side_effect=bulk_update)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return updated
+
+    def assert_fixed(self):
+        countries = dict(ProfileView.objects.values_list('pk', 'country_code'))
+        self.assertEqual([countries[pk] for pk in self.fixable], ['US', 'AU', 'US', 'AU', 'US'])
+        self.assertEqual([countries[pk] for pk in self.untouched], ['PE', 'XX', 'XX'])
+        self.assertEqual(ProfileView.objects.get(pk=self.fixable[0]).country, 'United States')
+
+    def test_small_chunks_update_every_row_once(self):
+        updated = self.record_updates()
+        progress = []
+        with mock.patch('links.geo_backfill.resolve_ips', wraps=geo_backfill.resolve_ips) as resolve:
+            totals, affected = backfill(metrics=['view'], chunk_size=2, workers=2,
+                                        progress=lambda metric, last_pk, max_pk, counts: progress.append(last_pk))
+
+        self.assertEqual(sorted(updated), self.fixable)
+        self.assertEqual(totals, {'view': {'scanned': 6, 'updated': 5}})
+        self.assertEqual(affected, {(self.profile.id, timezone.localtime(self.yesterday).date())})
+        self.assertEqual(progress, [2, 4, 6, 8])
+        # Cada IP se resuelve una sola vez aunque aparezca en varios lotes
+        ips = [ip for call in resolve.call_args_list for ip in call.args[0]]
+        self.assertCountEqual(ips, ['8.8.8.8', '1.0.0.1', '8.8.8.9', '9.9.9.9'])
+        self.assert_fixed()
+
+    def test_dry_run_only_counts(self):
+        updated = self.record_updates()
+        totals, _ = backfill(metrics=['view'], chunk_size=2, dry_run=True)
+        self.assertEqual(totals['view']['updated'], 5)
+        self.assertEqual(updated, [])
+        self.assertEqual(ProfileView.objects.filter(country_code='XX').count(), 5)
+
+    def test_command_resumes_an_interrupted_run(self):
+        updated = self.record_updates()
+        state_file = os.path.join(self.directory, 'state.json')
+        command = 'links.management.commands.backfill_event_geolocation.Command'
+        save_state = import_string(command)._save_state
+
+        def interrupt_after_first_batch(instance, *args):
+            save_state(instance, *args)
+            raise KeyboardInterrupt
+
+        with mock.patch(f'{command}._save_state', autospec=True, side_effect=interrupt_after_first_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('backfill_event_geolocation', metric=['view'], chunk_size=3, workers=1,
+                             state_file=state_file, stdout=StringIO())
+        with open(state_file, encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['last_pk'], {'view': 3})
+        self.assertEqual(sorted(updated), [1, 2, 3])
+
+        out = StringIO()
+        call_command('backfill_event_geolocation', metric=['view'], chunk_size=3, workers=1,
+                     state_file=state_file, stdout=out)
+        self.assertIn('Retomando desde pk view > 3', out.getvalue())
+        self.assertIn('view: 2 de 3 eventos corregidos', out.getvalue())
+        self.assertEqual(sorted(updated), self.fixable)
+        self.assertFalse(os.path.exists(state_file))
+        self.assert_fixed()
@@ -0,0 +1,107 @@
+"""
+Clasificación de user agents para el tracking.
+
+Los patrones de bots se compilan en una sola expresión regular y el
+resultado completo ``(is_bot, device_type)`` se memoiza en un LRU acotado:
+en la práctica unos pocos cientos de user agents distintos generan casi
+todo el tráfico, así que ``user_agents.parse`` se ejecuta una vez por UA.
+
+``intern_user_agents`` reemplaza el texto del user agent de los eventos por
+una referencia a la tabla ``UserAgent`` antes de persistirlos.
+"""
+import hashlib
+import re
+import threading
+from functools import lru_cache
+
+from django.conf import settings
+from user_agents import parse
+
+from .models import UserAgent
+
+BOT_PATTERNS = [
+    r'bot', r'crawler', r'spider', r'scraper',
+    r'facebook', r'twitter', r'linkedin',
+    r'google', r'bing', r'yahoo', r'duckduck',
+    r'telegram', r'whatsapp', r'discord'
+]
+
+BOT_REGEX = re.compile('|'.join(BOT_PATTERNS), re.IGNORECASE)
+
+# UAs más largos que esto no se memoizan (evita que un cliente llene la cache con basura)
+MAX_CACHED_LENGTH = 512
+
+
+def _device_type(user_agent_string):
+    user_agent = parse(user_agent_string)
+    if user_agent.is_mobile:
+        return 'mobile'
+    elif user_agent.is_tablet:
+        return 'tablet'
+    return 'desktop'
+
+
+def _classify(user_agent_string):
+    if not user_agent_string:
+        return False, 'desktop'
+    return BOT_REGEX.search(user_agent_string) is not None, _device_type(user_agent_string)
+
+
+_classify_cached = lru_cache(maxsize=getattr(settings, 'LINKS_UA_CACHE_SIZE', 4096))(_classify)
+
+
+def classify(user_agent_string):
+    """Devuelve ``(is_bot, device_type)`` para un user agent"""
+    if user_agent_string and len(user_agent_string) > MAX_CACHED_LENGTH:
+        return _classify(user_agent_string)
+    return _classify_cached(user_agent_string or '')
+
+
+def cache_info():
+    return _classify_cached.cache_info()
+
+
+# ===== DIMENSIÓN UserAgent =====
+
+_agent_ids = {}
+_agent_ids_lock = threading.Lock()
+
+
+def user_agent_hash(user_agent_string):
+    return hashlib.sha1(user_agent_string.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def get_user_agent_ids(values):
+    """
+    ``{user_agent: id}`` para un conjunto de user agents, creando los que no
+    existen. Una consulta de lectura y, solo si hay nuevos, un bulk_create.
+    """
+    values = {value for value in values if value}
+    with _agent_ids_lock:
+        result = {value: _agent_ids[value] for value in values if value in _agent_ids}
+    missing = {user_agent_hash(value): value for value in values if value not in result}
+    if not missing:
+        return result
+
+    found = dict(UserAgent.objects.filter(hash__in=missing).values_list('hash', 'id'))
+    new = [UserAgent(hash=key, value=value) for key, value in missing.items() if key not in found]
+    if new:
+        UserAgent.objects.bulk_create(new, ignore_conflicts=True)
+        found.update(UserAgent.objects.filter(hash__in=[agent.hash for agent in new]).values_list('hash', 'id'))
+
+    with _agent_ids_lock:
+        if len(_agent_ids) > getattr(settings, 'LINKS_UA_CACHE_SIZE', 4096):
+            _agent_ids.clear()
+        for key, agent_id in found.items():
+            _agent_ids[missing[key]] = agent_id
+            result[missing[key]] = agent_id
+    return result
+
+
+def intern_user_agents(rows):
+    """Cambia ``user_agent`` por ``agent_id`` en una lista de dicts de campos de eventos"""
+    ids = get_user_agent_ids(row.get('user_agent') for row in rows)
+    for row in rows:
+        value = row.pop('user_agent', '')
+        if value:
+            row['agent_id'] = ids.get(value)
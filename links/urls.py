@@ -5,7 +5,8 @@ from .views import (
     ProfileViewSet, LinkViewSet, UserRegisterView, TestView, AllProfileSlugsView, 
     ProfileViewTracker, LinkClickTracker, AnalyticsView, AnalyticsDetailedView,
     DeviceAnalyticsView, GeographyAnalyticsView, DailyClicksAnalyticsView, RecentActivityView,
-    RealTimeMetricsView, SocialMediaStatsView, SocialIconClickTracker
+    RealTimeMetricsView, SocialMediaStatsView, SocialIconClickTracker, analytics_stream,
+    public_profile_document, AnalyticsExportView, UniqueVisitorsView, ReferrerAnalyticsView
 )
 
 router = DefaultRouter()
@@ -18,6 +19,7 @@ urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profiles/slugs/', AllProfileSlugsView.as_view(), name='all_profile_slugs'),
+    path('public/profiles/<str:slug>/', public_profile_document, name='public_profile_document'),
     path('profile-views/<str:slug>/', ProfileViewTracker.as_view(), name='profile_view_tracker'),
     path('link-clicks/<int:link_id>/', LinkClickTracker.as_view(), name='link_click_tracker'),
     
@@ -30,6 +32,10 @@ urlpatterns = [
     path('analytics/recent-activity/', RecentActivityView.as_view(), name='analytics_recent_activity'),
     path('analytics/realtime/', RealTimeMetricsView.as_view(), name='analytics_realtime'),
     path('analytics/social-media/', SocialMediaStatsView.as_view(), name='analytics_social_media'),
+    path('analytics/stream/', analytics_stream, name='analytics_stream'),
+    path('analytics/unique-visitors/', UniqueVisitorsView.as_view(), name='analytics_unique_visitors'),
+    path('analytics/referrers/', ReferrerAnalyticsView.as_view(), name='analytics_referrers'),
+    path('analytics/export/', AnalyticsExportView.as_view(), name='analytics_export'),
     path('social-click/<int:social_icon_id>/', SocialIconClickTracker.as_view(), name='social_icon_click_tracker'),
     
     path('', include(router.urls)),
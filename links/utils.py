@@ -1,24 +1,14 @@
-import re
-import requests
 from django.conf import settings
-from user_agents import parse
+
+from .geo import get_resolver, is_public_ip, resolve_country_fast
+from .ua import classify
 
 
 def get_device_type(user_agent_string):
     """
     Determina el tipo de dispositivo basado en el User-Agent
     """
-    if not user_agent_string:
-        return 'desktop'
-    
-    user_agent = parse(user_agent_string)
-    
-    if user_agent.is_mobile:
-        return 'mobile'
-    elif user_agent.is_tablet:
-        return 'tablet'
-    else:
-        return 'desktop'
+    return classify(user_agent_string)[1]
 
 
 def get_client_ip(request):
@@ -35,57 +25,14 @@ def get_client_ip(request):
 
 def get_country_from_ip(ip_address):
     """
-    Obtiene el país basado en la IP usando un servicio de geolocalización
-    Manejo graceful de errores para evitar bloqueos
+    Obtiene el país basado en la IP usando la cadena de resolvers de links.geo
+    (cache, base local y, como último recurso, servicios HTTP).
+    Puede bloquear: en el camino del request usar resolve_country_fast.
     """
-    # En desarrollo local con IPs privadas, obtener IP pública real
-    if settings.DEBUG and (not ip_address or ip_address == '127.0.0.1' or ip_address.startswith('192.168.')):
-        try:
-            # Obtener IP pública real para testing en desarrollo
-            public_ip_response = requests.get('https://api.ipify.org?format=json', timeout=3)
-            if public_ip_response.status_code == 200:
-                public_ip = public_ip_response.json().get('ip')
-                if public_ip:
-                    print(f"[DEBUG] IP pública detectada: {public_ip}")
-                    return get_country_from_ip(public_ip)  # Recursiva con IP pública
-        except Exception as e:
-            print(f"[DEBUG] No se pudo obtener IP pública: {e}")
-            return 'Desarrollo Local', 'XX'  # Fallback para desarrollo
-    
-    if not ip_address:
-        return 'Unknown', 'XX'
-    
-    try:
-        # Usar ipapi.co (gratuito, 1000 requests/día)
-        response = requests.get(f'https://ipapi.co/{ip_address}/json/', timeout=2)
-        if response.status_code == 200:
-            data = response.json()
-            country = data.get('country_name', 'Unknown')
-            country_code = data.get('country_code', 'XX')
-            
-            # Verificar que no sea error del servicio
-            if country and country != 'Undefined':
-                return country, country_code
-    except Exception as e:
-        # Log del error en desarrollo para debugging
-        if settings.DEBUG:
-            print(f"[DEBUG] Error obteniendo geolocalización para {ip_address}: {e}")
-    
-    # Fallback: intentar con otro servicio si el primero falla
-    try:
-        response = requests.get(f'http://ip-api.com/json/{ip_address}', timeout=2)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('status') == 'success':
-                country = data.get('country', 'Unknown')
-                country_code = data.get('countryCode', 'XX')
-                return country, country_code
-    except Exception as e:
-        # Log del error en desarrollo para debugging
-        if settings.DEBUG:
-            print(f"[DEBUG] Error con servicio alternativo para {ip_address}: {e}")
-    
-    return 'Unknown', 'XX'
+    if settings.DEBUG and not is_public_ip(ip_address):
+        return 'Desarrollo Local', 'XX'  # Fallback para desarrollo
+
+    return get_resolver().resolve(ip_address) or ('Unknown', 'XX')
 
 
 def extract_request_metadata(request):
@@ -97,8 +44,9 @@ def extract_request_metadata(request):
     referrer = request.META.get('HTTP_REFERER', '')
     device_type = get_device_type(user_agent)
     
-    # Obtener geolocalización (en producción, considera usar un servicio más robusto)
-    country, country_code = get_country_from_ip(ip_address)
+    # Solo cache y base local: si no hay resultado el país queda vacío y
+    # links.geo.GeoEnricher lo completa después de guardar el evento
+    country, country_code = resolve_country_fast(ip_address)
     
     return {
         'ip_address': ip_address,
@@ -114,18 +62,7 @@ def is_bot_request(user_agent_string):
     """
     Detecta si el request viene de un bot/crawler
     """
-    if not user_agent_string:
-        return False
-    
-    bot_patterns = [
-        r'bot', r'crawler', r'spider', r'scraper',
-        r'facebook', r'twitter', r'linkedin',
-        r'google', r'bing', r'yahoo', r'duckduck',
-        r'telegram', r'whatsapp', r'discord'
-    ]
-    
-    user_agent_lower = user_agent_string.lower()
-    return any(re.search(pattern, user_agent_lower) for pattern in bot_patterns)
+    return classify(user_agent_string)[0]
 
 
 def should_track_request(request):
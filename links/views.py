@@ -1,5 +1,14 @@
+import asyncio
 import requests
 import os
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_safe
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
@@ -13,7 +22,17 @@ from .serializers import (
     DailyClicksSerializer, LinkClickSerializer
 )
 from .analytics_service import AnalyticsService
+from .analytics_cache import bump_version
 from .utils import extract_request_metadata, should_track_request
+from .ingestion import track_event
+from .dedup import is_duplicate_click
+from .queries import LinkClickCounts
+from .streaming import broker, format_sse
+from . import realtime
+from . import counters
+from . import public_profile
+from . import export
+from django.conf import settings
 from django.shortcuts import get_object_or_404, redirect
 
 # Vista de prueba
@@ -33,19 +52,15 @@ class ProfileViewTracker(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request, slug, *args, **kwargs):
-        profile = get_object_or_404(Profile, slug=slug)
+        profile_id = get_object_or_404(Profile.objects.only('id'), slug=slug).id
         
         # Incrementar contador legacy (mantener compatibilidad)
-        profile.views += 1
-        profile.save()
+        counters.increment(Profile, profile_id, 'views')
         
         # Nuevo sistema de tracking detallado
         if should_track_request(request):
             metadata = extract_request_metadata(request)
-            ProfileView.objects.create(
-                profile=profile,
-                **metadata
-            )
+            track_event('profile_view', profile_id=profile_id, **metadata)
         
         return Response({'status': 'view tracked'}, status=status.HTTP_200_OK)
 
@@ -53,20 +68,19 @@ class LinkClickTracker(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, link_id, *args, **kwargs):
-        link = get_object_or_404(Link, id=link_id)
+        link = get_object_or_404(Link.objects.only('id', 'profile_id', 'url'), id=link_id)
+
+        # Clicks repetidos del mismo visitante dentro de la ventana no se cuentan
+        if is_duplicate_click(request, 'link', link.id):
+            return redirect(link.url)
         
         # Incrementar contador legacy (mantener compatibilidad)
-        link.clicks += 1
-        link.save()
+        counters.increment(Link, link.id, 'clicks')
         
         # Nuevo sistema de tracking detallado
         if should_track_request(request):
             metadata = extract_request_metadata(request)
-            LinkClick.objects.create(
-                link=link,
-                profile=link.profile,
-                **metadata
-            )
+            track_event('link_click', link_id=link.id, profile_id=link.profile_id, **metadata)
         
         return redirect(link.url)
 
@@ -123,9 +137,15 @@ class ProfileViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def get_queryset(self):
+        queryset = Profile.objects.select_related('user').prefetch_related('links', 'social_icons')
         if self.request.user.is_authenticated:
-            return Profile.objects.filter(user=self.request.user)
-        return Profile.objects.all()
+            return queryset.filter(user=self.request.user)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['link_click_counts'] = LinkClickCounts.last_days(30)
+        return context
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -159,6 +179,11 @@ class LinkViewSet(viewsets.ModelViewSet):
             return Link.objects.filter(profile__user=self.request.user)
         return Link.objects.none()
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['link_click_counts'] = LinkClickCounts.last_days(30)
+        return context
+
     def perform_create(self, serializer):
         profile = Profile.objects.get(user=self.request.user)
         serializer.save(profile=profile)
@@ -172,26 +197,45 @@ class LinkViewSet(viewsets.ModelViewSet):
 
         # Get the profile of the authenticated user
         try:
-            profile = Profile.objects.get(user=request.user)
+            profile = Profile.objects.only('id').get(user=request.user)
         except Profile.DoesNotExist:
             return Response({'detail': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
 
+        new_orders = {}
         for item in reorder_data:
-            link_id = item.get('id')
-            new_order = item.get('order')
+            link_id = item.get('id') if isinstance(item, dict) else None
+            new_order = item.get('order') if isinstance(item, dict) else None
 
             if link_id is None or new_order is None:
                 return Response({'detail': 'Each item must have an id and an order.'}, status=status.HTTP_400_BAD_REQUEST)
-
             try:
-                # Ensure the link belongs to the user's profile
-                link = Link.objects.get(id=link_id, profile=profile)
-                link.order = new_order
-                link.save()
-            except Link.DoesNotExist:
+                new_orders[int(link_id)] = int(new_order)
+            except (TypeError, ValueError):
+                return Response({'detail': 'Each item must have an id and an order.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Una consulta para cargar los enlaces y un solo UPDATE para todos
+        links = {link.id: link for link in Link.objects.filter(profile=profile, id__in=list(new_orders)).only('id', 'order')}
+        for link_id in new_orders:
+            if link_id not in links:
                 return Response({'detail': f'Link with id {link_id} not found or does not belong to user.'}, status=status.HTTP_404_NOT_FOUND)
-            except Exception as e:
-                return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        changed = []
+        for link_id, new_order in new_orders.items():
+            link = links[link_id]
+            if link.order != new_order:
+                link.order = new_order
+                changed.append(link)
+
+        try:
+            with transaction.atomic():
+                Link.objects.bulk_update(changed, ['order'])
+        except Exception as e:
+            return Response({'detail': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        if changed:
+            # bulk_update no envía post_save
+            bump_version(profile.id)
+            public_profile.schedule_rebuild(profile.id)
 
         return Response({'detail': 'Links reordered successfully.'}, status=status.HTTP_200_OK)
 
@@ -327,6 +371,80 @@ class SocialMediaStatsView(APIView):
         return Response(data, status=status.HTTP_200_OK)
 
 
+class UniqueVisitorsView(APIView):
+    """Visitantes únicos estimados del rango (HyperLogLog por día)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            profile = Profile.objects.get(user=request.user)
+        except Profile.DoesNotExist:
+            return Response({'detail': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        time_range = request.query_params.get('time_range', '30d')
+
+        analytics_service = AnalyticsService(profile)
+        data = analytics_service.get_unique_visitors(time_range)
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ReferrerAnalyticsView(APIView):
+    """Referrers normalizados y fuentes de tráfico (instagram, tiktok, direct, ...)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            profile = Profile.objects.get(user=request.user)
+        except Profile.DoesNotExist:
+            return Response({'detail': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        time_range = request.query_params.get('time_range', '30d')
+        metric = request.query_params.get('metric', 'view')
+        if metric not in ('view', 'click', 'social'):
+            return Response({'detail': 'metric debe ser view, click o social.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        analytics_service = AnalyticsService(profile)
+        data = analytics_service.get_referrer_stats(time_range, metric)
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AnalyticsExportView(APIView):
+    """Exportación en streaming de los eventos crudos (CSV o NDJSON, gzip opcional)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            profile = Profile.objects.only('id', 'slug').get(user=request.user)
+        except Profile.DoesNotExist:
+            return Response({'detail': 'Profile not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        # 'format' lo reserva DRF para la negociación de contenido
+        output = request.query_params.get('output', 'csv')
+        if output not in export.FORMATS:
+            return Response({'detail': 'output debe ser csv o ndjson.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since, until = export.parse_date_range(request.query_params.get('start'), request.query_params.get('end'))
+            kinds = export.parse_kinds(request.query_params.get('events'))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip') in ('1', 'true')
+
+        content_type, extension = export.FORMATS[output]
+        filename = f"{profile.slug}-analytics-{timezone.localtime(since).date()}.{extension}"
+        if compress:
+            content_type, filename = 'application/gzip', f'{filename}.gz'
+
+        response = StreamingHttpResponse(
+            export.export_stream(profile, since, until, fmt=output, kinds=kinds, compress=compress),
+            content_type=content_type,
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
 class SocialIconClickTracker(APIView):
     """Tracker para clicks en iconos de redes sociales"""
     permission_classes = [permissions.AllowAny]
@@ -337,6 +455,9 @@ class SocialIconClickTracker(APIView):
         try:
             social_icon = get_object_or_404(SocialIcon, id=social_icon_id)
             print(f"[SocialIconTracker] Found social icon: {social_icon.social_type} -> {social_icon.url}")
+
+            if is_duplicate_click(request, 'social_icon', social_icon.id):
+                return redirect(social_icon.url)
             
             # Tracking detallado
             if should_track_request(request):
@@ -345,14 +466,15 @@ class SocialIconClickTracker(APIView):
                 print(f"[SocialIconTracker] Metadata: {metadata}")
                 
                 try:
-                    click_record = SocialIconClick.objects.create(
-                        social_icon=social_icon,
-                        profile=social_icon.profile,
+                    track_event(
+                        'social_click',
+                        social_icon_id=social_icon.id,
+                        profile_id=social_icon.profile_id,
                         **metadata
                     )
-                    print(f"[SocialIconTracker] Click recorded successfully: {click_record.id}")
+                    print("[SocialIconTracker] Click queued successfully")
                 except Exception as e:
-                    print(f"[SocialIconTracker] Error creating click record: {e}")
+                    print(f"[SocialIconTracker] Error queuing click record: {e}")
             else:
                 print("[SocialIconTracker] Request should NOT be tracked")
             
@@ -362,3 +484,75 @@ class SocialIconClickTracker(APIView):
         except Exception as e:
             print(f"[SocialIconTracker] Error: {e}")
             return Response({'error': str(e)}, status=500)
+
+
+
+# ===== STREAM EN VIVO (SSE, requiere ASGI) =====
+
+def _get_stream_profile(request):
+    """Autentica por header Authorization o ?token= (EventSource no envía headers)"""
+    authenticator = JWTAuthentication()
+    raw_token = request.GET.get('token')
+    if not raw_token:
+        header = authenticator.get_header(request)
+        raw_token = authenticator.get_raw_token(header) if header else None
+    if not raw_token:
+        return None
+    try:
+        user = authenticator.get_user(authenticator.get_validated_token(raw_token))
+    except (InvalidToken, TokenError):
+        return None
+    return Profile.objects.filter(user=user).only('id').first()
+
+
+async def analytics_stream(request):
+    """Stream Server-Sent Events con clicks/vistas nuevos y métricas en tiempo real"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'Este endpoint requiere un servidor ASGI (core.asgi).'}, status=501)
+
+    profile = await sync_to_async(_get_stream_profile)(request)
+    if profile is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=401)
+
+    subscription = broker.subscribe(profile.id)
+    keepalive = getattr(settings, 'LINKS_STREAM_KEEPALIVE_SECONDS', 15)
+
+    async def event_stream():
+        try:
+            counts = await sync_to_async(realtime.get_counts)(profile.id)
+            yield format_sse('metrics', AnalyticsService.build_realtime_metrics(counts, timezone.now()))
+            while True:
+                try:
+                    event, data = await subscription.get(timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                    continue
+                yield format_sse(event, data)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # evitar buffering en proxies (nginx/Render)
+    return response
+
+
+# ===== PERFIL PÚBLICO PRECALCULADO =====
+
+@require_safe
+def public_profile_document(request, slug):
+    """Documento JSON público de un perfil servido desde la cache, con ETag"""
+    # Una consulta por la revisión del perfil; el documento sale de la cache si sigue vigente
+    document = public_profile.get_document(slug)
+    if document is None:
+        return JsonResponse({'detail': 'No encontrado.'}, status=404)
+    etag, body = document
+
+    cache_control = f"public, max-age={getattr(settings, 'LINKS_PUBLIC_PROFILE_MAX_AGE', 60)}, stale-while-revalidate=300"
+    if public_profile.etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
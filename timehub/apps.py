@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TimehubConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'timehub'
+
+    def ready(self):
+        import timehub.signals
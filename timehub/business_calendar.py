@@ -0,0 +1,186 @@
+"""
+Calendario laboral precalculado por país y año.
+
+``YearCalendar`` guarda los días laborables de un año como bitmap (un bit por
+día) con sumas prefijas, de modo que contar días laborables entre dos fechas
+del año es una resta. Un día es laborable si su día de la semana está en
+``Country.work_days`` y no es feriado activo del país; los feriados con
+``is_recurring`` se repiten cada año en el mismo día y mes. Sin país se usan
+lunes a viernes y los feriados globales (``country`` nulo).
+
+Los calendarios se cachean en memoria del proceso por (país, año) junto con
+una marca de la BD (cantidad y último ``updated_at`` de Holiday y Country).
+Cada proceso vuelve a leer la marca como mucho cada
+``TIMEHUB_CALENDAR_CHECK_SECONDS`` y descarta sus calendarios si cambió, así
+que un feriado editado desde otro worker se ve en ese plazo; en el proceso que
+hizo el cambio ``invalidate`` (conectado en timehub.signals) lo aplica al
+instante.
+"""
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from .models import Country, Holiday
+
+DEFAULT_WORK_DAYS = (1, 2, 3, 4, 5)
+
+# Calendarios (país, año) que se conservan por proceso
+MAX_CALENDARS = 512
+
+_calendars: Dict[Tuple[Optional[int], int], 'YearCalendar'] = {}
+_lock = threading.Lock()
+_stamp = None
+_checked_at = None
+
+
+class YearCalendar:
+    """Días laborables y feriados de un país en un año"""
+
+    def __init__(self, year: int, work_days, holidays: Dict[date, Tuple[str, bool]]):
+        self.year = year
+        self.first_day = date(year, 1, 1)
+        self.length = (date(year + 1, 1, 1) - self.first_day).days
+        self.holidays = holidays  # {fecha: (nombre, is_recurring)}
+        work_days = set(work_days or DEFAULT_WORK_DAYS)
+
+        self.bitmap = bytearray((self.length + 7) // 8)
+        self.prefix = array('H', [0]) * (self.length + 1)
+        # isoweekday del 1 de enero, luego avanza de a un día (1=Lunes, 7=Domingo)
+        weekday = self.first_day.isoweekday()
+        for index in range(self.length):
+            working = weekday in work_days and (self.first_day + timedelta(days=index)) not in holidays
+            if working:
+                self.bitmap[index >> 3] |= 1 << (index & 7)
+            self.prefix[index + 1] = self.prefix[index] + working
+            weekday = weekday % 7 + 1
+        self.work_days = work_days
+        self._entries = None
+
+    def index(self, day: date) -> int:
+        return (day - self.first_day).days
+
+    def is_working_day(self, day: date) -> bool:
+        index = self.index(day)
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def count(self, start: date, end: date) -> int:
+        """Días laborables entre ``start`` y ``end`` (inclusive, dentro del año)"""
+        return self.prefix[self.index(end) + 1] - self.prefix[self.index(start)]
+
+    def holiday_name(self, day: date) -> Optional[str]:
+        holiday = self.holidays.get(day)
+        return holiday[0] if holiday else None
+
+    def day_type(self, day: date) -> str:
+        """'holiday', 'non_working' o 'working'"""
+        if day in self.holidays:
+            return 'holiday'
+        if day.isoweekday() not in self.work_days:
+            return 'non_working'
+        return 'working'
+
+    def entries(self) -> Tuple[dict, ...]:
+        """Parte fija del calendario de permisos, un dict por día (se calcula una vez)"""
+        if self._entries is None:
+            entries = []
+            for index in range(self.length):
+                day = self.first_day + timedelta(days=index)
+                entries.append({
+                    'date': day.isoformat(),
+                    'day_type': self.day_type(day),
+                    'is_weekend': day.isoweekday() not in self.work_days,
+                    'is_holiday': day in self.holidays,
+                    'holiday_name': self.holiday_name(day),
+                })
+            self._entries = tuple(entries)
+        return self._entries
+
+    @property
+    def working_days(self) -> int:
+        return self.prefix[self.length]
+
+
+def _load_holidays(country: Optional[Country], year: int) -> Dict[date, Tuple[str, bool]]:
+    holidays = {}
+    rows = Holiday.objects.filter(country=country, is_active=True).filter(
+        Q(date__year=year) | Q(is_recurring=True)
+    ).values_list('name', 'date', 'is_recurring').order_by('date')
+    for name, day, is_recurring in rows:
+        if day.year != year:
+            try:
+                day = day.replace(year=year)
+            except ValueError:
+                continue  # 29 de febrero en un año no bisiesto
+        holidays.setdefault(day, (name, is_recurring))
+    return holidays
+
+
+def db_stamp() -> tuple:
+    """Marca de los datos que alimentan los calendarios; cambia con altas, bajas y ediciones"""
+    holidays = Holiday.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    countries = Country.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return holidays['count'], holidays['updated'], countries['count'], countries['updated']
+
+
+def _check_stamp():
+    """Descarta los calendarios del proceso si la marca de la BD cambió (como mucho cada N segundos)"""
+    global _stamp, _checked_at
+    now = time.monotonic()
+    interval = getattr(settings, 'TIMEHUB_CALENDAR_CHECK_SECONDS', 30)
+    if _checked_at is not None and now - _checked_at < interval:
+        return
+    stamp = db_stamp()
+    with _lock:
+        if stamp != _stamp:
+            _calendars.clear()
+            _stamp = stamp
+        _checked_at = now
+
+
+def get_year(country: Optional[Country], year: int) -> YearCalendar:
+    """Calendario laboral de ``country`` para ``year`` (cacheado en el proceso)"""
+    _check_stamp()
+    key = (country.pk if country else None, year)
+    calendar = _calendars.get(key)
+    if calendar is None:
+        work_days = country.work_days if country else DEFAULT_WORK_DAYS
+        calendar = YearCalendar(year, work_days, _load_holidays(country, year))
+        with _lock:
+            if len(_calendars) >= MAX_CALENDARS:
+                _calendars.clear()
+            _calendars[key] = calendar
+    return calendar
+
+
+def business_days(start_date: date, end_date: date, country: Country) -> int:
+    """Días laborables entre dos fechas (inclusive); una resta por año del rango"""
+    total = 0
+    current = start_date
+    while current <= end_date:
+        year_end = min(end_date, date(current.year, 12, 31))
+        total += get_year(country, current.year).count(current, year_end)
+        current = year_end + timedelta(days=1)
+    return total
+
+
+def holidays_between(start_date: date, end_date: date, country: Country) -> List[dict]:
+    """Feriados del país entre dos fechas, incluidos los recurrentes"""
+    result = []
+    for year in range(start_date.year, end_date.year + 1):
+        for day, (name, is_recurring) in sorted(get_year(country, year).holidays.items()):
+            if start_date <= day <= end_date:
+                result.append({'name': name, 'date': day, 'is_recurring': is_recurring})
+    return result
+
+
+def invalidate(**kwargs):
+    """Descarta los calendarios del proceso y fuerza a releer la marca de la BD"""
+    global _checked_at
+    with _lock:
+        _calendars.clear()
+        _checked_at = None
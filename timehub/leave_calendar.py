@@ -0,0 +1,70 @@
+"""
+Calendario de permisos para LeaveCalendarViewSet.
+
+La parte fija de cada día (tipo de día, fin de semana, feriado) sale del
+calendario laboral cacheado por país y año (timehub.business_calendar). Los
+permisos del usuario se superponen como intervalos: cada solicitud ocupa una
+rebanada ``[inicio, fin]`` del rango consultado y, como antes, la más
+antigua queda encima cuando dos se solapan.
+"""
+from calendar import monthrange
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import business_calendar
+from .models import Country, LeaveRequest
+
+# Estado de los días de una solicitud no aprobada (las demás quedan 'available')
+LEAVE_STATUS = {'SUBMITTED': 'pending'}
+
+
+def day_range(year: int, month: Optional[int] = None) -> Tuple[date, date]:
+    """Primer y último día del año, o del mes si se indica"""
+    if month is None:
+        return date(year, 1, 1), date(year, 12, 31)
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def leave_requests_by_user(user_ids: Iterable[int], start: date, end: date) -> Dict[int, List[LeaveRequest]]:
+    """Solicitudes que tocan el rango, agrupadas por usuario con una sola consulta"""
+    grouped = {}
+    leaves = LeaveRequest.objects.filter(
+        user_id__in=user_ids, start_date__lte=end, end_date__gte=start
+    ).select_related('leave_type').order_by('-created_at', '-id')
+    for leave in leaves:
+        grouped.setdefault(leave.user_id, []).append(leave)
+    return grouped
+
+
+def overlay(leaves: Iterable[LeaveRequest], start: date, end: date) -> List[Optional[LeaveRequest]]:
+    """Solicitud que ocupa cada día del rango (None si ninguna)"""
+    slots = [None] * ((end - start).days + 1)
+    for leave in leaves:
+        first = (max(leave.start_date, start) - start).days
+        last = (min(leave.end_date, end) - start).days
+        if first <= last:
+            slots[first:last + 1] = [leave] * (last - first + 1)
+    return slots
+
+
+def build(country: Optional[Country], leaves: Iterable[LeaveRequest], start: date, end: date,
+          today: date) -> List[dict]:
+    """Días de ``start`` a ``end`` (mismo año) con su parte fija y el estado del permiso"""
+    calendar = business_calendar.get_year(country, start.year)
+    entries = calendar.entries()[calendar.index(start):calendar.index(end) + 1]
+    today_index = (today - start).days
+
+    days = []
+    for index, (entry, leave) in enumerate(zip(entries, overlay(leaves, start, end))):
+        day = dict(entry)
+        if leave is None:
+            day['status'] = 'available'
+        else:
+            if leave.status == 'APPROVED':
+                day['status'] = 'consumed' if index < today_index else 'approved_pending'
+            else:
+                day['status'] = LEAVE_STATUS.get(leave.status, 'available')
+            day['leave_request_id'] = leave.id
+            day['leave_type'] = leave.leave_type.name
+        days.append(day)
+    return days
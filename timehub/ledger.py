@@ -0,0 +1,150 @@
+"""
+Libro de horas aprobadas por proyecto (ProjectHours) y por proyecto-mes
+(ProjectMonthHours).
+
+Cada TimeEntry aprobado aporta ``(proyecto, mes, horas)``. ``TimeEntry.save``
+relee la fila con ``SELECT ... FOR UPDATE``, compara ese aporte con el nuevo y
+aplica la diferencia con ``UPDATE ... SET campo = campo + delta`` en la misma
+transacción: dos aprobaciones concurrentes del mismo registro se serializan y
+la segunda ya no ve cambio. Guardar un registro aprobado sin cambiar su aporte
+solo actualiza ``ProjectHours.updated_at``. Los borrados (también en cascada)
+restan el aporte leído igual desde ``pre_delete``. Las actualizaciones masivas con ``QuerySet.update`` no pasan
+por aquí: ``reconcile`` recalcula el libro desde TimeEntry y corrige la deriva
+(comando ``reconcile_project_hours``).
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import ProjectHours, ProjectMonthHours, TimeEntry
+
+ZERO = Decimal('0.00')
+
+LEDGER_FIELDS = ('status', 'project_id', 'local_date', 'hours_decimal')
+
+
+def contribution(entry):
+    """``(project_id, mes, horas)`` si el registro está aprobado, si no None"""
+    if entry.status != 'APPROVED':
+        return None
+    return entry.project_id, entry.local_date.replace(day=1), Decimal(entry.hours_decimal)
+
+
+def stored_contribution(entry):
+    """
+    Aporte actual en la base del registro que se va a guardar o borrar. La fila
+    queda bloqueada hasta el fin de la transacción (llamar dentro de atomic).
+    """
+    if entry._state.adding or entry.pk is None:
+        return None
+    stored = TimeEntry.objects.select_for_update().filter(pk=entry.pk).only(*LEDGER_FIELDS).first()
+    return contribution(stored) if stored is not None else None
+
+
+def apply_delta(project_id, month, hours, entries):
+    """
+    Suma ``hours`` y ``entries`` (pueden ser negativos) al proyecto y al mes.
+    ``updated_at`` marca el último cambio de horas aprobadas del proyecto.
+    """
+    changes = {
+        'approved_hours': F('approved_hours') + hours,
+        'entry_count': F('entry_count') + entries,
+        'updated_at': timezone.now(),
+    }
+    for model, lookup in ((ProjectHours, {}), (ProjectMonthHours, {'month': month})):
+        rows = model.objects.filter(project_id=project_id, **lookup)
+        # Solo se crean filas al sumar: un borrado en cascada del proyecto no debe recrearlas
+        if not rows.update(**changes) and entries > 0:
+            model.objects.get_or_create(project_id=project_id, **lookup)
+            rows.update(**changes)
+
+
+def touch(project_id):
+    """Marca un cambio de horas aprobadas sin cambiar los totales (invalida las series)"""
+    ProjectHours.objects.filter(project_id=project_id).update(updated_at=timezone.now())
+
+
+def apply_transition(previous, current):
+    """Aplica el cambio de aporte de un TimeEntry (entrar, salir o cambiar dentro de APPROVED)"""
+    if previous == current:
+        if current is not None:
+            # Mismo (proyecto, mes, horas) pero quizá otra semana u otro usuario:
+            # las series de timehub.metrics dependen de esas dimensiones
+            touch(current[0])
+        return
+    if previous is not None:
+        apply_delta(previous[0], previous[1], -previous[2], -1)
+    if current is not None:
+        apply_delta(current[0], current[1], current[2], 1)
+
+
+def expected_months(project_ids=None):
+    """``{(project_id, mes): (horas, registros)}`` calculado desde los TimeEntry aprobados"""
+    entries = TimeEntry.objects.filter(status='APPROVED')
+    if project_ids:
+        entries = entries.filter(project_id__in=project_ids)
+    rows = (
+        entries.annotate(month=TruncMonth('local_date')).order_by()
+        .values('project_id', 'month').annotate(hours=Sum('hours_decimal'), entries=Count('id'))
+    )
+    return {(row['project_id'], row['month']): (row['hours'] or ZERO, row['entries']) for row in rows}
+
+
+def reconcile(project_ids=None, dry_run=False):
+    """
+    Recalcula el libro desde TimeEntry. Devuelve la deriva encontrada como
+    ``[{'project_id', 'month' (None = total), 'expected_hours', 'ledger_hours',
+    'expected_entries', 'ledger_entries'}]`` y, salvo con ``dry_run``, la corrige.
+
+    Las filas del libro se bloquean antes de agregar: una aprobación
+    concurrente espera y aplica su delta sobre el valor corregido.
+    """
+    with transaction.atomic():
+        totals = ProjectHours.objects.select_for_update()
+        months = ProjectMonthHours.objects.select_for_update()
+        if project_ids:
+            totals = totals.filter(project_id__in=project_ids)
+            months = months.filter(project_id__in=project_ids)
+        current_totals = {row.project_id: row for row in totals}
+        current_months = {(row.project_id, row.month): row for row in months}
+
+        expected = expected_months(project_ids)
+        expected_totals = {}
+        for (project_id, _), (hours, entries) in expected.items():
+            total_hours, total_entries = expected_totals.get(project_id, (ZERO, 0))
+            expected_totals[project_id] = (total_hours + hours, total_entries + entries)
+
+        drift = []
+        changes = []
+        for model, current, wanted, month_of in (
+            (ProjectHours, current_totals, expected_totals, lambda key: None),
+            (ProjectMonthHours, current_months, expected, lambda key: key[1]),
+        ):
+            for key in current.keys() | wanted.keys():
+                hours, entries = wanted.get(key, (ZERO, 0))
+                row = current.get(key)
+                ledger = (row.approved_hours, row.entry_count) if row else (ZERO, 0)
+                if ledger == (hours, entries):
+                    continue
+                project_id = key if model is ProjectHours else key[0]
+                drift.append({
+                    'project_id': project_id,
+                    'month': month_of(key),
+                    'expected_hours': hours,
+                    'ledger_hours': ledger[0],
+                    'expected_entries': entries,
+                    'ledger_entries': ledger[1],
+                })
+                if row is None:
+                    lookup = {} if model is ProjectHours else {'month': key[1]}
+                    row = model(project_id=project_id, **lookup)
+                row.approved_hours, row.entry_count = hours, entries
+                changes.append(row)
+
+        if not dry_run:
+            for row in changes:
+                row.save()
+    return drift
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from timehub.ledger import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el libro de horas aprobadas por proyecto y mes desde TimeEntry y reporta la deriva'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help='ID de proyecto a reconciliar (repetible; por defecto todos)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Solo reportar la deriva, sin corregirla')
+
+    def handle(self, *args, **options):
+        drift = reconcile(project_ids=options['projects'], dry_run=options['dry_run'])
+        for row in sorted(drift, key=lambda row: (row['project_id'], row['month'] is not None, row['month'])):
+            scope = row['month'].strftime('%Y-%m') if row['month'] else 'total'
+            self.stdout.write(
+                f"Proyecto {row['project_id']} ({scope}): libro {row['ledger_hours']}h/{row['ledger_entries']} "
+                f"registros, esperado {row['expected_hours']}h/{row['expected_entries']}"
+            )
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('El libro de horas coincide con los registros aprobados'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} filas con deriva (sin corregir)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(drift)} filas con deriva corregidas'))
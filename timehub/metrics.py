@@ -0,0 +1,150 @@
+"""
+Series de horas aprobadas por proyecto para ProjectViewSet.metrics.
+
+``hours_series`` agrupa los TimeEntry aprobados por semana, mes o trimestre
+con una sola consulta (``TruncWeek``/``TruncMonth``/``TruncQuarter``) y
+completa con cero los periodos sin horas. El resultado se cachea con una
+clave que incluye ``ProjectHours.updated_at`` (último guardado o borrado de
+un registro aprobado del proyecto, ver timehub.ledger), así que cualquier
+aprobación, rechazo o edición de un registro aprobado (también cambiarlo de
+semana o de usuario dentro del mismo mes) invalida la cache sin borrarla.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncQuarter, TruncWeek
+
+from .models import Project, ProjectHours, TimeEntry
+
+GRANULARITIES = {
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+}
+
+# Periodos máximos de una serie (p. ej. 10 años por semana)
+MAX_PERIODS = 530
+
+
+def period_start(day: date, granularity: str) -> date:
+    """Primer día del periodo que contiene ``day``"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day.replace(day=1)
+
+
+def next_period(start: date, granularity: str) -> date:
+    if granularity == 'week':
+        return start + timedelta(days=7)
+    months = 3 if granularity == 'quarter' else 1
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1, day=1)
+
+
+def period_label(start: date, granularity: str) -> str:
+    if granularity == 'week':
+        year, week, _ = start.isocalendar()
+        return f'{year}-W{week:02d}'
+    if granularity == 'quarter':
+        return f'{start.year}-Q{(start.month - 1) // 3 + 1}'
+    return start.strftime('%Y-%m')
+
+
+def periods(start: date, end: date, granularity: str) -> List[date]:
+    """Inicios de todos los periodos entre ``start`` y ``end`` (inclusive)"""
+    result = []
+    current = period_start(start, granularity)
+    while current <= end:
+        result.append(current)
+        current = next_period(current, granularity)
+    return result
+
+
+def _as_date(value):
+    # TruncWeek/TruncQuarter pueden devolver datetime según el backend
+    return value.date() if hasattr(value, 'date') and callable(value.date) else value
+
+
+def _zero_filled(starts: List[date], hours: Dict[date, Decimal], granularity: str) -> List[dict]:
+    return [
+        {'period': period_label(start, granularity), 'start': start.isoformat(), 'hours': float(hours.get(start, 0))}
+        for start in starts
+    ]
+
+
+def cache_stamp(project: Project) -> str:
+    """Marca del último cambio de horas aprobadas del proyecto"""
+    try:
+        return project.hours_ledger.updated_at.isoformat()
+    except ProjectHours.DoesNotExist:
+        return 'none'
+
+
+def hours_series(project: Project, start: date, end: date, granularity: str = 'month',
+                 by_user: bool = False) -> dict:
+    """
+    Horas aprobadas de ``project`` entre ``start`` y ``end`` por periodo:
+    ``{'series': [...], 'users': [...]}`` (``users`` solo con ``by_user``).
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity debe ser uno de: {', '.join(GRANULARITIES)}")
+    if start > end:
+        raise ValueError('start debe ser anterior o igual a end')
+    starts = periods(start, end, granularity)
+    if len(starts) > MAX_PERIODS:
+        raise ValueError(f'El rango tiene más de {MAX_PERIODS} periodos; use una granularidad mayor')
+
+    key = (
+        f'timehub_metrics:{project.pk}:{cache_stamp(project)}:'
+        f'{start.isoformat()}:{end.isoformat()}:{granularity}:{int(by_user)}'
+    )
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    fields = ['period', 'user_id', 'user__username'] if by_user else ['period']
+    rows = (
+        TimeEntry.objects.filter(project=project, status='APPROVED', local_date__gte=start, local_date__lte=end)
+        .annotate(period=GRANULARITIES[granularity]('local_date')).order_by()
+        .values(*fields).annotate(hours=Sum('hours_decimal'))
+    )
+
+    totals = {}
+    users = {}
+    for row in rows:
+        period = _as_date(row['period'])
+        totals[period] = totals.get(period, 0) + row['hours']
+        if by_user:
+            user = users.setdefault(row['user_id'], {'username': row['user__username'], 'hours': {}})
+            user['hours'][period] = user['hours'].get(period, 0) + row['hours']
+
+    result = {'series': _zero_filled(starts, totals, granularity)}
+    if by_user:
+        result['users'] = sorted(
+            (
+                {
+                    'user_id': user_id,
+                    'username': user['username'],
+                    'hours': float(sum(user['hours'].values())),
+                    'series': _zero_filled(starts, user['hours'], granularity),
+                }
+                for user_id, user in users.items()
+            ),
+            key=lambda user: (-user['hours'], user['username']),
+        )
+
+    cache.set(key, result, getattr(settings, 'TIMEHUB_METRICS_CACHE_TTL', 3600))
+    return result
+
+
+def parse_range(start: Optional[str], end: Optional[str], today: date):
+    """Rango de la consulta; por defecto los últimos 12 meses hasta hoy"""
+    end_date = date.fromisoformat(end) if end else today
+    start_date = date.fromisoformat(start) if start else (end_date - timedelta(days=365)).replace(day=1)
+    return start_date, end_date
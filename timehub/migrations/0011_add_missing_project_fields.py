@@ -4,6 +4,13 @@ from decimal import Decimal
 import django.core.validators
 
 
+def _add_field(schema_editor, model, field):
+    """schema_editor.add_field necesita un campo ya enlazado a su modelo"""
+    field.set_attributes_from_name(field.name)
+    field.model = model
+    schema_editor.add_field(model, field)
+
+
 def add_fields_conditionally(apps, schema_editor):
     """Add fields only if they don't already exist"""
     db_vendor = connection.vendor
@@ -34,7 +41,8 @@ def add_fields_conditionally(apps, schema_editor):
         
         # Add approved_hours if it doesn't exist
         if 'approved_hours' not in existing_fields:
-            schema_editor.add_field(
+            _add_field(
+                schema_editor,
                 Project,
                 models.DecimalField(
                     name='approved_hours',
@@ -52,7 +60,8 @@ def add_fields_conditionally(apps, schema_editor):
             
         # Add budget if it doesn't exist
         if 'budget' not in existing_fields:
-            schema_editor.add_field(
+            _add_field(
+                schema_editor,
                 Project,
                 models.DecimalField(
                     name='budget',
@@ -70,7 +79,8 @@ def add_fields_conditionally(apps, schema_editor):
             
         # Add priority if it doesn't exist
         if 'priority' not in existing_fields:
-            schema_editor.add_field(
+            _add_field(
+                schema_editor,
                 Project,
                 models.CharField(
                     name='priority',
@@ -91,7 +101,8 @@ def add_fields_conditionally(apps, schema_editor):
             
         # Add project_type if it doesn't exist
         if 'project_type' not in existing_fields:
-            schema_editor.add_field(
+            _add_field(
+                schema_editor,
                 Project,
                 models.CharField(
                     name='project_type',
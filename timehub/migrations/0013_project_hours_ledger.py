@@ -0,0 +1,70 @@
+# Generated manually for the project hours ledger
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def build_ledger(apps, schema_editor):
+    TimeEntry = apps.get_model('timehub', 'TimeEntry')
+    ProjectHours = apps.get_model('timehub', 'ProjectHours')
+    ProjectMonthHours = apps.get_model('timehub', 'ProjectMonthHours')
+
+    rows = (
+        TimeEntry.objects.filter(status='APPROVED')
+        .annotate(month=TruncMonth('local_date')).order_by()
+        .values('project_id', 'month').annotate(hours=Sum('hours_decimal'), entries=Count('id'))
+    )
+    totals = {}
+    months = []
+    for row in rows:
+        hours, entries = totals.get(row['project_id'], (Decimal('0.00'), 0))
+        totals[row['project_id']] = (hours + row['hours'], entries + row['entries'])
+        months.append(ProjectMonthHours(
+            project_id=row['project_id'], month=row['month'],
+            approved_hours=row['hours'], entry_count=row['entries'],
+        ))
+    ProjectMonthHours.objects.bulk_create(months, batch_size=1000)
+    ProjectHours.objects.bulk_create([
+        ProjectHours(project_id=project_id, approved_hours=hours, entry_count=entries)
+        for project_id, (hours, entries) in totals.items()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timehub', '0012_evaluation_system'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('approved_hours', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='hours_ledger', to='timehub.project')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectMonthHours',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('approved_hours', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10)),
+                ('entry_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_hours', to='timehub.project')),
+            ],
+            options={
+                'ordering': ['project', 'month'],
+                'unique_together': {('project', 'month')},
+            },
+        ),
+        migrations.RunPython(build_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Sincroniza el estado de las migraciones con los modelos.
+#
+# Project.approved_hours/budget/priority/project_type los agregó 0011 con un
+# RunPython condicional y Client.country se agregó a mano en algunas bases,
+# así que ninguno estaba en el estado. Se registran en el estado y luego se
+# crean solo las columnas que falten (en SQLite un rehacer de tabla posterior
+# a 0011 pudo haberlas descartado).
+
+import django.core.validators
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+MISSING_FIELDS = [
+    ('Project', 'approved_hours'),
+    ('Project', 'budget'),
+    ('Project', 'priority'),
+    ('Project', 'project_type'),
+    ('Client', 'country'),
+]
+
+
+def add_missing_columns(apps, schema_editor):
+    """Crea las columnas de MISSING_FIELDS que no existan en la base"""
+    connection = schema_editor.connection
+    for model_name, field_name in MISSING_FIELDS:
+        model = apps.get_model('timehub', model_name)
+        field = model._meta.get_field(field_name)
+        with connection.cursor() as cursor:
+            columns = {
+                column.name
+                for column in connection.introspection.get_table_description(cursor, model._meta.db_table)
+            }
+        if field.column not in columns:
+            schema_editor.add_field(model, field)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timehub', '0013_project_hours_ledger'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddField(
+                    model_name='project',
+                    name='approved_hours',
+                    field=models.DecimalField(blank=True, decimal_places=2, help_text='Horas aprobadas para el proyecto', max_digits=8, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+                ),
+                migrations.AddField(
+                    model_name='project',
+                    name='budget',
+                    field=models.DecimalField(blank=True, decimal_places=2, help_text='Presupuesto del proyecto', max_digits=12, null=True, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+                ),
+                migrations.AddField(
+                    model_name='project',
+                    name='priority',
+                    field=models.CharField(choices=[('LOW', 'Low'), ('MEDIUM', 'Medium'), ('HIGH', 'High'), ('CRITICAL', 'Critical')], default='MEDIUM', help_text='Prioridad del proyecto', max_length=10),
+                ),
+                migrations.AddField(
+                    model_name='project',
+                    name='project_type',
+                    field=models.CharField(blank=True, choices=[('FIXED_PRICE', 'Fixed Price'), ('TIME_MATERIAL', 'Time & Material'), ('RETAINER', 'Retainer')], help_text='Tipo de proyecto', max_length=20, null=True),
+                ),
+                migrations.AddField(
+                    model_name='client',
+                    name='country',
+                    field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clients', to='timehub.country'),
+                ),
+            ],
+        ),
+        # Al revertir las columnas se conservan: volver a aplicar las detecta
+        migrations.RunPython(add_missing_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,143 @@
+# Alinea las evaluaciones y los seguimientos de proyecto con los modelos.
+#
+# * Evaluaciones: los modelos declaran unique_together en lugar de las
+#   UniqueConstraint con nombre de 0012. Las bases nuevas tienen esas
+#   constraints y algunas bases de producción solo un índice único con otro
+#   nombre, así que el cambio es solo de estado: la unicidad ya existe en la
+#   base y únicamente se crea si no hay ningún índice único sobre las columnas.
+# * EmployeeEvaluation.status: nuevas opciones (sin cambios en la base).
+# * ProjectFollowUp.id pasa a BigAutoField como el resto de la app. En
+#   PostgreSQL esto reescribe la tabla (y sus FKs): aplicar en una ventana de
+#   mantenimiento si la tabla es grande.
+# * Índices de ProjectFollowUp: si la base ya tiene un índice sobre las mismas
+#   columnas (creado a mano en producción) se renombra, si no se crea.
+
+from django.db import migrations, models
+
+
+UNIQUE_TOGETHER = [
+    ('employeeevaluation', ('employee', 'quarter')),
+    ('evaluationobjective', ('evaluation', 'objective')),
+    ('objective', ('role', 'category', 'title')),
+    ('quarter', ('year', 'quarter')),
+]
+
+FOLLOWUP_INDEXES = [
+    models.Index(fields=['project', 'follow_up_date'], name='timehub_pro_project_9c2448_idx'),
+    models.Index(fields=['status'], name='timehub_pro_status_400eea_idx'),
+]
+
+
+def _constraints(schema_editor, model):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        return connection.introspection.get_constraints(cursor, model._meta.db_table)
+
+
+def _columns(model, field_names):
+    return [model._meta.get_field(name).column for name in field_names]
+
+
+def ensure_unique_together(apps, schema_editor):
+    """Crea la restricción única solo si ningún índice único cubre ya las columnas"""
+    for model_name, fields in UNIQUE_TOGETHER:
+        model = apps.get_model('timehub', model_name)
+        columns = _columns(model, fields)
+        constraints = _constraints(schema_editor, model).values()
+        if not any(c['unique'] and c['columns'] == columns for c in constraints):
+            schema_editor.alter_unique_together(model, set(), {fields})
+
+
+def ensure_followup_indexes(apps, schema_editor):
+    """Crea los índices de ProjectFollowUp o renombra los equivalentes existentes"""
+    model = apps.get_model('timehub', 'ProjectFollowUp')
+    for index in FOLLOWUP_INDEXES:
+        constraints = _constraints(schema_editor, model)
+        if index.name in constraints:
+            continue
+        columns = _columns(model, index.fields)
+        existing = [
+            name for name, c in constraints.items()
+            if c['index'] and not c['unique'] and not c['primary_key'] and c['columns'] == columns
+        ]
+        if existing:
+            schema_editor.rename_index(model, models.Index(fields=index.fields, name=existing[0]), index)
+        else:
+            schema_editor.add_index(model, index)
+
+
+def remove_followup_indexes(apps, schema_editor):
+    model = apps.get_model('timehub', 'ProjectFollowUp')
+    constraints = _constraints(schema_editor, model)
+    for index in FOLLOWUP_INDEXES:
+        if index.name in constraints:
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('timehub', '0014_sync_model_state'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name='employeeevaluation',
+                    name='unique_employee_quarter',
+                ),
+                migrations.RemoveConstraint(
+                    model_name='evaluationobjective',
+                    name='unique_evaluation_objective',
+                ),
+                migrations.RemoveConstraint(
+                    model_name='objective',
+                    name='unique_role_category_title',
+                ),
+                migrations.RemoveConstraint(
+                    model_name='quarter',
+                    name='unique_year_quarter',
+                ),
+                migrations.AlterUniqueTogether(
+                    name='employeeevaluation',
+                    unique_together={('employee', 'quarter')},
+                ),
+                migrations.AlterUniqueTogether(
+                    name='evaluationobjective',
+                    unique_together={('evaluation', 'objective')},
+                ),
+                migrations.AlterUniqueTogether(
+                    name='objective',
+                    unique_together={('role', 'category', 'title')},
+                ),
+                migrations.AlterUniqueTogether(
+                    name='quarter',
+                    unique_together={('year', 'quarter')},
+                ),
+            ],
+            # Al revertir se conserva la unicidad que ya hubiera en la base
+            database_operations=[
+                migrations.RunPython(ensure_unique_together, migrations.RunPython.noop),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='employeeevaluation',
+            name='status',
+            field=models.CharField(choices=[('ASSIGNED', 'Objetivos Asignados'), ('OBJECTIVES_SENT', 'Objetivos Enviados'), ('IN_PROGRESS', 'En Progreso'), ('PENDING_REVIEW', 'Pendiente de Revisión'), ('COMPLETED', 'Completada'), ('CANCELLED', 'Cancelada')], default='ASSIGNED', max_length=20, verbose_name='Estado'),
+        ),
+        migrations.AlterField(
+            model_name='projectfollowup',
+            name='id',
+            field=models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='projectfollowup', index=index)
+                for index in FOLLOWUP_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(ensure_followup_indexes, remove_followup_indexes),
+            ],
+        ),
+    ]
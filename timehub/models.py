@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User, Group
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
@@ -94,10 +94,11 @@ class Project(models.Model):
 
     @property
     def logged_hours(self):
-        """Calcula las horas imputadas (de timesheet) para este proyecto"""
-        return self.time_entries.filter(status='APPROVED').aggregate(
-            total=models.Sum('hours_decimal')
-        )['total'] or Decimal('0.00')
+        """Horas imputadas aprobadas, leídas del libro de horas (timehub.ledger)"""
+        try:
+            return self.hours_ledger.approved_hours
+        except ProjectHours.DoesNotExist:
+            return Decimal('0.00')
     
     @property
     def hours_percentage(self):
@@ -318,6 +319,15 @@ class TimeEntry(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        # El libro de horas del proyecto se actualiza en la misma transacción,
+        # con el aporte previo leído de la fila bloqueada (no del objeto en memoria)
+        from .ledger import apply_transition, contribution, stored_contribution
+        with transaction.atomic():
+            previous = stored_contribution(self)
+            super().save(*args, **kwargs)
+            apply_transition(previous, contribution(self))
+
     def __str__(self):
         return f"{self.user.username} - {self.project.code} - {self.local_date} ({self.hours_decimal}h)"
 
@@ -331,6 +341,33 @@ class TimeEntry(models.Model):
         ]
 
 
+class ProjectHours(models.Model):
+    """Total de horas aprobadas de un proyecto (mantenido por timehub.ledger)"""
+    project = models.OneToOneField(Project, on_delete=models.CASCADE, related_name='hours_ledger')
+    approved_hours = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    entry_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.project_id}: {self.approved_hours}h"
+
+
+class ProjectMonthHours(models.Model):
+    """Horas aprobadas de un proyecto en un mes (``month`` es el primer día)"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='monthly_hours')
+    month = models.DateField()
+    approved_hours = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    entry_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.project_id} {self.month:%Y-%m}: {self.approved_hours}h"
+
+    class Meta:
+        unique_together = ['project', 'month']
+        ordering = ['project', 'month']
+
+
 class LeaveType(models.Model):
     name = models.CharField(max_length=100)
     code = models.CharField(max_length=20, unique=True)
@@ -252,7 +252,7 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
         from .utils import get_holidays_in_range
         if obj.start_date and obj.end_date and obj.user:
             try:
-                user_profile = UserProfile.objects.get(user=obj.user)
+                user_profile = UserProfile.objects.select_related('country').get(user=obj.user)
                 if user_profile.country:
                     return get_holidays_in_range(
                         obj.start_date, obj.end_date, user_profile.country
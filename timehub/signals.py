@@ -0,0 +1,24 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import business_calendar
+from .ledger import apply_transition, stored_contribution
+from .models import Country, Holiday, TimeEntry
+
+
+@receiver(pre_delete, sender=TimeEntry)
+def remove_from_hours_ledger(sender, instance, **kwargs):
+    """Resta las horas de un registro aprobado que se borra (también en cascada)"""
+    # pre_delete corre dentro de la transacción del borrado: si otro proceso ya
+    # lo borró, la fila no existe y no se resta dos veces
+    apply_transition(stored_contribution(instance), None)
+
+
+@receiver([post_save, post_delete], sender=Holiday)
+@receiver([post_save, post_delete], sender=Country)
+def invalidate_business_calendar(sender, **kwargs):
+    """Los feriados y días laborables del país cambiaron: recalcular calendarios"""
+    business_calendar.invalidate()
+    # Otro hilo del proceso pudo reconstruir con los datos previos antes del commit
+    transaction.on_commit(business_calendar.invalidate)
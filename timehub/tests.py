@@ -1,3 +1,339 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import business_calendar
+from .ledger import reconcile
+from .models import (
+    Client, Country, Holiday, LeaveRequest, LeaveType, Project, ProjectFollowUp, ProjectMonthHours, TimeEntry,
+    UserProfile,
+)
+from .utils import get_business_days
+
+
+class ProjectSummaryQueryCountTests(TestCase):
+    """El resumen de proyectos no debe costar consultas por proyecto"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lead', password='test')
+        self.client_obj = Client.objects.create(name='ACME', code='ACME')
+
+    def create_projects(self, prefix, count):
+        for index in range(count):
+            project = Project.objects.create(
+                client=self.client_obj, name=f'{prefix} {index}', code=f'{prefix}-{index}',
+                leader=self.user, start_date=date(2024, 1, 1), approved_hours=Decimal('100.00'),
+            )
+            for offset, progress in enumerate([Decimal('40.00'), Decimal('30.00')]):
+                ProjectFollowUp.objects.create(
+                    project=project, follow_up_date=date(2024, 3, 1) - timedelta(days=offset * 7),
+                    progress_percentage=progress, observations='ok', logged_hours=Decimal('10.00'),
+                    hours_percentage=Decimal('90.00') - offset, created_by=self.user,
+                )
+            for day, status in ((1, 'APPROVED'), (2, 'APPROVED'), (3, 'DRAFT')):
+                TimeEntry.objects.create(
+                    user=self.user, project=project, local_date=date(2024, 2, day),
+                    hours_decimal=Decimal('8.00'), status=status,
+                )
+
+    def get_summary(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/timehub/v1/projects/summary/')
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(context.captured_queries)
+
+    def test_query_count_is_constant(self):
+        self.create_projects('S', 2)
+        _, small = self.get_summary()
+        self.create_projects('L', 20)
+        data, large = self.get_summary()
+        self.assertEqual(len(data), 22)
+        self.assertEqual(small, large)
+
+    def test_summary_values(self):
+        self.create_projects('P', 1)
+        data, _ = self.get_summary()
+        project = data[0]
+        self.assertEqual(project['follow_up_count'], 2)
+        self.assertEqual(project['logged_hours'], 16.0)
+        self.assertEqual(project['hours_percentage'], 16.0)
+        self.assertEqual(project['last_follow_up']['follow_up_date'], date(2024, 3, 1))
+        self.assertEqual(project['progress_trend'], 'IMPROVING')
+        self.assertEqual(project['hours_trend'], 'ON_BUDGET')
+
+
+class ProjectHoursLedgerTests(TestCase):
+    """El libro de horas sigue las transiciones de TimeEntry hacia y desde APPROVED"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='dev', password='test')
+        client = Client.objects.create(name='ACME', code='ACME')
+        self.project = Project.objects.create(client=client, name='Web', code='WEB', start_date=date(2024, 1, 1),
+                                              approved_hours=Decimal('40.00'))
+        self.other = Project.objects.create(client=client, name='App', code='APP', start_date=date(2024, 1, 1))
+
+    def ledger(self, project):
+        return Project.objects.get(pk=project.pk).logged_hours
+
+    def month(self, project, month):
+        row = ProjectMonthHours.objects.filter(project=project, month=month).first()
+        return row.approved_hours if row else Decimal('0.00')
+
+    def test_transitions_update_project_and_month_totals(self):
+        entry = TimeEntry.objects.create(user=self.user, project=self.project, local_date=date(2024, 2, 5),
+                                         hours_decimal=Decimal('8.00'), status='SUBMITTED')
+        self.assertEqual(self.ledger(self.project), Decimal('0.00'))
+
+        entry.status = 'APPROVED'
+        entry.save()
+        self.assertEqual(self.ledger(self.project), Decimal('8.00'))
+        self.assertEqual(Project.objects.get(pk=self.project.pk).hours_percentage, Decimal('20.00'))
+
+        # Editar un registro aprobado mueve horas entre meses y proyectos
+        entry = TimeEntry.objects.get(pk=entry.pk)
+        entry.hours_decimal = Decimal('6.00')
+        entry.local_date = date(2024, 3, 1)
+        entry.project = self.other
+        entry.save()
+        self.assertEqual(self.ledger(self.project), Decimal('0.00'))
+        self.assertEqual(self.ledger(self.other), Decimal('6.00'))
+        self.assertEqual(self.month(self.other, date(2024, 3, 1)), Decimal('6.00'))
+
+        entry.status = 'REJECTED'
+        entry.save()
+        self.assertEqual(self.ledger(self.other), Decimal('0.00'))
+
+        entry.status = 'APPROVED'
+        entry.save()
+        entry.delete()
+        self.assertEqual(self.ledger(self.other), Decimal('0.00'))
+        self.assertEqual(self.month(self.other, date(2024, 3, 1)), Decimal('0.00'))
+
+    def test_stale_instances_do_not_apply_twice(self):
+        entry = TimeEntry.objects.create(user=self.user, project=self.project, local_date=date(2024, 2, 5),
+                                         hours_decimal=Decimal('8.00'), status='SUBMITTED')
+        # Dos requests (approve y bulk_approve) cargaron el mismo registro antes de aprobarlo
+        first, second = TimeEntry.objects.get(pk=entry.pk), TimeEntry.objects.get(pk=entry.pk)
+        for stale in (first, second):
+            stale.status = 'APPROVED'
+            stale.save()
+        self.assertEqual(self.ledger(self.project), Decimal('8.00'))
+
+        first, second = TimeEntry.objects.get(pk=entry.pk), TimeEntry.objects.get(pk=entry.pk)
+        first.delete()
+        second.delete()
+        self.assertEqual(self.ledger(self.project), Decimal('0.00'))
+        self.assertEqual(reconcile(dry_run=True), [])
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        TimeEntry.objects.create(user=self.user, project=self.project, local_date=date(2024, 2, 5),
+                                 hours_decimal=Decimal('8.00'), status='APPROVED')
+        self.assertEqual(reconcile(), [])
+
+        # QuerySet.update no pasa por el libro
+        TimeEntry.objects.update(hours_decimal=Decimal('5.00'))
+        drift = reconcile(dry_run=True)
+        self.assertEqual({(row['month'], row['ledger_hours'], row['expected_hours']) for row in drift}, {
+            (None, Decimal('8.00'), Decimal('5.00')),
+            (date(2024, 2, 1), Decimal('8.00'), Decimal('5.00')),
+        })
+        self.assertEqual(self.ledger(self.project), Decimal('8.00'))
+
+        reconcile()
+        self.assertEqual(self.ledger(self.project), Decimal('5.00'))
+        self.assertEqual(reconcile(), [])
+
+
+class ProjectMetricsTests(TestCase):
+    """La serie de horas sale de una consulta agrupada, completada con ceros"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='ana', password='test')
+        self.other = User.objects.create_user(username='luis', password='test')
+        client = Client.objects.create(name='ACME', code='ACME')
+        self.project = Project.objects.create(client=client, name='Web', code='WEB', start_date=date(2024, 1, 1))
+        for user, day, hours in ((self.user, date(2024, 1, 8), '8.00'), (self.user, date(2024, 3, 4), '4.00'),
+                                 (self.other, date(2024, 3, 5), '2.00')):
+            TimeEntry.objects.create(user=user, project=self.project, local_date=day,
+                                     hours_decimal=Decimal(hours), status='APPROVED')
+
+    def get_metrics(self, **params):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f'/api/timehub/v1/projects/{self.project.pk}/metrics/', params)
+        return response, len(context.captured_queries)
+
+    def test_monthly_series_is_zero_filled(self):
+        response, _ = self.get_metrics(start='2024-01-01', end='2024-04-30')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['monthly_hours'], [
+            {'month': '2024-01', 'hours': 8.0}, {'month': '2024-02', 'hours': 0.0},
+            {'month': '2024-03', 'hours': 6.0}, {'month': '2024-04', 'hours': 0.0},
+        ])
+        self.assertEqual(response.data['approved_time_entries'], 3)
+
+    def test_quarter_granularity_with_user_breakdown(self):
+        response, _ = self.get_metrics(start='2024-01-01', end='2024-06-30', granularity='quarter', by_user='true')
+        self.assertEqual([row['hours'] for row in response.data['hours_series']], [14.0, 0.0])
+        self.assertEqual([(user['username'], user['hours']) for user in response.data['hours_by_user']],
+                         [('ana', 12.0), ('luis', 2.0)])
+
+    def test_series_is_cached_until_hours_change(self):
+        params = {'start': '2024-01-01', 'end': '2024-12-31', 'granularity': 'week'}
+        _, cold = self.get_metrics(**params)
+        _, warm = self.get_metrics(**params)
+        self.assertEqual(cold - warm, 1)
+
+        TimeEntry.objects.create(user=self.other, project=self.project, local_date=date(2024, 1, 9),
+                                 hours_decimal=Decimal('1.00'), status='APPROVED')
+        response, _ = self.get_metrics(**params)
+        self.assertEqual(response.data['hours_series'][1], {'period': '2024-W02', 'start': '2024-01-08', 'hours': 9.0})
+
+    def test_moving_an_entry_within_the_month_invalidates_the_series(self):
+        params = {'start': '2024-01-01', 'end': '2024-01-31', 'granularity': 'week', 'by_user': 'true'}
+        response, _ = self.get_metrics(**params)
+        self.assertEqual([row['hours'] for row in response.data['hours_series']], [0.0, 8.0, 0.0, 0.0, 0.0])
+
+        # Mismo proyecto, mes y horas: el aporte al libro no cambia
+        entry = TimeEntry.objects.get(local_date=date(2024, 1, 8))
+        entry.local_date = date(2024, 1, 22)
+        entry.user = self.other
+        entry.save()
+
+        response, _ = self.get_metrics(**params)
+        self.assertEqual([row['hours'] for row in response.data['hours_series']], [0.0, 0.0, 0.0, 8.0, 0.0])
+        self.assertEqual([(user['username'], user['hours']) for user in response.data['hours_by_user']],
+                         [('luis', 8.0)])
+
+    def test_invalid_granularity(self):
+        response, _ = self.get_metrics(granularity='day')
+        self.assertEqual(response.status_code, 400)
+
+
+class BusinessCalendarTests(TestCase):
+    """El calendario precalculado coincide con recorrer los días uno a uno"""
+
+    def setUp(self):
+        business_calendar.invalidate()
+        self.country = Country.objects.create(name='Perú', code='PER', work_days=[1, 2, 3, 4, 5, 6])
+        Holiday.objects.create(country=self.country, name='Navidad', date=date(2020, 12, 25), is_recurring=True)
+        Holiday.objects.create(country=self.country, name='Elecciones', date=date(2025, 1, 2))
+        Holiday.objects.create(country=self.country, name='Inactivo', date=date(2025, 1, 3), is_active=False)
+
+    def naive_count(self, start, end, holidays):
+        days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+        return sum(1 for day in days if day.isoweekday() <= 6 and day not in holidays)
+
+    def test_matches_day_by_day_count_across_years(self):
+        holidays = {date(2024, 12, 25), date(2025, 1, 2), date(2025, 12, 25)}
+        for start, end in ((date(2024, 12, 20), date(2025, 1, 10)), (date(2025, 1, 1), date(2025, 12, 31)),
+                           (date(2024, 3, 1), date(2025, 12, 26)), (date(2025, 1, 2), date(2025, 1, 2))):
+            self.assertEqual(get_business_days(start, end, self.country), self.naive_count(start, end, holidays))
+        self.assertEqual(get_business_days(date(2025, 1, 10), date(2025, 1, 1), self.country), 0)
+
+    def test_lookups_are_cached_and_invalidated_by_holiday_changes(self):
+        start, end = date(2025, 3, 3), date(2025, 3, 7)
+        self.assertEqual(get_business_days(start, end, self.country), 5)
+        with CaptureQueriesContext(connection) as context:
+            get_business_days(start, end, self.country)
+        self.assertEqual(len(context.captured_queries), 0)
+
+        Holiday.objects.create(country=self.country, name='Puente', date=date(2025, 3, 5))
+        self.assertEqual(get_business_days(start, end, self.country), 4)
+        self.assertEqual(business_calendar.get_year(self.country, 2025).day_type(date(2025, 3, 5)), 'holiday')
+
+        self.country.work_days = [1, 2, 3]
+        self.country.save()
+        self.assertEqual(get_business_days(start, end, self.country), 2)
+
+    def test_changes_from_another_process_are_picked_up(self):
+        start, end = date(2025, 3, 3), date(2025, 3, 7)
+        self.assertEqual(get_business_days(start, end, self.country), 5)
+
+        # Sin señal en este proceso (p. ej. el cambio se hizo en otro worker)
+        Holiday.objects.filter(name='Elecciones').update(date=date(2025, 3, 4), updated_at=timezone.now())
+        self.assertEqual(get_business_days(start, end, self.country), 5)
+        with override_settings(TIMEHUB_CALENDAR_CHECK_SECONDS=0):
+            self.assertEqual(get_business_days(start, end, self.country), 4)
+
+
+class LeaveCalendarTests(TestCase):
+    """El calendario de permisos combina la parte fija del año con las solicitudes"""
+
+    def setUp(self):
+        business_calendar.invalidate()
+        self.country = Country.objects.create(name='Chile', code='CHL', work_days=[1, 2, 3, 4, 5])
+        Holiday.objects.create(country=self.country, name='Navidad', date=date(2000, 12, 25), is_recurring=True)
+        self.vacation = LeaveType.objects.create(name='Vacaciones', code='VAC')
+        self.users = []
+        for index in range(3):
+            user = User.objects.create_user(username=f'dev{index}', password='test')
+            UserProfile.objects.create(user=user, country=self.country, department='IT')
+            self.users.append(user)
+
+    def request_leave(self, user, start, end, status):
+        return LeaveRequest.objects.create(user=user, leave_type=self.vacation, start_date=start, end_date=end,
+                                           days_requested=(end - start).days + 1, reason='-', status=status)
+
+    def get(self, path, **params):
+        client = APIClient()
+        client.force_authenticate(self.users[0])
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data, len(context.captured_queries)
+
+    def test_month_overlay(self):
+        user = self.users[0]
+        self.request_leave(user, date(2020, 11, 30), date(2020, 12, 2), 'APPROVED')
+        self.request_leave(user, date(2020, 12, 24), date(2021, 1, 5), 'SUBMITTED')
+        self.request_leave(user, date(2020, 12, 10), date(2020, 12, 10), 'REJECTED')
+        days, _ = self.get('/api/timehub/v1/leave-calendar/', year=2020, month=12)
+
+        self.assertEqual(len(days), 31)
+        by_date = {day['date']: day for day in days}
+        self.assertEqual([by_date[f'2020-12-0{n}']['status'] for n in (1, 2, 3)],
+                         ['consumed', 'consumed', 'available'])
+        self.assertEqual(by_date['2020-12-10']['status'], 'available')
+        self.assertEqual(by_date['2020-12-10']['leave_type'], 'Vacaciones')
+        christmas = by_date['2020-12-25']
+        self.assertEqual((christmas['day_type'], christmas['holiday_name'], christmas['status']),
+                         ('holiday', 'Navidad', 'pending'))
+        self.assertEqual((by_date['2020-12-26']['day_type'], by_date['2020-12-26']['is_weekend']),
+                         ('non_working', True))
+        self.assertEqual(by_date['2020-12-31']['status'], 'pending')
+
+    def test_future_approved_days(self):
+        self.request_leave(self.users[0], date(2099, 3, 2), date(2099, 3, 3), 'APPROVED')
+        days, _ = self.get('/api/timehub/v1/leave-calendar/', year=2099)
+        self.assertEqual(len(days), 365)
+        self.assertEqual(days[60]['date'], '2099-03-02')
+        self.assertEqual(days[60]['status'], 'approved_pending')
+
+    def test_team_calendar_query_count_is_constant(self):
+        self.request_leave(self.users[1], date(2020, 12, 7), date(2020, 12, 8), 'APPROVED')
+        self.get('/api/timehub/v1/leave-calendar/team/', year=2020)
+        small, small_queries = self.get('/api/timehub/v1/leave-calendar/team/', year=2020, month=12)
+
+        for index in range(3, 8):
+            user = User.objects.create_user(username=f'dev{index}', password='test')
+            UserProfile.objects.create(user=user, country=self.country, department='IT')
+            self.request_leave(user, date(2020, 12, 1), date(2020, 12, 4), 'SUBMITTED')
+        large, large_queries = self.get('/api/timehub/v1/leave-calendar/team/', year=2020, month=12)
+
+        self.assertEqual([member['username'] for member in small], ['dev0', 'dev1', 'dev2'])
+        self.assertEqual(len(large), 8)
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(small[1]['days'][6]['status'], 'consumed')
+        self.assertEqual(large[7]['days'][0]['status'], 'pending')
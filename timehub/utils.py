@@ -1,9 +1,10 @@
 """
 Utilidades para cálculos de vacaciones y días laborables
 """
-from datetime import date, timedelta
+from datetime import date
 from typing import List, Tuple
-from .models import Country, Holiday, UserProfile
+from . import business_calendar
+from .models import Country, UserProfile
 
 
 def get_business_days(start_date: date, end_date: date, country: Country) -> int:
@@ -22,32 +23,8 @@ def get_business_days(start_date: date, end_date: date, country: Country) -> int
     if start_date > end_date:
         return 0
     
-    business_days = 0
-    current_date = start_date
-    
-    # Obtener feriados del país en el rango de fechas
-    holidays = set(
-        Holiday.objects.filter(
-            country=country,
-            date__range=[start_date, end_date],
-            is_active=True
-        ).values_list('date', flat=True)
-    )
-    
-    # Días laborables del país (1=Lunes, 7=Domingo)
-    work_days = set(country.work_days) if country.work_days else {1, 2, 3, 4, 5}
-    
-    while current_date <= end_date:
-        # weekday() retorna 0=Lunes, 6=Domingo, necesitamos convertir a 1-7
-        day_of_week = current_date.weekday() + 1
-        
-        # Si es día laborable y no es feriado
-        if day_of_week in work_days and current_date not in holidays:
-            business_days += 1
-        
-        current_date += timedelta(days=1)
-    
-    return business_days
+    # Calendario precalculado por país y año (bitmap + sumas prefijas)
+    return business_calendar.business_days(start_date, end_date, country)
 
 
 def calculate_vacation_days_needed(start_date: date, end_date: date, user_id: int) -> Tuple[int, int]:
@@ -64,7 +41,7 @@ def calculate_vacation_days_needed(start_date: date, end_date: date, user_id: in
         Tuple con (días_calendario, días_laborables)
     """
     try:
-        user_profile = UserProfile.objects.get(user_id=user_id)
+        user_profile = UserProfile.objects.select_related('country').get(user_id=user_id)
         country = user_profile.country
     except UserProfile.DoesNotExist:
         # Default: contar todos los días como laborables
@@ -214,17 +191,4 @@ def get_holidays_in_range(start_date: date, end_date: date, country: Country) ->
     Returns:
         Lista de feriados en el rango
     """
-    holidays = Holiday.objects.filter(
-        country=country,
-        date__range=[start_date, end_date],
-        is_active=True
-    ).order_by('date')
-    
-    return [
-        {
-            'name': holiday.name,
-            'date': holiday.date,
-            'is_recurring': holiday.is_recurring
-        }
-        for holiday in holidays
-    ]
\ No newline at end of file
+    return business_calendar.holidays_between(start_date, end_date, country)
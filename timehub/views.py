@@ -5,6 +5,8 @@ from rest_framework.parsers import MultiPartParser, JSONParser
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.contrib.auth.models import User
 from django.db import transaction, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import (
@@ -13,6 +15,8 @@ from .models import (
     PortfolioSnapshot, PortfolioSnapshotRow, AllocationSnapshot,
     AllocationSnapshotCell, UserProfile, Holiday, AuditLog, Country, Role
 )
+from . import leave_calendar
+from .metrics import hours_series, parse_range
 from .serializers import (
     ClientSerializer, ProjectSerializer, ProjectFollowUpSerializer, ProjectSummarySerializer,
     AssignmentSerializer, PeriodSerializer, PeriodLockSerializer, TimeEntrySerializer,
@@ -48,7 +52,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_queryset(self):
-        queryset = Project.objects.select_related('client', 'client__country', 'leader')
+        queryset = Project.objects.select_related('client', 'client__country', 'leader', 'hours_ledger')
         is_active = self.request.query_params.get('is_active')
         client_id = self.request.query_params.get('client')
         
@@ -69,7 +73,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
         priority = request.query_params.get('priority')
         
         # Query base - solo proyectos que requieren seguimiento
-        queryset = Project.objects.select_related('client', 'client__country', 'leader').filter(
+        queryset = Project.objects.select_related('client', 'client__country', 'leader', 'hours_ledger').filter(
             requires_follow_up=True
         )
         
@@ -83,21 +87,42 @@ class ProjectViewSet(viewsets.ModelViewSet):
         if priority:
             queryset = queryset.filter(priority=priority)
         
+        # Seguimientos y conteo como subconsultas (las horas vienen del libro de horas):
+        # una sola consulta para todos los proyectos más una para los seguimientos referenciados
+        follow_ups = ProjectFollowUp.objects.filter(project=OuterRef('pk')).order_by('-follow_up_date', '-id')
+        queryset = queryset.annotate(
+            last_follow_up_id=Subquery(follow_ups.values('id')[:1]),
+            previous_follow_up_id=Subquery(follow_ups.values('id')[1:2]),
+            follow_up_count=Coalesce(Subquery(
+                ProjectFollowUp.objects.filter(project=OuterRef('pk')).order_by()
+                .values('project').annotate(total=Count('id')).values('total')
+            ), 0),
+        )
+        projects = list(queryset)
+        follow_up_ids = [
+            follow_up_id
+            for project in projects
+            for follow_up_id in (project.last_follow_up_id, project.previous_follow_up_id)
+            if follow_up_id
+        ]
+        follow_ups_by_id = ProjectFollowUp.objects.only(
+            'id', 'follow_up_date', 'status', 'progress_percentage', 'hours_percentage', 'observations'
+        ).in_bulk(follow_up_ids)
+        
         # Construir datos del resumen
         summary_data = []
-        for project in queryset:
+        for project in projects:
             # Obtener último seguimiento
-            last_follow_up = project.follow_ups.first()  # Ya ordenado por -follow_up_date
-            follow_up_count = project.follow_ups.count()
+            last_follow_up = follow_ups_by_id.get(project.last_follow_up_id)
+            previous_follow_up = follow_ups_by_id.get(project.previous_follow_up_id)
+            follow_up_count = project.follow_up_count
             
             # Calcular tendencias (comparar últimos dos seguimientos)
             progress_trend = None
             hours_trend = None
             
-            if follow_up_count >= 2:
-                follow_ups = list(project.follow_ups.all()[:2])
-                current_follow_up = follow_ups[0]
-                previous_follow_up = follow_ups[1]
+            if last_follow_up and previous_follow_up:
+                current_follow_up = last_follow_up
                 
                 # Tendencia de progreso
                 progress_diff = current_follow_up.progress_percentage - previous_follow_up.progress_percentage
@@ -109,7 +134,6 @@ class ProjectViewSet(viewsets.ModelViewSet):
                     progress_trend = 'STABLE'
                 
                 # Tendencia de horas
-                hours_diff = current_follow_up.hours_percentage - previous_follow_up.hours_percentage
                 if project.approved_hours:
                     if current_follow_up.hours_percentage <= 80:
                         hours_trend = 'UNDER_BUDGET'
@@ -118,29 +142,19 @@ class ProjectViewSet(viewsets.ModelViewSet):
                     else:
                         hours_trend = 'OVER_BUDGET'
             
-            # Calcular métricas con manejo de errores
-            try:
-                logged_hours = float(project.logged_hours)
-                hours_percentage = float(project.hours_percentage)
-            except Exception as e:
-                print(f"Error calculando horas para proyecto {project.id}: {e}")
-                logged_hours = 0.0
-                hours_percentage = 0.0
+            logged_hours = project.logged_hours
+            hours_percentage = project.hours_percentage
             
-            # Serializar último seguimiento con manejo de errores
+            # Serializar último seguimiento
             last_follow_up_data = None
             if last_follow_up:
-                try:
-                    last_follow_up_data = {
-                        'id': last_follow_up.id,
-                        'follow_up_date': last_follow_up.follow_up_date,
-                        'status': last_follow_up.status,
-                        'progress_percentage': float(last_follow_up.progress_percentage),
-                        'observations': last_follow_up.observations,
-                    }
-                except Exception as e:
-                    print(f"Error serializando follow-up {last_follow_up.id}: {e}")
-                    last_follow_up_data = None
+                last_follow_up_data = {
+                    'id': last_follow_up.id,
+                    'follow_up_date': last_follow_up.follow_up_date,
+                    'status': last_follow_up.status,
+                    'progress_percentage': float(last_follow_up.progress_percentage),
+                    'observations': last_follow_up.observations,
+                }
             
             summary_data.append({
                 'id': project.id,
@@ -155,8 +169,8 @@ class ProjectViewSet(viewsets.ModelViewSet):
                 'budget': float(project.budget) if project.budget else None,
                 'project_type': project.project_type,
                 'priority': project.priority,
-                'logged_hours': logged_hours,
-                'hours_percentage': hours_percentage,
+                'logged_hours': float(logged_hours),
+                'hours_percentage': float(hours_percentage),
                 'is_active': project.is_active,
                 'last_follow_up': last_follow_up_data,
                 'follow_up_count': follow_up_count,
@@ -169,51 +183,51 @@ class ProjectViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def metrics(self, request, pk=None):
-        """Endpoint para obtener métricas detalladas de un proyecto"""
+        """
+        Endpoint para obtener métricas detalladas de un proyecto.
+        Parámetros: start/end (YYYY-MM-DD, por defecto últimos 12 meses),
+        granularity (week, month o quarter) y by_user=true para el desglose por usuario.
+        """
         project = self.get_object()
         
-        # Calcular métricas adicionales
-        total_assignments = project.assignments.filter(is_active=True).count()
-        total_time_entries = project.time_entries.count()
-        approved_time_entries = project.time_entries.filter(status='APPROVED').count()
-        
-        # Horas por mes (últimos 12 meses)
-        from django.utils import timezone
-        from datetime import datetime, timedelta
-        
-        end_date = timezone.now().date()
-        start_date = end_date - timedelta(days=365)
-        
-        monthly_hours = []
-        current_date = start_date.replace(day=1)
+        try:
+            start_date, end_date = parse_range(
+                request.query_params.get('start'), request.query_params.get('end'), timezone.now().date()
+            )
+            granularity = request.query_params.get('granularity', 'month')
+            by_user = request.query_params.get('by_user', '').lower() == 'true'
+            hours = hours_series(project, start_date, end_date, granularity, by_user=by_user)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
-        while current_date <= end_date:
-            next_month = (current_date.replace(day=28) + timedelta(days=4)).replace(day=1)
-            month_hours = project.time_entries.filter(
-                status='APPROVED',
-                local_date__gte=current_date,
-                local_date__lt=next_month
-            ).aggregate(total=models.Sum('hours_decimal'))['total'] or 0
-            
-            monthly_hours.append({
-                'month': current_date.strftime('%Y-%m'),
-                'hours': float(month_hours)
-            })
-            current_date = next_month
+        # Calcular métricas adicionales (conteos de registros en una sola consulta)
+        total_assignments = project.assignments.filter(is_active=True).count()
+        entry_counts = project.time_entries.aggregate(
+            total=Count('id'), approved=Count('id', filter=models.Q(status='APPROVED'))
+        )
         
-        return Response({
+        data = {
             'project_id': project.id,
             'project_code': project.code,
             'project_name': project.name,
             'total_assignments': total_assignments,
-            'total_time_entries': total_time_entries,
-            'approved_time_entries': approved_time_entries,
+            'total_time_entries': entry_counts['total'],
+            'approved_time_entries': entry_counts['approved'],
             'logged_hours': float(project.logged_hours),
             'hours_percentage': float(project.hours_percentage),
             'approved_hours': float(project.approved_hours) if project.approved_hours else 0,
             'budget': float(project.budget) if project.budget else 0,
-            'monthly_hours': monthly_hours,
-        })
+            'start': start_date.isoformat(),
+            'end': end_date.isoformat(),
+            'granularity': granularity,
+            'hours_series': hours['series'],
+        }
+        if granularity == 'month':
+            # Formato original de la serie mensual
+            data['monthly_hours'] = [{'month': row['period'], 'hours': row['hours']} for row in hours['series']]
+        if by_user:
+            data['hours_by_user'] = hours['users']
+        return Response(data)
 
 
 class AssignmentViewSet(viewsets.ModelViewSet):
@@ -846,127 +860,70 @@ class LeaveBalanceViewSet(viewsets.ReadOnlyModelViewSet):
 class LeaveCalendarViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
     
+    def _period(self, request):
+        year = int(request.GET.get('year', timezone.localdate().year))
+        month = request.GET.get('month')  # Optional month filter
+        return leave_calendar.day_range(year, int(month) if month else None)
+
     def list(self, request):
         """Get leave calendar data for user and year with holidays and non-working days"""
-        user_id = request.GET.get('user')
-        year = int(request.GET.get('year', datetime.now().year))
-        month = request.GET.get('month')  # Optional month filter
-        
-        if not user_id:
-            user_id = request.user.id
-            
         try:
-            user_profile = UserProfile.objects.get(user_id=user_id)
-            country = user_profile.country
-        except UserProfile.DoesNotExist:
-            country = None
-            
-        # Get all leave requests for the year
-        leave_requests = LeaveRequest.objects.filter(
-            user_id=user_id,
-            start_date__year__lte=year,
-            end_date__year__gte=year
-        ).select_related('leave_type')
-        
-        calendar_days = []
-        
-        # Create a set of leave request dates for faster lookup
-        leave_dates = {}
-        for request in leave_requests:
-            start_date = max(request.start_date, datetime(year, 1, 1).date())
-            end_date = min(request.end_date, datetime(year, 12, 31).date())
-            
-            current_date = start_date
-            while current_date <= end_date:
-                status = 'available'
-                if request.status == 'APPROVED':
-                    if current_date < datetime.now().date():
-                        status = 'consumed'
-                    else:
-                        status = 'approved_pending'
-                elif request.status == 'SUBMITTED':
-                    status = 'pending'
-                
-                leave_dates[current_date.isoformat()] = {
-                    'status': status,
-                    'leave_request_id': request.id,
-                    'leave_type': request.leave_type.name
-                }
-                
-                current_date += timedelta(days=1)
-        
-        # Get holidays for the year/month
-        holidays_query = Holiday.objects.filter(
-            date__year=year,
-            is_active=True
-        )
-        
-        if country:
-            holidays_query = holidays_query.filter(country=country)
-        
-        if month:
-            holidays_query = holidays_query.filter(date__month=int(month))
-            
-        holidays = {holiday.date.isoformat(): holiday.name for holiday in holidays_query}
-        
-        # Determine date range to process
-        if month:
-            start_range = datetime(year, int(month), 1).date()
-            end_range = datetime(year, int(month) + 1, 1).date() - timedelta(days=1)
+            start_range, end_range = self._period(request)
+        except ValueError:
+            return Response({'error': 'year and month must be valid numbers'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.GET.get('user') or request.user.id
+        user_profile = UserProfile.objects.select_related('country').filter(user_id=user_id).first()
+        country = user_profile.country if user_profile else None
+
+        leaves = LeaveRequest.objects.filter(
+            user_id=user_id, start_date__lte=end_range, end_date__gte=start_range
+        ).select_related('leave_type').order_by('-created_at', '-id')
+
+        return Response(leave_calendar.build(country, leaves, start_range, end_range, timezone.localdate()))
+
+    @action(detail=False, methods=['get'])
+    def team(self, request):
+        """Leave calendars for a department (or a list of users) in one response"""
+        try:
+            start_range, end_range = self._period(request)
+            user_ids = [int(value) for value in request.GET.get('users', '').split(',') if value]
+        except ValueError:
+            return Response({'error': 'year, month and users must be valid numbers'},
+                          status=status.HTTP_400_BAD_REQUEST)
+
+        profiles = UserProfile.objects.filter(is_active=True).select_related('user', 'country')
+        department = request.GET.get('department')
+        if user_ids:
+            profiles = profiles.filter(user_id__in=user_ids)
         else:
-            start_range = datetime(year, 1, 1).date()
-            end_range = datetime(year, 12, 31).date()
-        
-        # Generate calendar data for the entire range
-        current_date = start_range
-        while current_date <= end_range:
-            date_str = current_date.isoformat()
-            
-            # Determine day type
-            day_type = 'working'
-            is_weekend = False
-            is_holiday = False
-            
-            if country and country.work_days:
-                # weekday() returns 0=Monday, 6=Sunday; we need 1=Monday, 7=Sunday
-                day_of_week = current_date.weekday() + 1
-                if day_of_week not in country.work_days:
-                    day_type = 'non_working'
-                    is_weekend = True
-            else:
-                # Default: weekends are Saturday (5) and Sunday (6) in weekday()
-                if current_date.weekday() in [5, 6]:
-                    day_type = 'non_working'
-                    is_weekend = True
-            
-            if date_str in holidays:
-                day_type = 'holiday'
-                is_holiday = True
-            
-            # Check if there's a leave request for this date
-            leave_info = leave_dates.get(date_str)
-            
-            calendar_entry = {
-                'date': date_str,
-                'day_type': day_type,
-                'is_weekend': is_weekend,
-                'is_holiday': is_holiday,
-                'holiday_name': holidays.get(date_str),
+            if not department:
+                own_profile = UserProfile.objects.filter(user=request.user).first()
+                department = own_profile.department if own_profile else ''
+            if not department:
+                return Response({'error': 'department or users is required'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            profiles = profiles.filter(department=department)
+        profiles = list(profiles.order_by('user__username'))
+
+        leaves = leave_calendar.leave_requests_by_user(
+            [profile.user_id for profile in profiles], start_range, end_range
+        )
+        today = timezone.localdate()
+
+        return Response([
+            {
+                'user_id': profile.user_id,
+                'username': profile.user.username,
+                'full_name': profile.user.get_full_name(),
+                'department': profile.department,
+                'days': leave_calendar.build(
+                    profile.country, leaves.get(profile.user_id, []), start_range, end_range, today
+                ),
             }
-            
-            if leave_info:
-                calendar_entry.update({
-                    'status': leave_info['status'],
-                    'leave_request_id': leave_info['leave_request_id'],
-                    'leave_type': leave_info['leave_type']
-                })
-            else:
-                calendar_entry['status'] = 'available'
-            
-            calendar_days.append(calendar_entry)
-            current_date += timedelta(days=1)
-        
-        return Response(calendar_days)
+            for profile in profiles
+        ])
 
 
 class ProjectAssignmentViewSet(viewsets.ReadOnlyModelViewSet):